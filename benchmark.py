@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark แบบ offline สำหรับ job_fetcher.py (ไม่ต้องมี credential ของ edoclite หรือ Google Sheet)
+
+- สร้าง HTML จำลองของแต่ละ tab (รวมกรณี tab=16 ที่ Job No สลับกับเรื่องที่แจ้ง และ archive ขนาดแสนแถว)
+- FakeWorksheet ในหน่วยความจำแทน gspread Worksheet และนับจำนวน API call
+- จับเวลา parse_row/parse_row_by_tab, ตัว parse หน้า (BeautifulSoup / stream) และ update_google_sheets
+  ที่หลายขนาดข้อมูล รายงาน rows/sec, peak memory (tracemalloc) และ API call ต่อรอบ
+
+ตัวอย่าง:
+    python benchmark.py                        # ขนาด 1000,10000,100000
+    python benchmark.py --sizes 500,5000 --json bench.json
+    python benchmark.py --write-fixtures fixtures/
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from html import escape
+
+import job_fetcher as jf
+
+TABS = (13, 14, 15, 16, 18, 7, 11, 20)
+INTERNAL_TABS = (18, 7, 11, 20)
+MEASURE_MEMORY = True  # ปิดได้ด้วย --no-memory (ไม่ต้องรันแต่ละกรณีซ้ำใต้ tracemalloc)
+HEADERS = ["ลำดับ", "Job No.", "เรื่องที่แจ้ง", "ศูนย์ที่แจ้ง", "ศูนย์ที่รับ", "ผู้แจ้ง", "วันที่แจ้ง", "สถานะ"]
+
+
+# ====== Fixtures ======
+def make_tab_rows(tab, n, seed=0, swap_ratio=0.1):
+    """cell ของ n แถวตามรูปแบบหน้า index?tab=N (คอลัมน์แรกคือลำดับ)"""
+    rnd = random.Random(f"{seed}-{tab}")
+    rows = []
+    for i in range(n):
+        if tab in INTERNAL_TABS:
+            job_no = f"บบลนป{tab:02d}{i:06d}"
+        else:
+            job_no = f"No{68 - i // 50000}-{tab:02d}{i:06d}"
+            if rnd.random() < 0.3:
+                job_no += f"/{rnd.randint(1, 9)}"  # เลขต่อท้ายที่ normalize_job_no ตัดทิ้ง
+        subject = f"เรื่องที่แจ้ง {i} เครื่องปรับอากาศชั้น {rnd.randint(1, 20)}"
+        cells = [str(i + 1), job_no, subject, f"ศูนย์ {rnd.randint(1, 12)}", f"ศูนย์ {rnd.randint(1, 12)}",
+                 f"ผู้แจ้ง {rnd.randint(1, 500)}", f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2568",
+                 "ดำเนินการ"]
+        if tab == 16 and rnd.random() < swap_ratio:
+            cells[1], cells[2] = cells[2], cells[1]  # เคสคอลัมน์ Job No/เรื่องที่แจ้ง สลับกัน
+        rows.append(cells)
+    return rows
+
+
+def rows_to_html(rows, extras=True):
+    """ห่อแถวเป็นหน้า HTML ที่มี thead, script และ entity แบบหน้าเว็บจริง"""
+    out = ["<!DOCTYPE html><html><head><title>jobManagement</title>",
+           "<script>var x = '<td>not a cell</td>';</script></head><body>",
+           '<table class="table"><thead><tr>']
+    out.extend(f"<th>{escape(h)}</th>" for h in HEADERS)
+    out.append("</tr></thead><tbody>")
+    for cells in rows:
+        out.append("<tr>")
+        for j, c in enumerate(cells):
+            if extras and j == 2:
+                out.append(f'<td><span class="subject">{escape(c)}</span></td>')
+            else:
+                out.append(f"<td>{escape(c)}</td>")
+        out.append("</tr>\n")
+    out.append("</tbody></table></body></html>")
+    return "".join(out)
+
+
+def make_tab_html(tab, n, seed=0):
+    return rows_to_html(make_tab_rows(tab, n, seed))
+
+
+def write_fixtures(directory, n, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    for tab in TABS:
+        path = os.path.join(directory, f"tab{tab}_{n}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_tab_html(tab, n, seed))
+        print(f"📝 Wrote {path}")
+
+
+# ====== Fake worksheet ======
+_A1_RANGE = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+def _col_index(letters):
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx
+
+
+class FakeWorksheet:
+    """
+    gspread Worksheet ในหน่วยความจำ (เฉพาะ method ที่ job_fetcher ใช้) + นับ API call ต่อ method
+    ค่าที่คืนมีรูปแบบเดียวกับ gspread (append_rows คืน updates.updatedRange)
+    """
+
+    def __init__(self, rows=None, title="ชีต1"):
+        self.title = title
+        self.rows = [list(r) for r in (rows or [])]
+        self.calls = Counter()
+
+    @property
+    def api_calls(self):
+        return sum(self.calls.values())
+
+    def get_all_values(self):
+        self.calls["get_all_values"] += 1
+        return [list(r) for r in self.rows]
+
+    def append_row(self, row, value_input_option=None, **kwargs):
+        self.calls["append_row"] += 1
+        self.rows.append(list(row))
+
+    def append_rows(self, rows, value_input_option=None, **kwargs):
+        self.calls["append_rows"] += 1
+        start = len(self.rows) + 1
+        self.rows.extend(list(r) for r in rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{start}:H{len(self.rows)}"}}
+
+    def _set(self, row_no, col_no, value):
+        while len(self.rows) < row_no:
+            self.rows.append([])
+        row = self.rows[row_no - 1]
+        while len(row) < col_no:
+            row.append("")
+        row[col_no - 1] = value
+
+    def update_cell(self, row, col, value):
+        self.calls["update_cell"] += 1
+        self._set(row, col, value)
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        self.calls["batch_update"] += 1
+        for item in data:
+            m = _A1_RANGE.match(item["range"].split("!")[-1])
+            self._set(int(m.group(2)), _col_index(m.group(1)), item["values"][0][0])
+
+    def _cell(self, row_no, col_no):
+        if row_no > len(self.rows):
+            return ""
+        row = self.rows[row_no - 1]
+        return row[col_no - 1] if len(row) >= col_no else ""
+
+    def batch_get(self, ranges, major_dimension=None, **kwargs):
+        self.calls["batch_get"] += 1
+        out = []
+        for rg in ranges:
+            m = _A1_RANGE.match(rg.split("!")[-1])
+            c0 = _col_index(m.group(1))
+            r0 = int(m.group(2) or 1)
+            c1 = _col_index(m.group(3)) if m.group(3) else c0
+            r1 = int(m.group(4) or (len(self.rows) if m.group(3) else r0))
+            if major_dimension == "COLUMNS" and c0 == c1:
+                block = [[self._cell(r, c0) for r in range(r0, r1 + 1)]]
+            else:
+                block = [[self._cell(r, c) for c in range(c0, c1 + 1)] for r in range(r0, r1 + 1)]
+            if major_dimension == "COLUMNS" and c0 != c1:
+                block = [list(col) for col in zip(*block)] if block else []
+            # gspread ตัดค่าว่างท้ายแถว/ท้ายคอลัมน์ทิ้ง
+            for line in block:
+                while line and line[-1] == "":
+                    line.pop()
+            while block and not block[-1]:
+                block.pop()
+            out.append(block)
+        return out
+
+
+class FakeSpreadsheet:
+    """
+    Spreadsheet ในหน่วยความจำที่ถือ FakeWorksheet หลายชีต (ให้ worksheet.spreadsheet / .id ใช้ได้)
+    batch_update รองรับเฉพาะ deleteDimension ของแถว และทำทีละ request ตามลำดับเหมือน API จริง
+    """
+
+    def __init__(self, *worksheets):
+        self.calls = Counter()
+        self.requests = []  # request ทั้งหมดที่ส่งผ่าน batch_update (ไว้ตรวจลำดับ)
+        self._worksheets = []
+        for ws in worksheets:
+            self._attach(ws)
+
+    def _attach(self, ws):
+        ws.spreadsheet = self
+        ws.id = len(self._worksheets)
+        self._worksheets.append(ws)
+        return ws
+
+    def worksheet(self, title):
+        return next(ws for ws in self._worksheets if ws.title == title)
+
+    def worksheets(self):
+        self.calls["worksheets"] += 1
+        return list(self._worksheets)
+
+    def add_worksheet(self, title, rows=1, cols=8, **kwargs):
+        self.calls["add_worksheet"] += 1
+        return self._attach(FakeWorksheet(title=title))
+
+    def values_batch_get(self, ranges, **kwargs):
+        self.calls["values_batch_get"] += 1
+        value_ranges = []
+        for rg in ranges:
+            title, a1 = rg.rsplit("!", 1)
+            (values,) = self.worksheet(title.strip("'")).batch_get([a1])
+            value_ranges.append({"range": rg, "values": values})
+        return {"valueRanges": value_ranges}
+
+    def batch_update(self, body):
+        self.calls["batch_update"] += 1
+        for request in body["requests"]:
+            rg = request["deleteDimension"]["range"]
+            ws = next(w for w in self._worksheets if w.id == rg["sheetId"])
+            del ws.rows[rg["startIndex"]:rg["endIndex"]]
+            self.requests.append(request)
+        return {}
+
+
+# ====== Measurement ======
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """ปิด print ของ job_fetcher ระหว่างวัด (print ทีละแถวจะกลบเวลาที่ต้องการวัด)"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(make_call, trace_memory=True):
+    """
+    คืน (ผลลัพธ์, วินาที, peak memory MB)
+    make_call() ต้องคืนฟังก์ชันไม่มีอาร์กิวเมนต์ชุดใหม่ทุกครั้ง: รอบแรกจับเวลาอย่างเดียว
+    รอบสองวัด peak ด้วย tracemalloc (tracemalloc ทำให้ช้าลงหลายเท่า จึงไม่จับเวลาพร้อมกัน)
+    """
+    call = make_call()
+    start = time.perf_counter()
+    result = call()
+    elapsed = time.perf_counter() - start
+    if not trace_memory:
+        return result, elapsed, 0.0
+    call = make_call()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def record(results, name, size, rows, elapsed, peak_mb, api_calls=None, **extra):
+    entry = {"name": name, "size": size, "rows": rows, "seconds": round(elapsed, 4),
+             "rows_per_sec": round(rows / elapsed) if elapsed > 0 else None,
+             "peak_mb": round(peak_mb, 2) if MEASURE_MEMORY else None, "api_calls": api_calls}
+    entry.update(extra)
+    results.append(entry)
+    calls = "" if api_calls is None else f"  api={api_calls}"
+    peak = f"{peak_mb:8.2f}MB" if MEASURE_MEMORY else "       -"
+    print(f"   {name:<36} {rows:>8} rows  {elapsed:8.3f}s  {entry['rows_per_sec'] or 0:>10} rows/s"
+          f"  peak={peak}{calls}")
+    return entry
+
+
+def bench_parse_rows(results, size, rows16, rows13):
+    def run_parse_row():
+        return [jf.parse_row(c) for c in rows13]
+
+    def run_parse_row_by_tab():
+        return [jf.parse_row_by_tab(c, 16) for c in rows16]
+
+    _, t, peak = measure(lambda: run_parse_row, MEASURE_MEMORY)
+    record(results, "parse_row (tab13)", size, len(rows13), t, peak)
+    parsed, t, peak = measure(lambda: run_parse_row_by_tab, MEASURE_MEMORY)
+    swapped = sum(1 for cells, p in zip(rows16, parsed) if p and p[0] != jf.clean_job_no_display(cells[1]))
+    record(results, "parse_row_by_tab (tab16)", size, len(rows16), t, peak, swapped_fixed=swapped)
+
+
+def bench_fetch_parsers(results, size, html16):
+    rows, t, peak = measure(lambda: lambda: jf.extract_rows_from_html(html16), MEASURE_MEMORY)
+    record(results, f"extract_rows_from_html ({jf._html_parser_name()})", size, len(rows), t, peak)
+
+    def run_stream(chunk=64 * 1024):
+        chunks = (html16[i:i + chunk] for i in range(0, len(html16), chunk))
+        return sum(1 for _ in jf.iter_rows_from_chunks(chunks))
+
+    # html16 อยู่ใน memory ก่อนเริ่มวัดแล้ว peak ที่ได้จึงเป็นของตัว parse เท่านั้น
+    count, t, peak = measure(lambda: run_stream, MEASURE_MEMORY)
+    record(results, "iter_rows_from_chunks (stream)", size, count, t, peak)
+
+
+def _sync_inputs(tab_rows):
+    """แปลงแถวจำลองเป็นอาร์กิวเมนต์ของ update_google_sheets แบบเดียวกับ main"""
+    def jobs(tab):
+        return [jf.parse_row_by_tab(c, tab) if tab == 16 else jf.parse_row(c) for c in tab_rows[tab]]
+    closed = {jf.parse_closed_job_no(c) for c in tab_rows[15]}
+    return dict(
+        new_jobs=jobs(13), closed_job_nos=closed, waiting_jobs=jobs(14), closed_jobs_full=jobs(15),
+        closed_already_jobs=jobs(16), internal_new_jobs=jobs(18) + jobs(7),
+        internal_closed_full=jobs(11), internal_closed_already=jobs(20),
+    )
+
+
+def bench_sync(results, size, tab_rows, state_dir):
+    inputs = _sync_inputs(tab_rows)
+    total = sum(len(v) for k, v in inputs.items() if k != "closed_job_nos")
+    state_path = os.path.join(state_dir, f"state_{size}.json")
+
+    def sync(sheet, state=None):
+        with quiet():
+            return jf.update_google_sheets(sheet, state=state, **inputs)
+
+    # แต่ละกรณีเริ่มจากชีตสำเนาใหม่ (รอบวัดเวลาและรอบวัด memory ต้องเห็นข้อมูลเท่ากัน)
+    sheets = []
+
+    def case(base_rows, use_state=False):
+        def make():
+            sheet = FakeWorksheet(base_rows)
+            sheets.append(sheet)
+            state = jf.StateStore.load(state_path) if use_state else None
+            return lambda: sync(sheet, state)
+        return make
+
+    res, t, peak = measure(case([]), MEASURE_MEMORY)
+    synced = sheets[0]
+    record(results, "update_google_sheets (empty sheet)", size, total, t, peak, sheets[0].api_calls,
+           added=res.get("new_added"), updated=res.get("updated"))
+
+    sheets.clear()
+    res, t, peak = measure(case(synced.rows), MEASURE_MEMORY)
+    record(results, "update_google_sheets (no changes)", size, total, t, peak, sheets[0].api_calls,
+           added=res.get("new_added"), updated=res.get("updated"))
+
+    # สร้างไฟล์ state ก่อน แล้ววัดรอบที่ใช้ state (อ่านแค่คอลัมน์ A)
+    sync(FakeWorksheet(synced.rows), jf.StateStore.load(state_path))
+    sheets.clear()
+    res, t, peak = measure(case(synced.rows, use_state=True), MEASURE_MEMORY)
+    record(results, "update_google_sheets (state file)", size, total, t, peak, sheets[0].api_calls,
+           added=res.get("new_added"), updated=res.get("updated"), skipped=res.get("skipped"))
+
+
+def run(sizes, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as state_dir:
+        for size in sizes:
+            print(f"📏 Size {size} rows per tab (tab16 = archive, ~10% swapped Job No/เรื่องที่แจ้ง)")
+            tab_rows = {tab: make_tab_rows(tab, size, seed) for tab in TABS}
+            bench_parse_rows(results, size, tab_rows[16], tab_rows[13])
+            html16 = rows_to_html(tab_rows[16])
+            bench_fetch_parsers(results, size, html16)
+            del html16
+            bench_sync(results, size, tab_rows, state_dir)
+    return results
+
+
+def check_stream_memory(results):
+    """memory ของตัว parse แบบ stream ต้องไม่โตตามจำนวนแถว (เทียบขนาดเล็กสุดกับใหญ่สุด)"""
+    stream = sorted((r for r in results if r["name"].startswith("iter_rows_from_chunks")), key=lambda r: r["size"])
+    if len(stream) < 2:
+        return True
+    small, large = stream[0], stream[-1]
+    ok = large["peak_mb"] <= max(small["peak_mb"] * 2, small["peak_mb"] + 1)
+    mark = "✅" if ok else "❌"
+    print(f"{mark} Stream parser peak memory: {small['peak_mb']}MB @ {small['size']} rows -> "
+          f"{large['peak_mb']}MB @ {large['size']} rows")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for job_fetcher (fixtures + fake worksheet)")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="จำนวนแถวต่อ tab คั่นด้วย comma (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed ของข้อมูลจำลอง (default: %(default)s)")
+    parser.add_argument("--no-memory", action="store_true", help="ไม่วัด peak memory (เร็วขึ้นประมาณครึ่งหนึ่ง)")
+    parser.add_argument("--json", help="เขียนผลเป็น JSON ลงไฟล์นี้ (ไว้เทียบหา regression)")
+    parser.add_argument("--write-fixtures", metavar="DIR",
+                        help="เขียน HTML จำลองของทุก tab ลง DIR (ใช้ขนาดแรกใน --sizes) แล้วจบ")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global MEASURE_MEMORY
+    args = parse_args(argv)
+    MEASURE_MEMORY = not args.no_memory
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    if args.write_fixtures:
+        write_fixtures(args.write_fixtures, sizes[0], args.seed)
+        return 0
+    print(f"🏁 job_fetcher benchmark (python {sys.version.split()[0]}, html parser: {jf._html_parser_name()})")
+    results = run(sizes, args.seed)
+    ok = check_stream_memory(results) if MEASURE_MEMORY else True
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"sizes": sizes, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Wrote {args.json}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
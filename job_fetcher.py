@@ -4,18 +4,22 @@
 import os
 import json
 import time
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-import gspread
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+# selenium / bs4 / requests / gspread / google-auth import ตอนใช้งานจริง (ในฟังก์ชัน)
+# เพื่อให้ `sync` ไม่ต้องโหลด selenium และ `fetch` ไม่ต้องโหลด gspread
 import shutil
 import subprocess
 import re
+import threading
+import queue
+import hashlib
+import bisect
+import base64
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from html.parser import HTMLParser
 
 # Configuration
 GOOGLE_SHEET_URL = os.getenv('GOOGLE_SHEET_URL')
@@ -23,51 +27,656 @@ GOOGLE_SHEET_NAME = os.getenv('GOOGLE_SHEET_NAME', 'ชีต1')
 USERNAME = os.getenv('USERNAME')
 PASSWORD = os.getenv('PASSWORD')
 
+# backend สำหรับดึงตาราง: "selenium" (เดิม) หรือ "http" (ใช้ Chrome แค่ตอน login แล้วดึงหน้า HTML ตรง ๆ)
+FETCH_BACKEND = os.getenv('FETCH_BACKEND', 'selenium').strip().lower()
+
+# อ่าน tab=16 (rowsPerPage=100000) แบบ stream แทนการโหลดทั้งตารางเข้า memory
+STREAM_TAB16 = os.getenv('STREAM_TAB16', '').strip().lower() in ('1', 'true', 'yes')
+
+# ดึง tab=16 ทีละหน้า (ใหม่สุดก่อน) แล้วหยุดเมื่อเจอหน้าที่มีแต่งานที่รู้จักแล้ว (0 = โหลดทั้งหมดแบบเดิม)
+TAB16_PAGE_SIZE = int(os.getenv('TAB16_PAGE_SIZE', '0'))
+TAB16_MAX_PAGES = int(os.getenv('TAB16_MAX_PAGES', '50'))
+PAGE_PARAM = os.getenv('PAGE_PARAM', 'page')  # ชื่อ query string ของเลขหน้า (เริ่มที่ 1)
+
+# โหมด pipeline: เปิดชีตไปพร้อมกับการดึง แล้ว reconcile/เขียนทีละแหล่งทันทีที่ tab ของแหล่งนั้นครบ
+PIPELINE = os.getenv('PIPELINE', '').strip().lower() in ('1', 'true', 'yes')
+
+# จำนวน worker สำหรับดึงหลาย tab พร้อมกัน (ใช้ได้เฉพาะ backend=http; selenium มี driver เดียวจึงดึงทีละหน้า)
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+
+BASE_URL = "https://jobm.edoclite.com/jobManagement/pages"
+
+# cache cookie หลัง login ไว้ข้ามรอบ (ตรวจด้วย request เดียว ถ้ายังใช้ได้ไม่ต้องกรอกฟอร์ม login ใหม่)
+SESSION_FILE = os.getenv('SESSION_FILE', 'jobm_session.json')
+SESSION_KEY = os.getenv('SESSION_KEY', '')          # ถ้าตั้งไว้จะเข้ารหัสไฟล์ (ต้องมีแพ็กเกจ cryptography)
+# บน GitHub Actions ไฟล์นี้ถูกอัปโหลดขึ้น actions cache -> ไม่มี SESSION_KEY = ไม่เขียน cookie แบบ plain text
+SESSION_REQUIRE_KEY = os.getenv('SESSION_REQUIRE_KEY', os.getenv('GITHUB_ACTIONS', 'false')).lower() == 'true'
+SESSION_MAX_AGE_HOURS = float(os.getenv('SESSION_MAX_AGE_HOURS', '12'))
+
+# โหมด daemon: poll ทุก POLL_INTERVAL_SEC วินาที (ยืดเป็น 2 เท่าทุกรอบที่ไม่มีอะไรเปลี่ยน จนถึง POLL_MAX_INTERVAL_SEC)
+# และทำงานเฉพาะเวลาทำการ (เดิมเช็กใน workflow: จ.-ศ. 08:00-17:00 เวลาไทย)
+POLL_INTERVAL_SEC = int(os.getenv('POLL_INTERVAL_SEC', '300'))
+POLL_MAX_INTERVAL_SEC = int(os.getenv('POLL_MAX_INTERVAL_SEC', '1800'))
+BUSINESS_TZ = os.getenv('BUSINESS_TZ', 'Asia/Bangkok')
+BUSINESS_HOURS = os.getenv('BUSINESS_HOURS', '8-17')   # ชั่วโมงเริ่ม-ชั่วโมงเลิก (ไม่รวมชั่วโมงเลิก)
+BUSINESS_DAYS = os.getenv('BUSINESS_DAYS', '1-5')      # ISO weekday: 1=จันทร์ ... 7=อาทิตย์
+
+# metrics ของแต่ละรอบ (เวลาแต่ละช่วง/tab + ตัวนับ) เป็น JSON และ Prometheus textfile (ถ้าตั้งไว้)
+METRICS_FILE = os.getenv('METRICS_FILE', 'jobm_metrics.json')
+METRICS_PROM_FILE = os.getenv('METRICS_PROM_FILE', '')
+
 JOBNO_PAT = re.compile(r"No\d+(?:-\d+)?", re.IGNORECASE)
 
+# โปรไฟล์ Chrome แบบเบาสำหรับดึงข้อมูล: page_load_strategy=eager + บล็อกรูป/ฟอนต์/CSS/สื่อ ผ่าน CDP
+SCRAPE_PROFILE = os.getenv('SCRAPE_PROFILE', '').strip().lower() in ('1', 'true', 'yes')
+SCRAPE_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav",
+]
+
+# จำคู่ chrome/chromedriver ที่ใช้ได้ล่าสุด รอบถัดไปเปิดตรงเลยโดยไม่ต้องลอง Selenium Manager ก่อน
+DRIVER_CACHE_FILE = os.getenv('DRIVER_CACHE_FILE', 'jobm_driver.json')
+
+# ====== Metrics ======
+class RunMetrics:
+    """
+    เวลาและตัวนับของการรันหนึ่งรอบ (เรียกจากหลาย thread ได้)
+    - phase(name)           : จับเวลาช่วงงาน (setup_driver, login, fetch_tabs, sync, flush ...) สะสมตามชื่อ
+    - tab(tab, sec, rows)   : เวลาโหลด + จำนวนแถวของแต่ละ tab
+    - count(name, n, label) : ตัวนับ เช่น webdriver_calls, http_requests, sheets_api_calls, rows_parsed
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now().isoformat(timespec="seconds")
+            self._t0 = time.perf_counter()
+            self.phases = {}
+            self.tabs = {}
+            self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def tab(self, tab, seconds, rows=None):
+        with self._lock:
+            entry = self.tabs.setdefault(str(tab), {"seconds": 0.0, "rows": 0})
+            entry["seconds"] += seconds
+            entry["rows"] += rows or 0
+
+    def count(self, name, n=1, label=""):
+        with self._lock:
+            by_label = self.counters.setdefault(name, {})
+            by_label[label] = by_label.get(label, 0) + n
+
+    def total(self, name):
+        return sum(self.counters.get(name, {}).values())
+
+    def sleep(self, seconds, reason=""):
+        """time.sleep ที่นับจำนวนครั้งและเวลารอไว้ใน metrics ด้วย"""
+        self.count("sleeps", 1, reason)
+        self.count("sleep_seconds", seconds, reason)
+        time.sleep(seconds)
+
+    def to_dict(self, **extra):
+        with self._lock:
+            data = {
+                "started_at": self.started_at,
+                "duration_seconds": round(time.perf_counter() - self._t0, 3),
+                "phases": {k: round(v, 3) for k, v in self.phases.items()},
+                "tabs": {k: {"seconds": round(v["seconds"], 3), "rows": v["rows"]} for k, v in self.tabs.items()},
+                "counters": {k: {"total": sum(v.values()), **{lbl: n for lbl, n in v.items() if lbl}}
+                             for k, v in self.counters.items()},
+            }
+        data.update(extra)
+        return data
+
+    def to_prometheus(self, data, prefix="jobm"):
+        """Prometheus textfile (สำหรับ node_exporter textfile collector)"""
+        lines = [f"{prefix}_run_timestamp_seconds {time.time():.0f}",
+                 f"{prefix}_run_duration_seconds {data['duration_seconds']}",
+                 f"{prefix}_run_success {0 if data.get('error') else 1}"]
+        lines += [f'{prefix}_phase_seconds{{phase="{k}"}} {v}' for k, v in data["phases"].items()]
+        lines += [f'{prefix}_tab_seconds{{tab="{k}"}} {v["seconds"]}' for k, v in data["tabs"].items()]
+        lines += [f'{prefix}_tab_rows{{tab="{k}"}} {v["rows"]}' for k, v in data["tabs"].items()]
+        for name, by_label in self.counters.items():
+            for label, n in by_label.items():
+                lines.append(f'{prefix}_{name}_total{{kind="{label}"}} {n}' if label else f"{prefix}_{name}_total {n}")
+        for key in ("new_added", "updated", "skipped", "archived", "notified"):
+            if isinstance((data.get("result") or {}).get(key), int):
+                lines.append(f"{prefix}_rows_{key} {data['result'][key]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, prom_path=None, **extra):
+        data = self.to_dict(**extra)
+        for target, text in ((path, lambda: json.dumps(data, ensure_ascii=False, indent=2)),
+                             (prom_path, lambda: self.to_prometheus(data))):
+            if not target:
+                continue
+            try:
+                tmp = f"{target}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text())
+                os.replace(tmp, target)
+            except OSError as e:
+                print(f"⚠️ Cannot write metrics to {target}: {e}")
+        return data
+
+METRICS = RunMetrics()
+
 def looks_like_jobno(text: str) -> bool:
     t = (text or "").strip()
     if not t:
         return False
-    # ถ้าขึ้นต้นด้วย 'บบลนป' ให้ถือว่าเป็น Job No ทันที
-    if t.startswith("บบลนป"):
+    # ถ้าขึ้นต้นด้วย prefix ของงานภายในศูนย์ (INTERNAL_JOB_PREFIX เช่น 'บบลนป') ให้ถือว่าเป็น Job No ทันที
+    if t.lower().startswith(INTERNAL_JOB_PREFIX.lower()):
         return True
     # หรือมีแพทเทิร์น No\d+(-\d+)? อยู่ในข้อความ
     return bool(JOBNO_PAT.search(t))
 
-def fetch_jobs_by_tab(driver, tab):
+# JS ที่ดึงทั้ง tbody กลับมาเป็น array 2 มิติของข้อความในแต่ละ cell ภายใน round trip เดียว
+# เลียนแบบ BeautifulSoup(...).get_text(strip=True): strip ทีละ text node แล้วต่อกันโดยไม่มีตัวคั่น
+TABLE_ROWS_JS = """
+const skip = new Set(["SCRIPT", "STYLE", "TEMPLATE"]);
+const cellText = (td) => {
+  const parts = [];
+  const walker = document.createTreeWalker(td, NodeFilter.SHOW_TEXT);
+  while (walker.nextNode()) {
+    const node = walker.currentNode;
+    if (node.parentElement && skip.has(node.parentElement.tagName)) continue;
+    const t = node.nodeValue.trim();
+    if (t) parts.push(t);
+  }
+  return parts.join("");
+};
+return Array.from(document.querySelectorAll("table tbody tr"),
+                  (tr) => Array.from(tr.querySelectorAll("td"), cellText));
+"""
+
+def extract_table_rows(driver):
     """
-    ดึงข้อมูลแถวงานจากหน้า index?tab=<tab>
-    - tab=16: โหลดทั้งหมดด้วย rowsPerPage=100000 และ (ถ้ามี) ใช้ parse_row_by_tab
-    คืนค่า list ของแต่ละงาน [col1..col7]
+    ดึงทุกแถวของ 'table tbody tr' เป็น list ของ list ข้อความ (รวมคอลัมน์ลำดับ) ด้วย execute_script ครั้งเดียว
+    จำนวน WebDriver call จึงไม่โตตามจำนวนแถว
     """
-    try:
-        tab_int = int(tab)
-        base = "https://jobm.edoclite.com/jobManagement/pages/index"
-        url = f"{base}?tab={tab_int}"
-        if tab_int == 16:
-            url += "&rowsPerPage=100000"  # โหลดทั้งหมด
-
-        print(f"📥 Fetching jobs from tab={tab_int} ...")
-        driver.get(url)
-
-        # หน้าข้อมูลเยอะให้รอนานขึ้นเฉพาะ tab=16
-        wait_sec = 60 if tab_int == 16 else 30
-        WebDriverWait(driver, wait_sec).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "table tbody tr"))
-        )
+    METRICS.count("webdriver_calls", label="execute_script")
+    rows = driver.execute_script(TABLE_ROWS_JS) or []
+    return [[(c or "").strip() for c in row] for row in rows]
 
-        rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
-        data = []
+def _html_parser_name():
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+def extract_rows_from_html(html):
+    """เหมือน extract_table_rows แต่ parse จาก HTML ที่ server render มา (ไม่ต้องมี DOM/JS)"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, _html_parser_name())
+    trs = soup.select("table tbody tr")
+    if not trs:
+        # HTML ดิบอาจไม่มี <tbody> (browser เป็นคนเติมให้เอง)
+        trs = [tr for tr in soup.select("table tr") if tr.find("td")]
+    return [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in trs]
+
+class TableRowParser(HTMLParser):
+    """
+    parser แบบ incremental (feed ทีละ chunk) สำหรับแถว <tr> ของตาราง
+    ให้ผลเหมือน extract_rows_from_html แต่ไม่สร้าง DOM ทั้งหน้า: แถวที่ปิดแล้วจะรอให้ดึงออกผ่าน pop_rows()
+    """
+    SKIP_TAGS = {"script", "style", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.table_depth = 0
+        self.in_thead = False
+        self.row = None       # cell ของแถวปัจจุบัน
+        self.parts = None     # ข้อความของ cell ปัจจุบัน
+        self.nested = 0       # ตารางซ้อนใน cell: ข้อความทั้งหมดรวมเข้า cell นอกสุด
+        self.skip_depth = 0
+        self.text = []        # text node ปัจจุบัน (อาจถูกตัดข้าม chunk)
+        self.done = []
+
+    def _flush_text(self):
+        if self.text:
+            t = "".join(self.text).strip()
+            self.text = []
+            if t and self.parts is not None and not self.skip_depth:
+                self.parts.append(t)
+
+    def _close_cell(self):
+        self._flush_text()
+        if self.parts is not None:
+            self.row.append("".join(self.parts))
+            self.parts = None
+            self.nested = 0
+
+    def _close_row(self):
+        self._close_cell()
+        if self.row:
+            self.done.append(self.row)
+        self.row = None
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == "table" and self.parts is not None:
+            self.nested += 1
+        elif tag == "table":
+            self.table_depth += 1
+        elif not self.table_depth or self.nested:
+            return
+        elif tag == "thead":
+            self.in_thead = True
+        elif tag == "tbody":
+            self.in_thead = False
+        elif tag == "tr" and not self.in_thead:
+            self._close_row()
+            self.row = []
+        elif tag == "td" and self.row is not None:
+            self._close_cell()
+            self.parts = []
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == "table" and self.nested:
+            self.nested -= 1
+        elif self.nested:
+            return
+        elif tag == "td":
+            self._close_cell()
+        elif tag == "tr":
+            self._close_row()
+        elif tag in ("thead", "tbody"):
+            self._close_row()
+            self.in_thead = False
+        elif tag == "table" and self.table_depth:
+            self._close_row()
+            self.table_depth -= 1
+
+    def handle_data(self, data):
+        if self.parts is not None and not self.skip_depth:
+            self.text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def pop_rows(self):
+        rows, self.done = self.done, []
+        return rows
+
+def iter_rows_from_chunks(chunks):
+    """
+    รับ HTML เป็นชิ้น ๆ (str) แล้ว yield cell ของแต่ละแถวทันทีที่แถวนั้นปิด — ใช้ memory คงที่
+    (ไม่ใช้ lxml เพราะ libxml2 เก็บ string ที่เคยเจอไว้ ทำให้ memory ยังโตตามจำนวนแถว)
+    """
+    parser = TableRowParser()
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            yield from parser.pop_rows()
+    parser.close()
+    parser._close_row()
+    yield from parser.pop_rows()
+
+class SessionExpiredError(RuntimeError):
+    """session ของ edoclite หมดอายุ/ถูก redirect กลับไปหน้า login"""
+
+class HttpTabClient:
+    """
+    ดึงหน้า index?tab=N ด้วย HTTP ตรง ๆ โดยใช้ cookie จาก Selenium หลัง login
+    ใช้ requests.Session (keep-alive + connection pool) แทนการ render หน้าใน Chrome
+    """
 
-        # ใช้ parser เฉพาะ tab=16 ถ้ามีให้ใช้, ไม่มีก็ใช้ตัวเดิม
-        use_parse_by_tab = (tab_int == 16) and ('parse_row_by_tab' in globals())
+    def __init__(self, cookies=None, user_agent=None, pool_size=8):
+        # requests.Session ไม่ได้การันตีว่า thread-safe จึงแยก session ต่อ thread (cookie ชุดเดียวกัน)
+        self.cookies = list(cookies or [])
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if self.user_agent:
+            session.headers["User-Agent"] = self.user_agent
+        for c in self.cookies:
+            session.cookies.set(c["name"], c["value"],
+                                domain=c.get("domain"), path=c.get("path", "/"))
+        return session
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._new_session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    @classmethod
+    def from_driver(cls, driver, **kwargs):
+        """สร้าง client จาก cookie ของ driver ที่ login แล้ว"""
+        try:
+            user_agent = driver.execute_script("return navigator.userAgent")
+        except Exception:
+            user_agent = None
+        return cls(cookies=driver.get_cookies(), user_agent=user_agent, **kwargs)
+
+    @staticmethod
+    def _count_request(resp):
+        METRICS.count("http_requests")
+        retries = getattr(getattr(resp, "raw", None), "retries", None)
+        if retries is not None and retries.history:
+            METRICS.count("retries", len(retries.history), "http")
+
+    def get_html(self, url, timeout=30):
+        resp = self.session.get(url, timeout=timeout)
+        self._count_request(resp)
+        resp.raise_for_status()
+        if "/login" in resp.url:
+            raise SessionExpiredError(f"Redirected to login while fetching {url}")
+        return resp.text
+
+    def load_table_rows(self, url, wait_sec=30):
+        return extract_rows_from_html(self.get_html(url, timeout=wait_sec))
+
+    def is_logged_in(self, url=None, timeout=10):
+        """เช็ก session ด้วย request เดียว: ดูแค่ว่าโดน redirect ไปหน้า login ไหม (ไม่อ่าน body)"""
+        import requests
+        try:
+            with self.session.get(url or f"{BASE_URL}/index?tab=13", timeout=timeout, stream=True) as resp:
+                self._count_request(resp)
+                return resp.ok and "/login" not in resp.url
+        except requests.RequestException as e:
+            print(f"⚠️ Session check failed: {e}")
+            return False
 
+    def iter_table_rows(self, url, wait_sec=30, chunk_size=64 * 1024):
+        """stream response แล้ว parse ทีละ chunk (ไม่เก็บ HTML ทั้งหน้าไว้ใน memory)"""
+        with self.session.get(url, timeout=wait_sec, stream=True) as resp:
+            self._count_request(resp)
+            resp.raise_for_status()
+            if "/login" in resp.url:
+                raise SessionExpiredError(f"Redirected to login while fetching {url}")
+            resp.encoding = resp.encoding or "utf-8"
+            yield from iter_rows_from_chunks(resp.iter_content(chunk_size=chunk_size, decode_unicode=True))
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+def _wait_for(driver, wait_sec, css=None, name=None, xpath=None):
+    """WebDriverWait จนกว่า element จะขึ้น (import selenium เฉพาะตอนใช้ driver จริง)"""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    locator = (By.CSS_SELECTOR, css) if css else (By.NAME, name) if name else (By.XPATH, xpath)
+    return WebDriverWait(driver, wait_sec).until(EC.presence_of_element_located(locator))
+
+def _check_not_login_page(driver, url):
+    """session ของ Selenium หมดอายุ = เว็บเด้งกลับหน้า login แทนที่จะแสดงตาราง"""
+    if "/login" in (driver.current_url or ""):
+        raise SessionExpiredError(f"Redirected to login while fetching {url}")
+
+def load_table_rows(driver, url, wait_sec=30):
+    """
+    เปิด url, รอให้ตารางขึ้น แล้วคืนค่า cell ทั้งหมดของตาราง
+    driver เป็นได้ทั้ง Selenium WebDriver หรือ HttpTabClient
+    """
+    if isinstance(driver, HttpTabClient):
+        return driver.load_table_rows(url, wait_sec)
+    METRICS.count("webdriver_calls", label="get")
+    driver.get(url)
+    _check_not_login_page(driver, url)
+    with METRICS.phase("table_wait"):
+        _wait_for(driver, wait_sec, css="table tbody tr")
+    return extract_table_rows(driver)
+
+# JS เดียวกับ TABLE_ROWS_JS แต่คืนเฉพาะแถวช่วง [arguments[0], arguments[1])
+TABLE_ROWS_SLICE_JS = TABLE_ROWS_JS.replace(
+    'document.querySelectorAll("table tbody tr")',
+    'Array.prototype.slice.call(document.querySelectorAll("table tbody tr"), arguments[0], arguments[1])')
+
+def iter_table_rows(driver, url, wait_sec=30, batch=2000):
+    """
+    แบบ generator ของ load_table_rows: yield cell ทีละแถวโดยไม่เก็บทั้งตารางไว้ในฝั่ง Python
+    - http     : stream HTML แล้ว parse ทีละ chunk
+    - selenium : ดึงทีละ batch แถวด้วย execute_script (จำนวน call = จำนวนแถว / batch)
+    """
+    if isinstance(driver, HttpTabClient):
+        yield from driver.iter_table_rows(url, wait_sec)
+        return
+    METRICS.count("webdriver_calls", label="get")
+    driver.get(url)
+    _check_not_login_page(driver, url)
+    with METRICS.phase("table_wait"):
+        _wait_for(driver, wait_sec, css="table tbody tr")
+    start = 0
+    while True:
+        METRICS.count("webdriver_calls", label="execute_script")
+        rows = driver.execute_script(TABLE_ROWS_SLICE_JS, start, start + batch) or []
         for row in rows:
-            parsed = parse_row_by_tab(row, tab_int) if use_parse_by_tab else parse_row(row)
+            yield [(c or "").strip() for c in row]
+        if len(rows) < batch:
+            return
+        start += batch
+
+def tab_url(tab):
+    url = f"{BASE_URL}/index?tab={int(tab)}"
+    if int(tab) == 16:
+        url += "&rowsPerPage=100000"  # โหลดทั้งหมด
+    return url
+
+def tab_wait_sec(tab):
+    # หน้าข้อมูลเยอะให้รอนานขึ้นเฉพาะ tab=16
+    return 60 if int(tab) == 16 else 30
+
+class TabCache:
+    """
+    cache ผลของแต่ละ tab ภายในการรันครั้งเดียว (key = tab id)
+    โหลด+แยก cell ครั้งเดียว แล้วแจกมุมมองที่คำนวณต่อจากชุดเดียวกัน:
+    - rows(tab)    : cell ดิบของทุกแถว
+    - jobs(tab)    : แถวที่ parse แล้ว [col1..col7] (ห้ามแก้ list ที่ได้ไป เพราะแชร์กันทุกผู้ใช้)
+    - job_nos(tab) : set ของ Job No ที่ normalize แล้ว (คอลัมน์ที่ 2)
+    ปลอดภัยต่อการเรียกจากหลาย thread: tab เดียวกันจะถูกโหลดแค่ครั้งเดียว
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._rows = {}
+        self._views = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.errors = {}   # tab -> exception ล่าสุด (ให้ผู้เรียกรู้ว่า session หมดอายุ แม้ตัวดึงจะกลืน error ไว้)
+
+    def record_error(self, tab, error):
+        self.errors[int(tab)] = error
+
+    def seed(self, tab, rows):
+        """ใส่ cell ดิบของ tab ที่ได้มาจากที่อื่น (เช่น snapshot ใน journal) แทนการโหลดใหม่"""
+        self._rows[int(tab)] = rows
+
+    def loaded(self):
+        """dict tab -> cell ดิบ ของ tab ที่โหลดสำเร็จแล้ว"""
+        return dict(self._rows)
+
+    @property
+    def session_expired(self):
+        return any(isinstance(e, SessionExpiredError) for e in self.errors.values())
+
+    def _tab_lock(self, tab):
+        with self._lock:
+            return self._locks.setdefault(tab, threading.Lock())
+
+    def rows(self, tab):
+        tab = int(tab)
+        if tab in self._rows:
+            return self._rows[tab]
+        with self._tab_lock(tab):
+            if tab not in self._rows:
+                if self.client is None:
+                    # cache ที่สร้างจาก snapshot: tab ที่ไม่มีในไฟล์ดึงเพิ่มไม่ได้
+                    error = RuntimeError(f"tab={tab} is not in the snapshot")
+                    self.record_error(tab, error)
+                    raise error
+                print(f"📥 Fetching jobs from tab={tab} ...")
+                start = time.perf_counter()
+                try:
+                    self._rows[tab] = load_table_rows(self.client, tab_url(tab), tab_wait_sec(tab))
+                except Exception as e:
+                    self.record_error(tab, e)
+                    raise
+                finally:
+                    rows = self._rows.get(tab)
+                    METRICS.tab(tab, time.perf_counter() - start, len(rows) if rows is not None else 0)
+        return self._rows[tab]
+
+    def _view(self, name, tab, build):
+        key = (name, int(tab))
+        if key not in self._views:
+            rows = self.rows(tab)
+            with self._lock:
+                if key not in self._views:
+                    self._views[key] = build(rows)
+        return self._views[key]
+
+    def jobs(self, tab):
+        tab = int(tab)
+
+        def build(rows):
+            data = []
+            for cells in rows:
+                parsed = parse_row_by_tab(cells, tab) if tab == 16 else parse_row(cells)
+                if parsed:
+                    data.append(parsed)
+            METRICS.count("rows_parsed", len(data), str(tab))
+            return data
+        return self._view("jobs", tab, build)
+
+    def job_nos(self, tab):
+        def build(rows):
+            return {j for j in (parse_closed_job_no(cells) for cells in rows) if j}
+        return self._view("job_nos", tab, build)
+
+    def fingerprint(self, *tabs):
+        """
+        hash ของ cell ดิบของ tab ที่โหลดแล้ว (หลาย tab = hash รวม) ใช้เทียบกับรอบก่อนโดยไม่ต้อง parse
+        คืน None ถ้ามี tab ที่ยังไม่ได้โหลดผ่าน cache (เช่น tab=16 แบบ stream/แบ่งหน้า หรือโหลดพัง)
+        """
+        digest = hashlib.sha1()
+        for tab in tabs:
+            rows = self._rows.get(int(tab))
+            if rows is None:
+                return None
+            digest.update(f"tab={int(tab)}\n".encode("utf-8"))
+            for cells in rows:
+                digest.update("\x1f".join(cells).encode("utf-8"))
+                digest.update(b"\x1e")
+        return digest.hexdigest()[:16]
+
+    def prefetch(self, tabs, workers=1):
+        """โหลดหลาย tab ล่วงหน้า (พร้อมกันถ้า workers > 1) คืน dict tab -> rows (None ถ้าพัง)"""
+        return run_fetch_tasks([(int(t), self.rows, (t,)) for t in tabs], workers=workers)
+
+def fetch_jobs_paginated(driver, tab, page_size, known, max_pages=TAB16_MAX_PAGES):
+    """
+    ดึง tab ทีละหน้า (หน้า 1 = งานล่าสุด) แล้วหยุดทันทีที่:
+    - หน้าเต็มแต่ Job No ทุกตัวอยู่ใน known แล้ว (ที่เหลือเป็นงานเก่าที่มีในชีตแล้ว)
+    - หน้าไม่เต็ม (หน้าสุดท้าย) หรือครบ max_pages
+    ปริมาณที่โหลดจึงขึ้นกับจำนวนงานที่เพิ่งปิด ไม่ใช่ขนาดของ archive
+    """
+    tab_int = int(tab)
+    client = driver.client if isinstance(driver, TabCache) else driver
+    data = []
+    try:
+        for page in range(1, max(1, max_pages) + 1):
+            url = f"{BASE_URL}/index?tab={tab_int}&rowsPerPage={page_size}&{PAGE_PARAM}={page}"
+            print(f"📥 Fetching tab={tab_int} page {page} (size {page_size}) ...")
+            start = time.perf_counter()
+            rows = load_table_rows(client, url, tab_wait_sec(tab_int))
+            METRICS.tab(tab_int, time.perf_counter() - start, len(rows))
+            parsed = [p for p in (parse_row_by_tab(c, tab_int) if tab_int == 16 else parse_row(c)
+                                  for c in rows) if p]
+            METRICS.count("rows_parsed", len(parsed), str(tab_int))
+            data.extend(parsed)
+            if len(rows) < page_size:
+                break
+            if all(normalize_job_no(fix_swapped_jobno(p)[0]) in known for p in parsed):
+                print(f"⏹️ tab={tab_int} page {page} has only known jobs; stopping early")
+                break
+    except Exception as e:
+        print(f"❌ Error fetching tab={tab} page: {e}")
+        if isinstance(driver, TabCache):
+            driver.record_error(tab_int, e)
+    print(f"📊 Found {len(data)} rows on tab={tab_int} (paginated)")
+    return data
+
+def iter_jobs_by_tab(driver, tab):
+    """
+    แบบ stream ของ fetch_jobs_by_tab: yield แถวที่ parse แล้วทีละแถว (ไม่ผ่าน TabCache)
+    ใช้กับ tab=16 ที่มีงานสะสมเป็นแสนแถว เพื่อให้ memory ไม่โตตามจำนวนแถว
+    """
+    tab_int = int(tab)
+    client = driver.client if isinstance(driver, TabCache) else driver
+    print(f"📥 Streaming jobs from tab={tab_int} ...")
+    count = 0
+    try:
+        for cells in iter_table_rows(client, tab_url(tab_int), tab_wait_sec(tab_int)):
+            parsed = parse_row_by_tab(cells, tab_int) if tab_int == 16 else parse_row(cells)
             if parsed:
-                data.append(parsed)
+                count += 1
+                yield parsed
+    except Exception as e:
+        print(f"❌ Error streaming tab={tab}: {e}")
+        if isinstance(driver, TabCache):
+            driver.record_error(tab_int, e)
+    METRICS.count("rows_parsed", count, str(tab_int))
+    METRICS.tab(tab_int, 0.0, count)  # เวลาของ tab แบบ stream รวมอยู่ใน phase "sync"
+    print(f"📊 Streamed {count} rows from tab={tab_int}")
+
+def as_tab_cache(driver):
+    """รับได้ทั้ง TabCache หรือ driver/client เปล่า ๆ (กรณีหลังจะได้ cache ใช้ครั้งเดียว)"""
+    return driver if isinstance(driver, TabCache) else TabCache(driver)
 
+def fetch_jobs_by_tab(driver, tab):
+    """
+    ดึงข้อมูลแถวงานจากหน้า index?tab=<tab>
+    - tab=16: โหลดทั้งหมดด้วย rowsPerPage=100000 และใช้ parse_row_by_tab
+    driver เป็น TabCache ได้ เพื่อไม่ให้โหลด tab เดิมซ้ำ
+    คืนค่า list ของแต่ละงาน [col1..col7]
+    """
+    try:
+        tab_int = int(tab)
+        data = as_tab_cache(driver).jobs(tab_int)
         print(f"📊 Found {len(data)} rows on tab={tab_int}")
         return data
     except Exception as e:
@@ -75,6 +684,7 @@ def fetch_jobs_by_tab(driver, tab):
         return []
 
 INTERNAL_CENTER = "ศูนย์บริหารงานบำรุงรักษากลาง"
+INTERNAL_JOB_PREFIX = "บบลนป"  # Job No ของงานภายในศูนย์ (tab=18,7,11,20 เก็บเฉพาะงานที่ขึ้นต้นแบบนี้)
 
 def adjust_internal_centers(job: list) -> list:
     """ใช้กับงานภายในศูนย์: บังคับให้ C=ศูนย์แจ้ง, D=ศูนย์ที่รับ = INTERNAL_CENTER"""
@@ -87,51 +697,33 @@ def adjust_internal_centers(job: list) -> list:
 
 
 
-def clean_html(cell):
+def parse_row(cells):
+    """cells = ข้อความทุกคอลัมน์ของแถว (จาก extract_table_rows) -> list 7 ช่อง (ข้ามคอลัมน์ลำดับ)"""
     try:
-        return BeautifulSoup(cell.get_attribute("innerHTML").strip(), "html.parser").get_text(strip=True)
-    except Exception as e:
-        print(f"⚠️ Error cleaning HTML: {e}")
-        return ""
-
-def parse_row(row):
-    try:
-        cols = row.find_elements(By.TAG_NAME, "td")
-        if len(cols) < 8:
+        if not cells or len(cells) < 8:
             return None
-        return [clean_html(cols[i]) for i in range(1, 8)]
+        return [cells[i] for i in range(1, 8)]
     except Exception as e:
         print(f"⚠️ Error parsing row: {e}")
         return None
         
-def parse_row_by_tab(row, tab: int):
+def parse_row_by_tab(cells, tab: int):
     """
     คืน list 7 ช่องเหมือน parse_row() แต่:
     - tab=16: ดักกรณีคอลัมน์ 'Job No.' กับ 'เรื่องที่แจ้ง' สลับกัน แล้วสลับกลับให้
-              ถ้าข้อความขึ้นต้นด้วย 'บบลนป' ให้ถือว่าเป็น Job No
+              ถ้าข้อความขึ้นต้นด้วย INTERNAL_JOB_PREFIX ('บบลนป') ให้ถือว่าเป็น Job No
               และทำความสะอาด Job No สำหรับ 'แสดง' (ตัดหลัง '/')
     """
-    cols = row.find_elements(By.TAG_NAME, "td")
-    if len(cols) < 8:
+    if not cells or len(cells) < 8:
         return None
 
     # ค่าดิบตามหน้าเว็บ (ข้ามคอลัมน์ลำดับ)
-    raw = [clean_html(cols[i]) for i in range(1, 8)]
+    raw = [cells[i] for i in range(1, 8)]
 
     if tab == 16:
-        # helper ภายในฟังก์ชันเพื่อแยกแยะว่า "คล้าย Job No" ไหม
-        def _looks_like_jobno(t: str) -> bool:
-            t = (t or "").strip()
-            if not t:
-                return False
-            # บางรายการขึ้นต้นด้วย 'บบลนป' ให้ถือว่าเป็น Job No ทันที
-            if t.startswith("บบลนป"):
-                return True
-            # รองรับ No68-0033 / No0065 ฯลฯ (มี/ไม่มีขีด)
-            return bool(re.search(r"No\d+(?:-\d+)?", t, flags=re.IGNORECASE))
-
-        has0 = _looks_like_jobno(raw[0])
-        has1 = _looks_like_jobno(raw[1])
+        # "คล้าย Job No" ไหม: ขึ้นต้นด้วย prefix งานภายในศูนย์ หรือ No68-0033 / No0065 ฯลฯ (มี/ไม่มีขีด)
+        has0 = looks_like_jobno(raw[0])
+        has1 = looks_like_jobno(raw[1])
 
         # ถ้า col0 ไม่ใช่ job แต่ col1 ใช่ -> สลับกลับ
         if (not has0) and has1:
@@ -144,6 +736,14 @@ def parse_row_by_tab(row, tab: int):
 
 
 
+def fix_swapped_jobno(job: list) -> list:
+    """ดักกรณี Job No กับ เรื่องที่แจ้งสลับกัน (tab=16) -> สลับกลับในที่ (เรียกซ้ำได้)"""
+    has0 = looks_like_jobno(job[0] or "")
+    has1 = looks_like_jobno(job[1] or "")
+    if (not has0) and has1:
+        job[0], job[1] = job[1], job[0]
+    return job
+
 def normalize_job_no(job_no: str) -> str:
     if not job_no:
         return ""
@@ -207,9 +807,121 @@ def _detect_chromedriver():
             return c
     return None
 
-def setup_driver():
+def _binary_version(path):
+    """ข้อความเวอร์ชันจาก `<path> --version` เช่น 'Google Chrome 129.0.6668.58' (None ถ้าอ่านไม่ได้)"""
+    if not path:
+        return None
+    try:
+        out = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=15)
+        return (out.stdout or out.stderr).strip() or None
+    except Exception:
+        return None
+
+def _major_version(text):
+    m = re.search(r"(\d+)\.\d+", text or "")
+    return m.group(1) if m else None
+
+def _file_signature(path):
+    """ขนาด+mtime ของไฟล์ ใช้ตรวจว่า binary ถูกอัปเดตไหมโดยไม่ต้องรัน --version ทุกครั้ง"""
+    try:
+        st = os.stat(path)
+        return f"{st.st_size}:{int(st.st_mtime)}"
+    except (OSError, TypeError):
+        return None
+
+class DriverCache:
+    """
+    คู่ chrome/chromedriver ที่เปิดได้ล่าสุด
+    {"chrome", "chrome_version", "chrome_sig", "chromedriver", "chromedriver_version", "chromedriver_sig", "env", "saved_at"}
+    ใช้ได้เมื่อไฟล์ยังเป็นตัวเดิม (ขนาด/mtime เท่าเดิม) หรือถ้าเปลี่ยน เวอร์ชันหลักของทั้งคู่ต้องยังตรงกัน
+    และ CHROME_BIN/CHROMEDRIVER ที่ตั้งไว้ตอนนี้ต้องเป็นค่าเดียวกับตอนบันทึก ("env")
+    """
+
+    def __init__(self, path, data=None):
+        self.path = path
+        self.data = data
+
+    @classmethod
+    def load(cls, path=DRIVER_CACHE_FILE):
+        if not path:
+            return cls(path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(path, json.load(f))
+        except FileNotFoundError:
+            return cls(path)
+        except Exception as e:
+            print(f"⚠️ Ignoring driver cache {path}: {e}")
+            return cls(path)
+
+    def usable(self):
+        """คืน (chrome, chromedriver) ถ้ายังใช้ได้ ไม่งั้น None"""
+        d = self.data or {}
+        chrome, driver = d.get("chrome"), d.get("chromedriver")
+        if not driver or not os.path.exists(driver) or (chrome and not os.path.exists(chrome)):
+            return None
+        # ถ้า workflow ชี้ไปที่ chrome/chromedriver ชุดอื่น (setup-chrome) ให้เชื่อ env
+        # เทียบกับค่า env ตอนบันทึก ไม่ใช่ path ที่ resolve แล้ว (Selenium Manager อาจเลือก driver คนละ path กับ env)
+        if self._env() != d.get("env"):
+            return None
+        if _file_signature(driver) != d.get("chromedriver_sig") or \
+                (chrome and _file_signature(chrome) != d.get("chrome_sig")):
+            chrome_version, driver_version = _binary_version(chrome), _binary_version(driver)
+            if chrome and _major_version(chrome_version) != _major_version(driver_version):
+                print(f"⚠️ Cached driver pair no longer matches ({chrome_version} / {driver_version})")
+                return None
+            self.save(chrome, driver, chrome_version, driver_version)
+        return chrome, driver
+
+    @staticmethod
+    def _env():
+        return {name: os.getenv(name, "") for name in ("CHROME_BIN", "CHROMEDRIVER")}
+
+    def save(self, chrome, driver, chrome_version=None, driver_version=None):
+        if not self.path or not driver:
+            return
+        self.data = {
+            "chrome": chrome,
+            "chrome_version": chrome_version or _binary_version(chrome),
+            "chrome_sig": _file_signature(chrome),
+            "chromedriver": driver,
+            "chromedriver_version": driver_version or _binary_version(driver),
+            "chromedriver_sig": _file_signature(driver),
+            "env": self._env(),
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        try:
+            tmp = f"{self.path}.{os.getpid()}.tmp"  # หลาย tenant อาจเขียนไฟล์นี้พร้อมกัน
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            print(f"💾 Cached driver pair: {self.data['chrome_version'] or chrome or 'default chrome'} / "
+                  f"{self.data['chromedriver_version'] or driver}")
+        except OSError as e:
+            print(f"⚠️ Cannot write driver cache {self.path}: {e}")
+
+    def invalidate(self):
+        self.data = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def apply_scrape_profile(driver):
+    """บล็อก resource ที่ไม่จำเป็นต่อการอ่านตาราง (ต้องเรียกหลังสร้าง driver เพราะใช้ CDP)"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": SCRAPE_BLOCKED_URLS})
+        print(f"🪶 Scrape profile: blocking {len(SCRAPE_BLOCKED_URLS)} resource patterns")
+    except Exception as e:
+        print(f"⚠️ Cannot apply CDP resource blocking: {e}")
+    return driver
+
+def setup_driver(scrape_profile=False):
     """Setup Chrome WebDriver with multi-fallback; prefer Selenium Manager"""
-    print("🔧 Setting up Chrome WebDriver...")
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
+    print("🔧 Setting up Chrome WebDriver..." + (" (scrape profile)" if scrape_profile else ""))
     options = Options()
     # headless เสถียรบน GHA
     options.add_argument("--headless=new")
@@ -222,12 +934,49 @@ def setup_driver():
     options.add_argument("--disable-background-timer-throttling")
     options.add_argument("--disable-renderer-backgrounding")
     options.add_argument("--disable-ipc-flooding-protection")
-    options.add_argument("--remote-debugging-port=9222")
+    # 0 = ให้ Chrome เลือก port ว่างเอง (หลาย tenant เปิด Chrome พร้อมกันได้โดยไม่ชน port เดียวกัน)
+    options.add_argument("--remote-debugging-port=0")
 
     # ไม่ปิด JavaScript/Images เพราะเว็บส่วนใหญ่ต้องใช้ในการ login/render
     # options.add_argument("--disable-images")  # ถ้าจำเป็นค่อยเปิด
     # options.add_argument("--disable-javascript")
 
+    if scrape_profile:
+        # ไม่รอ event "load" (รูป/ฟอนต์) แค่ DOMContentLoaded แล้วให้ WebDriverWait รอตารางเอง
+        options.page_load_strategy = "eager"
+        options.add_argument("--disable-background-networking")
+        options.add_argument("--disable-component-update")
+        options.add_argument("--disable-default-apps")
+        options.add_argument("--disable-sync")
+        options.add_argument("--no-first-run")
+
+    started = time.perf_counter()
+
+    def ready(driver, how, chrome=None):
+        elapsed = time.perf_counter() - started
+        print(f"⏱️ WebDriver ready in {elapsed:.2f}s ({how})")
+        METRICS.count("driver_starts", 1, how)
+        if how != "cache":
+            path = getattr(getattr(driver, "service", None), "path", None)
+            cache.save(chrome, path if path and os.path.exists(str(path)) else None)
+        return apply_scrape_profile(driver) if scrape_profile else driver
+
+    # 0) คู่ chrome/chromedriver ที่เคยเปิดได้ (ข้ามการ probe ทั้งหมด)
+    cache = DriverCache.load()
+    cached = cache.usable()
+    if cached:
+        chrome, chromedriver_path = cached
+        try:
+            print(f"🔄 Try cached driver: {chromedriver_path}")
+            if chrome:
+                options.binary_location = chrome
+            driver = webdriver.Chrome(service=Service(chromedriver_path), options=options)
+            driver.get("about:blank")
+            return ready(driver, "cache")
+        except Exception as e:
+            print(f"⚠️ Cached driver failed; probing again: {e}")
+            cache.invalidate()
+
     chrome_binary = _detect_chrome_binary()
     if chrome_binary:
         print(f"🔎 Detected Chrome binary: {chrome_binary}")
@@ -246,7 +995,7 @@ def setup_driver():
         driver = webdriver.Chrome(options=options)
         driver.get("about:blank")
         print("✅ Selenium Manager pathless driver OK")
-        return driver
+        return ready(driver, "selenium_manager", chrome_binary)
     except Exception as e:
         print(f"⚠️ Selenium Manager failed: {e}")
         last_error = e
@@ -262,19 +1011,20 @@ def setup_driver():
         driver = webdriver.Chrome(service=service, options=options)
         driver.get("about:blank")
         print("✅ Explicit chromedriver OK")
-        return driver
+        return ready(driver, "detected", chrome_binary)
     except Exception as e:
         print(f"❌ All driver setups failed. Last: {e}")
         raise last_error or e
 
 def login_to_system(driver):
+    from selenium.webdriver.common.by import By
     try:
         print("🔐 Logging in...")
         user = require_env("USERNAME")
         pwd  = require_env("PASSWORD")
 
-        driver.get("https://jobm.edoclite.com/jobManagement/pages/login")
-        WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.NAME, "username")))
+        driver.get(f"{BASE_URL}/login")
+        _wait_for(driver, 20, name="username")
 
         driver.find_element(By.NAME, "username").clear()
         driver.find_element(By.NAME, "username").send_keys(user)
@@ -283,63 +1033,246 @@ def login_to_system(driver):
         driver.find_element(By.NAME, "password").send_keys(pwd)
         driver.find_element(By.NAME, "password").submit()
 
-        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, "//a[contains(., 'งานใหม่')]")))
+        _wait_for(driver, 30, xpath="//a[contains(., 'งานใหม่')]")
         print("✅ Login successful")
         return True
     except Exception as e:
         print(f"❌ Login failed: {e}")
         return False
 
-def fetch_new_jobs(driver):
+# ====== Session cache ======
+def _session_cipher(key):
+    """Fernet จาก SESSION_KEY (รับได้ทั้ง Fernet key ตรง ๆ หรือ passphrase) หรือ None ถ้าไม่มี cryptography"""
     try:
-        print("📥 Fetching new jobs...")
-        driver.get("https://jobm.edoclite.com/jobManagement/pages/index?tab=13")
+        from cryptography.fernet import Fernet
+    except ImportError:
+        return None
+    try:
+        return Fernet(key.encode())
+    except (ValueError, TypeError):
+        return Fernet(base64.urlsafe_b64encode(hashlib.sha256(key.encode()).digest()))
 
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "table tbody tr"))
-        )
+class SessionCache:
+    """
+    เก็บ cookie + user agent หลัง login ลงไฟล์ (chmod 600, เข้ารหัสถ้ามี SESSION_KEY)
+    {"saved_at", "user_agent", "cookies": [...]}
+    require_key = ไฟล์ถูกส่งออกนอกเครื่อง (actions cache) ต้องเข้ารหัสเท่านั้น
+    """
 
-        rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
-        data = []
-        for row in rows:
-            parsed = parse_row(row)
-            if parsed:
-                data.append(parsed)
+    def __init__(self, path, key="", require_key=SESSION_REQUIRE_KEY):
+        self.path = path
+        self.key = key or ""
+        self.require_key = require_key
+        self.cipher = _session_cipher(self.key) if self.key else None
+
+    @property
+    def enabled(self):
+        # ตั้ง key แต่ไม่มี cryptography หรือต้องใช้ key แต่ไม่ได้ตั้ง -> ไม่เขียน cookie แบบ plain text
+        return bool(self.path) and (self.cipher is not None or not (self.key or self.require_key))
+
+    def load(self, max_age_hours=SESSION_MAX_AGE_HOURS):
+        """คืน (cookies, user_agent) หรือ None ถ้าไม่มี/หมดอายุ/อ่านไม่ได้"""
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            if self.cipher is not None:
+                raw = self.cipher.decrypt(raw)
+            data = json.loads(raw.decode("utf-8"))
+        except Exception as e:
+            print(f"⚠️ Ignoring session cache {self.path}: {e or type(e).__name__}")
+            return None
+        now = time.time()
+        if now - float(data.get("saved_at", 0)) > max_age_hours * 3600:
+            print("⌛ Cached session is too old")
+            return None
+        cookies = [c for c in data.get("cookies") or [] if not c.get("expiry") or c["expiry"] > now]
+        if not cookies:
+            return None
+        return cookies, data.get("user_agent")
+
+    def save(self, cookies, user_agent=None):
+        if not self.enabled:
+            if self.key:
+                print("⚠️ SESSION_KEY set but 'cryptography' is not installed; session not cached")
+            elif self.path and self.require_key:
+                print(f"⚠️ SESSION_KEY is not set; session not cached ({self.path} would be uploaded "
+                      "to the Actions cache as plain text)")
+                self.invalidate()  # ไม่ส่งไฟล์ plain text เก่า (ถ้ามี) กลับขึ้น cache อีก
+            return
+        raw = json.dumps({"saved_at": time.time(), "user_agent": user_agent, "cookies": list(cookies)},
+                         ensure_ascii=False).encode("utf-8")
+        if self.cipher is not None:
+            raw = self.cipher.encrypt(raw)
+        tmp = f"{self.path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+        print(f"🍪 Saved session cookies to {self.path}" +
+              (" (encrypted)" if self.cipher else " (plain text; set SESSION_KEY to encrypt)"))
+
+    def save_from_driver(self, driver):
+        try:
+            user_agent = driver.execute_script("return navigator.userAgent")
+        except Exception:
+            user_agent = None
+        self.save(driver.get_cookies(), user_agent)
+
+    def invalidate(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def restore_cached_session(session_cache, pool_size=8):
+    """ตรวจ cookie ที่ cache ไว้ด้วย request เดียว คืน HttpTabClient ที่ login แล้ว หรือ None"""
+    if session_cache is None:
+        return None
+    cached = session_cache.load()
+    if cached is None:
+        return None
+    cookies, user_agent = cached
+    client = HttpTabClient(cookies=cookies, user_agent=user_agent, pool_size=pool_size)
+    if client.is_logged_in():
+        print("🍪 Reusing cached session (login skipped)")
+        return client
+    print("🍪 Cached session expired; logging in again")
+    client.close()
+    session_cache.invalidate()
+    return None
+
+def apply_cookies_to_driver(driver, cookies):
+    """ใส่ cookie ที่ cache ไว้ให้ Selenium (ต้องเปิดหน้าในโดเมนเดียวกันก่อน add_cookie)"""
+    METRICS.count("webdriver_calls", label="get")
+    driver.get(f"{BASE_URL}/login")
+    for c in cookies:
+        cookie = {k: c[k] for k in ("name", "value", "path", "domain", "secure", "httpOnly", "expiry") if k in c}
+        try:
+            METRICS.count("webdriver_calls", label="add_cookie")
+            driver.add_cookie(cookie)
+        except Exception as e:
+            print(f"⚠️ Could not restore cookie {c.get('name')}: {e}")
+
+def table_page_renders(driver, tab=13, wait_sec=15):
+    """เช็กเร็ว ๆ ว่าหน้า index แสดง <table> ได้ (ใช้ยืนยันว่า scrape profile ไม่ทำหน้าเว็บพัง)"""
+    try:
+        METRICS.count("webdriver_calls", label="get")
+        driver.get(tab_url(tab))
+        _wait_for(driver, wait_sec, css="table")
+        return True
+    except Exception as e:
+        print(f"⚠️ Table page did not render: {e}")
+        return False
+
+def _login_with_profile(scrape_profile, check_table=False):
+    """เปิด Chrome + login; ถ้าใช้ scrape profile แล้ว login/หน้าตารางไม่ขึ้น ให้ถอยกลับไปใช้โปรไฟล์ปกติ"""
+    with METRICS.phase("setup_driver"):
+        driver = setup_driver(scrape_profile=scrape_profile)
+    with METRICS.phase("login"):
+        ok = login_to_system(driver)
+    if ok and scrape_profile and check_table:
+        ok = table_page_renders(driver)
+    if ok:
+        return driver
+    driver.quit()
+    if scrape_profile:
+        print("⚠️ Scrape profile broke login/table page; retrying with the full profile")
+        METRICS.count("scrape_profile_fallbacks")
+        return _login_with_profile(False)
+    raise Exception("Login failed")
+
+def open_fetch_client(backend, workers=1, session_cache=None, scrape_profile=False):
+    """
+    login แล้วคืน (driver, client) สำหรับดึงตาราง
+    - ลอง cookie ที่ cache ไว้ก่อน; backend=http ถ้ายังใช้ได้จะไม่เปิด Chrome เลย
+    - ไม่งั้น login ผ่านฟอร์มตามเดิมแล้ว cache cookie ไว้ให้รอบถัดไป
+    - scrape_profile: Chrome แบบเบา (ดู setup_driver) ถ้าหน้าไม่ขึ้นจะถอยกลับโปรไฟล์ปกติเอง
+    """
+    pool_size = max(workers, 1)
+    with METRICS.phase("session_check"):
+        client = restore_cached_session(session_cache, pool_size=pool_size)
+    if client is not None and backend == "http":
+        return None, client
+
+    if client is not None:
+        with METRICS.phase("setup_driver"):
+            driver = setup_driver(scrape_profile=scrape_profile)
+        apply_cookies_to_driver(driver, client.cookies)
+        client.close()
+        return driver, driver
+
+    # backend=http ใช้ Chrome แค่ login จึงเช็กแค่ login; selenium ต้องเช็กหน้าตารางด้วย
+    driver = _login_with_profile(scrape_profile, check_table=(backend != "http"))
+    if session_cache is not None:
+        try:
+            session_cache.save_from_driver(driver)
+        except Exception as e:
+            print(f"⚠️ Could not cache session: {e}")
 
+    if backend == "http":
+        # ใช้ Chrome แค่ login แล้วปิดทิ้งเลย เพื่อคืน memory ของ runner
+        client = HttpTabClient.from_driver(driver, pool_size=pool_size)
+        driver.quit()
+        print("🌐 Using HTTP backend with session cookies from Selenium")
+        return None, client
+    return driver, driver
+
+def fetch_new_jobs(driver):
+    try:
+        print("📥 Fetching new jobs...")
+        data = as_tab_cache(driver).jobs(13)
         print(f"📊 Found {len(data)} new jobs")
         return data
     except Exception as e:
         print(f"❌ Error fetching new jobs: {e}")
         return []
 
+def parse_closed_job_no(cells):
+    """tab=15: คืน Job No (normalize แล้ว) จากคอลัมน์ที่ 2 ของแถว หรือ "" ถ้าไม่มี"""
+    if not cells or len(cells) < 2:
+        return ""
+    return normalize_job_no(cells[1])
+
 def fetch_closed_jobs(driver):
     try:
         print("📦 Fetching closed jobs...")
-        driver.get("https://jobm.edoclite.com/jobManagement/pages/index?tab=15")
-
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "table tbody tr"))
-        )
-
-        rows = driver.find_elements(By.CSS_SELECTOR, "table tbody tr")
-        closed = set()
-        for row in rows:
-            try:
-                cols = row.find_elements(By.TAG_NAME, "td")
-                if len(cols) >= 2:
-                    job_no = normalize_job_no(clean_html(cols[1]))
-                    if job_no:
-                        closed.add(job_no)
-            except Exception as e:
-                print(f"⚠️ Error parsing closed row: {e}")
-                continue
-
+        closed = as_tab_cache(driver).job_nos(15)
         print(f"📊 Found {len(closed)} closed jobs")
         return closed
     except Exception as e:
         print(f"❌ Error fetching closed jobs: {e}")
         return set()
 
+def run_fetch_tasks(tasks, workers=1):
+    """
+    รันงานดึงข้อมูลหลายงานพร้อมกันด้วย thread pool ขนาดจำกัด
+    tasks: list ของ (key, func, args) -> คืน dict key -> ผลลัพธ์
+    ถ้างานใดพัง ผลของงานนั้นเป็น None แต่งานอื่นยังได้ผลครบ
+    """
+    results = {}
+    workers = max(1, min(int(workers or 1), len(tasks) or 1))
+    if workers == 1:
+        for key, func, args in tasks:
+            try:
+                results[key] = func(*args)
+            except Exception as e:
+                print(f"❌ Fetch task {key} failed: {e}")
+                results[key] = None
+        return results
+
+    print(f"⚡ Fetching {len(tasks)} tasks with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(func, *args): key for key, func, args in tasks}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                results[key] = fut.result()
+            except Exception as e:
+                print(f"❌ Fetch task {key} failed: {e}")
+                results[key] = None
+    return results
+
 def setup_google_sheets():
     """Connect to Google Sheets using a Service Account (modern auth)."""
     import re, json, pathlib, os
@@ -391,10 +1324,11 @@ def setup_google_sheets():
     print(f"📑 Worksheet: {sheet_name}")
 
     try:
+        METRICS.count("sheets_api_calls", 2, "open")  # open_by_key + worksheet
         sh = gc.open_by_key(key)
         ws = sh.worksheet(sheet_name)
         print("✅ Connected to Google Sheets")
-        return ws
+        return QuotaAwareSheet(ws)
     except SpreadsheetNotFound as e:
         print("❌ SpreadsheetNotFound:", e or "(no message)")
         raise RuntimeError(
@@ -458,238 +1392,1412 @@ def setup_google_sheets():
         raise
 
 
-def update_google_sheets(sheet, new_jobs, closed_job_nos,
-                         waiting_jobs=None, closed_jobs_full=None,
-                         closed_already_jobs=None,              # tab=16
-                         internal_new_jobs=None,                # tab=18,7  -> รอแจ้ง
-                         internal_closed_full=None,             # tab=11    -> ปิดงาน
-                         internal_closed_already=None):         # tab=20    -> งานที่ปิดแล้ว
-    """
-    เดิม:
-    - tab=13 : เพิ่ม 'รอแจ้ง' หรือ 'ปิดงาน' (ถ้าอยู่ใน closed_job_nos); ถ้าเจอแล้วอัปเดตเป็น 'ปิดงาน'
-    - tab=14 : เพิ่ม 'รอแจ้ง'
-    - tab=15 : เพิ่ม (C ว่าง + shift ขวา) เป็น 'ปิดงาน'; ถ้าเจอแล้วอัปเดตเป็น 'ปิดงาน'
-    - tab=16 : เพิ่ม (C ว่าง + shift ขวา) เป็น 'งานที่ปิดแล้ว'; ดักสลับ Job No/เรื่องที่แจ้ง
-
-    ใหม่ (งานภายในศูนย์):
-    - tab=18,7 : ถ้ายังไม่เจอ -> เพิ่ม พร้อมสถานะ 'รอแจ้ง' และบังคับ C,D = INTERNAL_CENTER
-    - tab=11   : ถ้ายังไม่เจอ -> เพิ่ม พร้อมสถานะ 'ปิดงาน'; ถ้าเจอแล้วและยังไม่ปิด -> อัปเดตเป็น 'ปิดงาน'
-    - tab=20   : ถ้ายังไม่เจอ -> เพิ่ม พร้อมสถานะ 'งานที่ปิดแล้ว'
-    """
-    waiting_jobs = waiting_jobs or []
-    closed_jobs_full = closed_jobs_full or []
-    closed_already_jobs = closed_already_jobs or []  # ⬅️ tab=16
-    internal_new_jobs = internal_new_jobs or []
-    internal_closed_full = internal_closed_full or []
-    internal_closed_already = internal_closed_already or []
+# ขนาด chunk ต่อ 1 API call (ให้อยู่ในขนาด request ที่ Sheets API รับได้สบาย ๆ)
+SHEETS_APPEND_CHUNK = int(os.getenv('SHEETS_APPEND_CHUNK', '500'))
+SHEETS_UPDATE_CHUNK = int(os.getenv('SHEETS_UPDATE_CHUNK', '500'))
+STATUS_COL = "H"
+
+# โควตา Sheets API (ต่อ user ต่อ project): อ่าน 60 / นาที, เขียน 60 / นาที
+SHEETS_READS_PER_MIN = int(os.getenv('SHEETS_READS_PER_MIN', '60'))
+SHEETS_WRITES_PER_MIN = int(os.getenv('SHEETS_WRITES_PER_MIN', '60'))
+SHEETS_MAX_RETRIES = int(os.getenv('SHEETS_MAX_RETRIES', '6'))
+SHEETS_BACKOFF_MAX = float(os.getenv('SHEETS_BACKOFF_MAX', '64'))
+SHEETS_FLUSH_PASSES = int(os.getenv('SHEETS_FLUSH_PASSES', '3'))  # จำนวนรอบที่ลองส่ง chunk ที่พังซ้ำ
+
+class TokenBucket:
+    """
+    จำกัดอัตราเรียก API ไม่ให้เกิน per_minute ในหน้าต่าง 60 วินาทีใด ๆ
+    burst (ความจุ) + เติม (per_minute - burst) ต่อนาที = per_minute พอดี
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = max(1, int(per_minute))
+        self.capacity = max(1, burst if burst is not None else self.per_minute // 4)
+        self.rate = max(self.per_minute - self.capacity, 1) / 60.0   # token ต่อวินาที
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, reason="sheets_quota"):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            METRICS.sleep(wait, reason)
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket ที่หลาย process ใช้ร่วมกัน (โหมดหลาย tenant: quota ของ service account เดียวกัน)
+    token/เวลาเติมล่าสุดอยู่ใน shared memory และล็อกด้วย lock ของ multiprocessing
+    ต้องส่งให้ process ลูกตอนสร้าง (Process args) เท่านั้น
+    """
 
+    def __init__(self, per_minute, burst=None, ctx=None):
+        import multiprocessing
+        ctx = ctx or multiprocessing.get_context("spawn")
+        self._tokens = ctx.Value("d", 0.0, lock=False)
+        self._updated = ctx.Value("d", 0.0, lock=False)
+        super().__init__(per_minute, burst)
+        self._lock = ctx.Lock()
+
+    @property
+    def tokens(self):
+        return self._tokens.value
+
+    @tokens.setter
+    def tokens(self, value):
+        self._tokens.value = value
+
+    @property
+    def updated(self):
+        return self._updated.value
+
+    @updated.setter
+    def updated(self, value):
+        self._updated.value = value
+
+# (read, write) bucket ที่ใช้ร่วมกันทุก process — ตั้งโดย run_tenant, None = แต่ละชีตมี bucket ของตัวเอง
+SHARED_SHEETS_BUCKETS = None
+
+def _retryable_status(error):
+    """HTTP status ที่ควรลองใหม่ (429 / 5xx) ของ error จาก gspread/requests หรือ None"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and (status == 429 or 500 <= status < 600):
+        return status
+    import requests
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 0  # เครือข่ายหลุด: ไม่รู้ว่าฝั่ง server ทำไปแล้วหรือยัง
+    return None
+
+def backoff_delay(attempt, base=1.0, cap=SHEETS_BACKOFF_MAX):
+    """exponential backoff แบบ full jitter: สุ่มในช่วง [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class QuotaAwareSheet:
+    """
+    ครอบ gspread Worksheet: ทุก call ผ่าน token bucket (แยกอ่าน/เขียน)
+    และลองใหม่ด้วย exponential backoff + jitter เมื่อเจอ 429/5xx
+    - append (ไม่ idempotent) ลองซ้ำเองเฉพาะ 429 ที่ server ปฏิเสธแน่นอน
+      กรณีอื่นโยน error ให้ SheetWriteBuffer ตรวจชีตก่อนส่งซ้ำ (กันแถวซ้ำ)
+    attribute อื่นส่งต่อให้ worksheet ตัวจริง
+    """
+    READ_METHODS = {"batch_get", "get_all_values", "get", "col_values", "row_values",
+                    "spreadsheet.worksheets", "spreadsheet.values_batch_get"}
+    NON_IDEMPOTENT = {"append_row", "append_rows", "spreadsheet.batch_update", "spreadsheet.add_worksheet"}
+
+    def __init__(self, worksheet, reads_per_min=SHEETS_READS_PER_MIN, writes_per_min=SHEETS_WRITES_PER_MIN,
+                 max_retries=SHEETS_MAX_RETRIES):
+        self.worksheet = worksheet
+        self.read_bucket, self.write_bucket = SHARED_SHEETS_BUCKETS or (TokenBucket(reads_per_min),
+                                                                        TokenBucket(writes_per_min))
+        self.max_retries = max_retries
+
+    def __getattr__(self, name):
+        attr = getattr(self.worksheet, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+        return call
+
+    def call_spreadsheet(self, name, *args, **kwargs):
+        """เรียก method ระดับ spreadsheet (worksheets, values_batch_get, batch_update, ...) ผ่าน quota/retry ชุดเดียวกัน"""
+        return self._call(f"spreadsheet.{name}", getattr(self.worksheet.spreadsheet, name), *args, **kwargs)
+
+    def _call(self, name, func, *args, **kwargs):
+        bucket = self.read_bucket if name in self.READ_METHODS else self.write_bucket
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                status = _retryable_status(e)
+                if status is None or attempt >= self.max_retries:
+                    raise
+                if name in self.NON_IDEMPOTENT and status != 429:
+                    raise
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+                delay = float(retry_after) if retry_after and str(retry_after).isdigit() \
+                    else backoff_delay(attempt)
+                attempt += 1
+                METRICS.count("retries", 1, "sheets")
+                print(f"⏳ Sheets {name} got {status or 'network error'}; retry {attempt}/{self.max_retries} "
+                      f"in {delay:.1f}s")
+                METRICS.sleep(delay, "sheets_backoff")
+
+class SheetWriteBuffer:
+    """
+    เก็บการเขียนชีตไว้ก่อน แล้ว flush เป็น batch:
+    - แถวใหม่ทั้งหมด -> append_rows (แบ่ง chunk)
+    - เปลี่ยนสถานะ    -> batch_update ของ A1 range คอลัมน์ H (แบ่ง chunk)
+    แทนการเรียก append_row/update_cell ทีละงานแล้ว sleep
+    """
+
+    def __init__(self, sheet, append_chunk=SHEETS_APPEND_CHUNK, update_chunk=SHEETS_UPDATE_CHUNK, journal=None):
+        self.sheet = sheet
+        self.append_chunk = max(1, append_chunk)
+        self.update_chunk = max(1, update_chunk)
+        self.journal = journal    # RunJournal: บันทึกแผนก่อนส่ง และ mark done ทีละ chunk
+        self.appends = []
+        self.append_job_nos = []  # job_no ของแต่ละแถวใน self.appends (None ถ้าไม่ระบุ)
+        self.updates = {}         # row number -> สถานะล่าสุด (เขียน cell เดิมซ้ำก็ส่งแค่ค่าสุดท้าย)
+        self.update_counts = {}   # row number -> จำนวนครั้งที่สั่ง update (ให้ยอดสรุปเท่าเดิม)
+        self.update_job_nos = {}  # row number -> job_no (ให้ journal upsert ตาม job_no ได้)
+        # ผลที่เขียนสำเร็จแล้ว (ใช้บันทึก state หลัง flush)
+        self.applied_appends = []  # (job_no, row_no หรือ None, แถวที่เขียน)
+        self.applied_updates = {}  # row number -> สถานะ
+        self.applied_job_nos = set()  # job_no ที่ถึงชีตแล้ว (ใช้เลือกการเปลี่ยนแปลงที่จะแจ้งเตือน)
+        self.failed = False
+
+    def append(self, row, job_no=None):
+        row = list(row)
+        self.appends.append(row)
+        self.append_job_nos.append(job_no)
+
+    def update_status(self, row_no, status, job_no=None):
+        self.updates[row_no] = status
+        self.update_counts[row_no] = self.update_counts.get(row_no, 0) + 1
+        if job_no is not None:
+            self.update_job_nos[row_no] = job_no
+
+    def _mark_done(self, ids):
+        if self.journal is not None:
+            self.journal.mark_done(ids)
+
+    def _record_plan(self):
+        if self.journal is None:
+            return
+        ops = [{"id": append_op_id(job_no, row), "op": "append", "job_no": job_no, "row": row}
+               for job_no, row in zip(self.append_job_nos, self.appends)]
+        ops += [{"id": status_op_id(row_no), "op": "status", "row_no": row_no,
+                 "job_no": self.update_job_nos.get(row_no), "status": status}
+                for row_no, status in sorted(self.updates.items())]
+        self.journal.record_plan(ops)
+
+    def _send_appends(self, chunks):
+        """ส่ง chunk ของ append (list ของ (job_no, row)) คืน (จำนวนที่สำเร็จ, chunk ที่พัง)"""
+        appended, failed = 0, []
+        for chunk in chunks:
+            rows = [row for _, row in chunk]
+            try:
+                METRICS.count("sheets_api_calls", label="append_rows")
+                res = self.sheet.append_rows(rows, value_input_option="USER_ENTERED")
+                appended += len(rows)
+                first_row = _first_row_of_append(res)
+                for k, (job_no, row) in enumerate(chunk):
+                    row_no = first_row + k if first_row else None
+                    self.applied_appends.append((job_no, row_no, row))
+                    self.applied_job_nos.add(job_no)
+                self._mark_done([append_op_id(job_no, row) for job_no, row in chunk])
+            except Exception as e:
+                print(f"❌ Error appending {len(rows)} rows: {e}")
+                failed.append(chunk)
+        return appended, failed
+
+    def _send_updates(self, chunks):
+        updated, failed = 0, []
+        for chunk in chunks:
+            data = [{"range": f"{STATUS_COL}{row_no}", "values": [[status]]} for row_no, status in chunk]
+            try:
+                METRICS.count("sheets_api_calls", label="batch_update")
+                self.sheet.batch_update(data, value_input_option="USER_ENTERED")
+                updated += sum(self.update_counts[row_no] for row_no, _ in chunk)
+                self.applied_updates.update(chunk)
+                self.applied_job_nos.update(self.update_job_nos.get(row_no) for row_no, _ in chunk)
+                self._mark_done([status_op_id(row_no) for row_no, _ in chunk])
+            except Exception as e:
+                print(f"❌ Error updating {len(chunk)} status cells: {e}")
+                failed.append(chunk)
+        return updated, failed
+
+    def _drop_already_appended(self, chunks):
+        """
+        ก่อนส่ง append ที่พังซ้ำ อ่านคอลัมน์ A หนึ่งครั้งแล้วตัดแถวที่ไปถึงชีตแล้ว
+        (request ที่ timeout/5xx อาจถูกเขียนไปแล้วจริง) เพื่อให้การลองซ้ำไม่สร้างแถวซ้ำ
+        """
+        try:
+            present = {normalize_job_no(v) for v in load_job_column(self.sheet)}
+        except Exception as e:
+            print(f"⚠️ Cannot verify failed appends; retrying as-is: {e}")
+            return chunks, 0
+        kept, landed = [], 0
+        for chunk in chunks:
+            rest = []
+            for job_no, row in chunk:
+                if normalize_job_no(str(row[0])) in present:
+                    self.applied_appends.append((job_no, None, row))  # ถึงชีตแล้วแต่ไม่รู้เลขแถว
+                    self.applied_job_nos.add(job_no)
+                    self._mark_done([append_op_id(job_no, row)])
+                    landed += 1
+                else:
+                    rest.append((job_no, row))
+            if rest:
+                kept.append(rest)
+        return kept, landed
+
+    def flush(self):
+        """
+        ส่งทุกอย่างที่ค้างอยู่ คืน (จำนวนแถวที่เพิ่ม, จำนวน update) เฉพาะที่สำเร็จ
+        chunk ที่พังเข้าคิวแล้วลองใหม่ได้อีก SHEETS_FLUSH_PASSES - 1 รอบ (รอแบบ backoff ระหว่างรอบ)
+        ที่ยังพังหลังจากนั้นจะแจ้ง Job No ไว้ และ state จะถูกล้าง -> รอบหน้าอ่านชีตเต็มแล้วเติมให้เอง
+        """
+        self._record_plan()
+        pending = list(zip(self.append_job_nos, self.appends))
+        append_queue = [pending[i:i + self.append_chunk] for i in range(0, len(pending), self.append_chunk)]
+        items = sorted(self.updates.items())
+        update_queue = [items[i:i + self.update_chunk] for i in range(0, len(items), self.update_chunk)]
+
+        appended = updated = 0
+        for attempt in range(max(1, SHEETS_FLUSH_PASSES)):
+            if attempt:
+                delay = backoff_delay(attempt + 1)
+                print(f"🔁 Retrying {sum(map(len, append_queue))} rows / {sum(map(len, update_queue))} "
+                      f"status cells in {delay:.1f}s (pass {attempt + 1}/{SHEETS_FLUSH_PASSES})")
+                METRICS.sleep(delay, "sheets_retry_queue")
+                if append_queue:
+                    append_queue, landed = self._drop_already_appended(append_queue)
+                    appended += landed
+            n, append_queue = self._send_appends(append_queue)
+            appended += n
+            n, update_queue = self._send_updates(update_queue)
+            updated += n
+            if not append_queue and not update_queue:
+                break
+
+        if append_queue or update_queue:
+            self.failed = True
+            lost = [job_no or str(row[0]) for chunk in append_queue for job_no, row in chunk]
+            print(f"❌ Could not write {len(lost)} rows and {sum(map(len, update_queue))} status cells after "
+                  f"{SHEETS_FLUSH_PASSES} passes; they will be retried next run: {', '.join(lost[:20])}"
+                  + (" ..." if len(lost) > 20 else ""))
+        if appended or updated:
+            print(f"🧾 Flushed to Google Sheets: {appended} appended, {updated} status updates")
+        self.appends = []
+        self.append_job_nos = []
+        self.updates = {}
+        self.update_counts = {}
+        self.update_job_nos = {}
+        return appended, updated
+
+def _first_row_of_append(res):
+    """อ่านเลขแถวแรกจาก response ของ append_rows (updates.updatedRange เช่น 'ชีต1'!A105:H110)"""
     try:
-        print("✏️ Updating Google Sheets...")
-        sheet_data = sheet.get_all_values()
-        if not sheet_data:
-            headers = ["Job No", "Column2", "Column3", "Column4", "Column5", "Column6", "Column7", "Status"]
-            sheet.append_row(headers)
-            sheet_data = [headers]
-
-        # ทำดัชนีข้อมูลเดิมในชีต (ใช้ compare แบบ normalize)
-        existing = set()
-        for row in sheet_data[1:]:
-            if row and len(row) > 0:
-                existing.add(normalize_job_no(row[0]))
-
-        new_added = 0
-        updated = 0
-
-        # ====== tab=13 ======
-        for job in new_jobs:
-            if not job or len(job) < 7:
-                continue
-            job_no = normalize_job_no(job[0])
-            status = "ปิดงาน" if job_no in closed_job_nos else "รอแจ้ง"
+        m = re.search(r"![A-Z]+(\d+)", res["updates"]["updatedRange"])
+        return int(m.group(1)) if m else None
+    except (TypeError, KeyError):
+        return None
 
-            if job_no not in existing:
-                try:
-                    sheet.append_row(job + [status], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab13): {job_no} -> {status}")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding job {job_no} from tab13: {e}")
-            elif status == "ปิดงาน":
-                try:
-                    for i, row in enumerate(sheet_data[1:], start=2):
-                        if row and len(row) > 0 and normalize_job_no(row[0]) == job_no:
-                            if len(row) < 8 or row[7] != "ปิดงาน":
-                                sheet.update_cell(i, 8, "ปิดงาน")
-                                print(f"🔒 Updated status (tab13 closed): {job_no}")
-                                updated += 1
-                                time.sleep(0.5)
-                            break
-                except Exception as e:
-                    print(f"❌ Error updating job {job_no} from tab13: {e}")
 
-        # ====== tab=14 ======
-        for job in waiting_jobs:
-            if not job or len(job) < 7:
+class SheetSnapshot:
+    """
+    ภาพชีตแบบคอลัมน์ เก็บเฉพาะคอลัมน์ที่ reconciler ใช้: A (Job No) และ H (Status)
+    job_nos[i] / statuses[i] คือค่าของแถวที่ i+1 (แถว 1 = header)
+    """
+    __slots__ = ("job_nos", "statuses")
+
+    def __init__(self, job_nos, statuses):
+        self.job_nos = job_nos
+        self.statuses = statuses
+
+    @property
+    def row_count(self):
+        return max(len(self.job_nos), len(self.statuses))
+
+    def job_no_at(self, row_no):
+        return self.job_nos[row_no - 1] if row_no <= len(self.job_nos) else ""
+
+    def status_at(self, row_no):
+        return self.statuses[row_no - 1] if row_no <= len(self.statuses) else ""
+
+def _column_values(value_range):
+    # batch_get แบบ major_dimension=COLUMNS คืน [[v1, v2, ...]] หรือ [] ถ้าคอลัมน์ว่าง
+    return [str(v) for v in value_range[0]] if value_range else []
+
+def load_sheet_snapshot(sheet):
+    """อ่านเฉพาะคอลัมน์ A และ H ใน batch read ครั้งเดียว แทน get_all_values()"""
+    METRICS.count("sheets_api_calls", label="batch_get")
+    job_col, status_col = sheet.batch_get(["A:A", f"{STATUS_COL}:{STATUS_COL}"], major_dimension="COLUMNS")
+    return SheetSnapshot(_column_values(job_col), _column_values(status_col))
+
+class SheetRow:
+    """ตำแหน่งและสถานะของ Job หนึ่งงานในชีต (row_no=None คือแถวที่เพิ่งสั่ง append ในรอบนี้)"""
+    __slots__ = ("row_no", "status")
+
+    def __init__(self, row_no, status):
+        self.row_no = row_no
+        self.status = status
+
+class SheetIndex:
+    """
+    ดัชนี job_no (normalize แล้ว) -> SheetRow สร้างจากข้อมูลชีตรอบเดียว
+    ใช้แทนการวนข้อมูลทั้งชีตทุกครั้งที่ต้องหาแถวเพื่อ update (O(1) ต่อ lookup)
+    - แถวเดิม: เก็บสถานะตามที่อ่านมาจากชีต
+    - แถวที่เพิ่ม append ในรอบนี้: add_pending() เพื่อให้รอบถัดไปของ reconcile เจอโดยไม่ต้อง scan ใหม่
+    """
+
+    def __init__(self):
+        self.rows = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        index = cls()
+        for i in range(2, snapshot.row_count + 1):
+            job_no = normalize_job_no(snapshot.job_no_at(i))
+            if job_no not in index.rows:  # ถ้าซ้ำ ใช้แถวแรกเหมือนเดิม
+                index.rows[job_no] = SheetRow(i, snapshot.status_at(i))
+        return index
+
+    def __contains__(self, job_no):
+        return job_no in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, job_no):
+        return self.rows.get(job_no)
+
+    def add_pending(self, job_no, status):
+        self.rows.setdefault(job_no, SheetRow(None, status))
+
+
+STATE_FILE = os.getenv('STATE_FILE', 'jobm_state.json')
+STATE_VERSION = 1
+
+def closed_since_path(state_path):
+    """jobm_state.json -> jobm_state.closed.json (ไฟล์วันที่เริ่มปิด แยกจาก state ที่ถูกล้างได้)"""
+    root, ext = os.path.splitext(state_path)
+    return f"{root}.closed{ext}"
+
+def column_checksum(values):
+    return hashlib.sha1("\n".join(values).encode("utf-8")).hexdigest()
+
+def observation_hash(source, job, extra=None):
+    """hash สั้น ๆ ของแถวที่เห็นใน tab หนึ่ง (รวมค่าที่มีผลต่อการตัดสินสถานะ)"""
+    payload = json.dumps([source, list(job[:7]), extra], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+class StateStore:
+    """
+    state ในเครื่องสำหรับ sync แบบส่วนต่าง (cache ไว้ข้ามรอบของ workflow ได้)
+    {"version", "row_count", "col_a_checksum",
+     "jobs": {job_no: [row_no, status, {source: observation_hash}]},
+     "fingerprints": {source: hash ของ tab ที่แหล่งนั้นใช้}}
+    ใช้ได้เฉพาะเมื่อจำนวนแถวและ checksum ของคอลัมน์ A ยังตรงกับชีต ไม่งั้นกลับไปอ่านชีตเต็ม
+    วันที่เริ่มปิดของงาน (ใช้ archive) อยู่อีกไฟล์ (closed_since_path) ที่ไม่ถูกลบตอน invalidate
+    """
+
+    def __init__(self, path, data=None, closed=None):
+        self.path = path
+        self.data = data
+        self.closed = closed or {}  # job_no -> วันที่ (YYYY-MM-DD) ที่เห็นเป็น 'งานที่ปิดแล้ว' ครั้งแรก
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != STATE_VERSION:
+                print(f"⚠️ State file {path} has another version; ignoring")
+                data = None
+        except FileNotFoundError:
+            data = None
+        except Exception as e:
+            print(f"⚠️ Cannot read state file {path}: {e}")
+            data = None
+        try:
+            with open(closed_since_path(path), encoding="utf-8") as f:
+                closed = json.load(f).get("closed_since") or {}
+        except FileNotFoundError:
+            closed = (data or {}).get("closed_since") or {}  # state รุ่นก่อนเก็บไว้ในไฟล์เดียวกัน
+        except Exception as e:
+            print(f"⚠️ Cannot read {closed_since_path(path)}: {e}")
+            closed = {}
+        return cls(path, data, closed)
+
+    def matches(self, job_col):
+        return bool(self.data) and self.data.get("row_count") == len(job_col) \
+            and self.data.get("col_a_checksum") == column_checksum(job_col)
+
+    def to_index(self):
+        index = SheetIndex()
+        for job_no, (row_no, status, _obs) in self.data["jobs"].items():
+            index.rows[job_no] = SheetRow(row_no, status)
+        return index
+
+    def job_nos_with_status(self, status):
+        return {j for j, entry in ((self.data or {}).get("jobs") or {}).items() if entry[1] == status}
+
+    def observations(self, job_no):
+        entry = (self.data or {}).get("jobs", {}).get(job_no)
+        return entry[2] if entry else {}
+
+    def fingerprints(self):
+        return dict((self.data or {}).get("fingerprints") or {})
+
+    def closed_since(self):
+        """job_no -> วันที่ (YYYY-MM-DD) ที่เห็นเป็น 'งานที่ปิดแล้ว' ครั้งแรก"""
+        return dict(self.closed)
+
+    def track_closed(self, statuses):
+        """
+        ต่อวันที่เริ่มปิดจากรอบก่อน: งานที่เพิ่งเห็นเป็น 'งานที่ปิดแล้ว' ได้วันนี้ งานที่ไม่ใช่แล้วถูกตัดออก
+        statuses ต้องครบทุกงานในชีต (ดัชนีทั้งชีต) ไม่งั้นวันที่ของงานที่ไม่อยู่ในนั้นจะหาย
+        """
+        today = archive_today().isoformat()
+        closed = {job_no: self.closed.get(job_no, today)
+                  for job_no, status in statuses.items() if status == "งานที่ปิดแล้ว"}
+        if closed != self.closed:
+            self.closed = closed
+            self._write_closed()
+
+    def _write_closed(self):
+        path = closed_since_path(self.path)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "closed_since": self.closed}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def save(self, job_col, index, writer, observed, keep_previous=True, fingerprints=None, carried=()):
+        """
+        บันทึกสภาพชีตหลัง flush สำเร็จ (สถานะล่าสุด + แถวที่ append + สิ่งที่เห็นรอบนี้)
+        carried = แหล่งที่ข้ามไปทั้งแหล่ง (fingerprint เดิม) -> เก็บ observation เดิมของแหล่งนั้นไว้
+        """
+        col = list(job_col)
+        jobs = {}
+        # วันที่เริ่มปิดไม่ขึ้นกับเลขแถว -> บันทึกก่อน แม้ state ส่วนที่เหลือจะต้องล้างด้านล่าง
+        statuses = {job_no: writer.applied_updates.get(entry.row_no, entry.status)
+                    for job_no, entry in index.rows.items() if entry.row_no is not None}
+        statuses.update((job_no, row[7] if len(row) >= 8 else "")
+                        for job_no, _row_no, row in writer.applied_appends if job_no is not None)
+        self.track_closed(statuses)
+        for job_no, entry in index.rows.items():
+            if entry.row_no is None:
                 continue
-            job_no = normalize_job_no(job[0])
-            if job_no not in existing:
-                try:
-                    sheet.append_row(job + ["รอแจ้ง"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab14): {job_no} -> รอแจ้ง")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding job {job_no} from tab14: {e}")
-                    
-        # ====== tab=15 ======
-        for job in closed_jobs_full:
-            if not job or len(job) < 7:
+            status = statuses[job_no]
+            # งานที่ไม่เห็นในรอบนี้ เก็บของเดิมไว้ (ถ้า state เดิมเชื่อถือได้)
+            previous = self.observations(job_no) if keep_previous else {}
+            seen = observed.get(job_no)
+            if seen:
+                obs = {src: h for src, h in previous.items() if src in carried}
+                obs.update(seen)
+            else:
+                obs = previous
+            jobs[job_no] = [entry.row_no, status, obs]
+        for job_no, row_no, row in writer.applied_appends:
+            if row_no is None:
+                # ไม่รู้ว่าแถวไปลงตรงไหน -> รอบหน้าอ่านชีตเต็มดีกว่าเดา
+                self.invalidate()
+                return
+            while len(col) < row_no:
+                col.append("")
+            col[row_no - 1] = str(row[0])
+            if job_no is not None and job_no not in jobs:
+                jobs[job_no] = [row_no, row[7] if len(row) >= 8 else "", observed.get(job_no, {})]
+
+        self.data = {
+            "version": STATE_VERSION,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "row_count": len(col),
+            "col_a_checksum": column_checksum(col),
+            "jobs": jobs,
+            "fingerprints": {k: v for k, v in (fingerprints or {}).items() if v},
+        }
+        self._write()
+        print(f"💾 Saved state for {len(jobs)} jobs to {self.path}")
+
+    def _write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def drop_rows(self, deleted, job_col):
+        """
+        แถวถูกลบออกจากชีต (archive): ตัดงานในแถวนั้นออก เลื่อนเลขแถวที่เหลือ แล้วตรวจกับคอลัมน์ A ที่อ่านใหม่
+        ถ้าไม่ตรง (มีคนแก้ชีตพร้อมกัน) ล้าง state ให้รอบหน้าอ่านชีตเต็ม
+        """
+        deleted = sorted(deleted)
+        gone = set(deleted)
+        moved = {job_no for job_no, (row_no, _status, _obs) in self.data["jobs"].items() if row_no in gone}
+        if moved & self.closed.keys():
+            self.closed = {j: d for j, d in self.closed.items() if j not in moved}
+            self._write_closed()
+        jobs = {}
+        for job_no, (row_no, status, obs) in self.data["jobs"].items():
+            if row_no in gone:
                 continue
-            job_no = normalize_job_no(job[0])
-            job_for_sheet = adjust_cols_for_sheet(job)  # ✅ ใช้เฉพาะ tab=15
+            new_row = row_no - bisect.bisect_left(deleted, row_no)
+            if new_row > len(job_col) or normalize_job_no(job_col[new_row - 1]) != job_no:
+                self.invalidate()
+                return
+            jobs[job_no] = [new_row, status, obs]
+        self.data.update(jobs=jobs, row_count=len(job_col), col_a_checksum=column_checksum(job_col))
+        self._write()
+
+    def invalidate(self):
+        # ไม่ลบไฟล์วันที่เริ่มปิด: รอบหน้าที่อ่านชีตเต็มยังนับวันต่อจากเดิมได้
+        self.data = None
+        try:
+            os.remove(self.path)
+            print(f"🗑️ Removed state file {self.path}; next run will read the sheet")
+        except FileNotFoundError:
+            pass
 
-            if job_no not in existing:
-                try:
-                    print("DEBUG (tab15) ->", job_for_sheet + ["ปิดงาน"])
-                    sheet.append_row(job_for_sheet + ["ปิดงาน"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab15): {job_no} -> ปิดงาน")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding job {job_no} from tab15: {e}")
-            else:
-                try:
-                    # หาแถวเดิมแล้วดูสถานะปัจจุบัน (คอลัมน์ที่ 8)
-                    for i, row in enumerate(sheet_data[1:], start=2):
-                        if row and len(row) > 0 and normalize_job_no(row[0]) == job_no:
-                            current_status = row[7] if len(row) >= 8 else ""
-
-                            # ถ้าเคยเป็น "แจ้งแล้ว" และกำลังจะเปลี่ยนเป็น "ปิดงาน"
-                            # ให้เปลี่ยนเป็น "ปิดงาน_รอแจ้ง" ก่อน เพื่อให้ GAS ไป stamp แจ้งปิดงาน
-                            new_status = "ปิดงาน_รอแจ้ง" if current_status == "แจ้งแล้ว ✅" else "ปิดงาน"
-
-                            if len(row) < 8 or row[7] != new_status:
-                                sheet.update_cell(i, 8, new_status)
-                                print(f"🔒 Updated status (tab15 exists): {job_no} -> {new_status}")
-                                updated += 1
-                                time.sleep(0.5)
-                            break
-                except Exception as e:
-                    print(f"❌ Error updating existing job {job_no} from tab15: {e}")
+def load_job_column(sheet):
+    METRICS.count("sheets_api_calls", label="batch_get")
+    (job_col,) = sheet.batch_get(["A:A"], major_dimension="COLUMNS")
+    return _column_values(job_col)
+
+def load_sheet_index(sheet, state=None):
+    """
+    คืน (SheetIndex, ค่าคอลัมน์ A, trusted)
+    - state ตรงกับชีต : อ่านแค่คอลัมน์ A เพื่อตรวจ แล้วใช้สถานะจาก state (trusted=True)
+    - ไม่มี/ไม่ตรง     : อ่าน A+H จากชีตแล้วสร้างดัชนีใหม่
+    """
+    if state is not None and state.data:
+        job_col = load_job_column(sheet)
+        if state.matches(job_col):
+            print(f"💾 State file matches sheet ({len(job_col)} rows); skipping full status read")
+            return state.to_index(), job_col, True
+        print("⚠️ State file out of sync with sheet; falling back to full read")
+    snapshot = load_sheet_snapshot(sheet)
+    if not snapshot.row_count:
+        headers = ["Job No", "Column2", "Column3", "Column4", "Column5", "Column6", "Column7", "Status"]
+        METRICS.count("sheets_api_calls", label="append_row")
+        sheet.append_row(headers)
+        snapshot = SheetSnapshot([headers[0]], [headers[7]])
+    return SheetIndex.from_snapshot(snapshot), snapshot.job_nos, False
+
+def known_closed_job_nos(sheet, state=None):
+    """Job No ที่อยู่ในชีตเป็น 'งานที่ปิดแล้ว' แล้ว (จาก state ถ้ามี ไม่งั้นอ่านคอลัมน์ A+H จากชีต) + งานที่ archive แล้ว"""
+    archived = SheetArchive.load(sheet).job_nos if ARCHIVE_AFTER_DAYS > 0 else set()
+    if state is not None and state.data:
+        return state.job_nos_with_status("งานที่ปิดแล้ว") | archived
+    snapshot = load_sheet_snapshot(sheet)
+    return {normalize_job_no(snapshot.job_no_at(i)) for i in range(2, snapshot.row_count + 1)
+            if snapshot.status_at(i) == "งานที่ปิดแล้ว"} | archived
+
+def refresh_statuses(sheet, index, job_nos, chunk=200):
+    """อ่านคอลัมน์ H เฉพาะแถวของ job_nos (O(จำนวนที่เปลี่ยน)) แล้วอัปเดตสถานะใน index"""
+    entries = [index.get(j) for j in job_nos]
+    entries = [e for e in entries if e is not None and e.row_no]
+    for start in range(0, len(entries), chunk):
+        part = entries[start:start + chunk]
+        METRICS.count("sheets_api_calls", label="batch_get")
+        values = sheet.batch_get([f"{STATUS_COL}{e.row_no}" for e in part])
+        for entry, vr in zip(part, values):
+            entry.status = str(vr[0][0]) if vr and vr[0] else ""
+
+
+# ====== Archive ======
+# ย้ายแถวที่เป็น 'งานที่ปิดแล้ว' นานกว่า ARCHIVE_AFTER_DAYS วันไปไว้ในชีต archive รายปี/รายเดือน
+# (เช่น 'ปิดแล้ว 2026' หรือ 'ปิดแล้ว 2026-10') ชีตหลักจึงไม่โตไปเรื่อย ๆ
+# แต่ละรอบอ่าน Job No ของชีต archive ทั้งหมดใน call เดียว เพื่อไม่ให้เพิ่มงานที่ย้ายไปแล้วกลับเข้ามาใหม่
+# "วันที่ปิด" คือวันแรกที่รอบ sync เห็นแถวเป็น 'งานที่ปิดแล้ว' (StateStore.closed_since) ไม่ใช่วันปิดจริงในระบบ:
+# - แถวที่ปิดอยู่แล้วตอนเริ่มเปิด archive นับวันจากวันนั้น และถูกย้ายไปชีตของปี/เดือนนั้น
+# - ไฟล์ jobm_state.closed.json ไม่ถูกลบเมื่อ state ถูกล้าง (เขียนพัง/archive พัง/ชีตไม่ตรง)
+#   ถ้าไฟล์หาย (เช่น actions cache หมดอายุ) ทุกแถวที่ปิดแล้วจะเริ่มนับใหม่ -> ย้ายช้าลง ไม่ใช่ย้ายผิด
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '0'))        # 0 = ปิด archive
+ARCHIVE_PERIOD = os.getenv('ARCHIVE_PERIOD', 'year').strip().lower()  # year | month
+ARCHIVE_SHEET_PREFIX = os.getenv('ARCHIVE_SHEET_PREFIX', 'ปิดแล้ว')
+ARCHIVE_MAX_ROWS = int(os.getenv('ARCHIVE_MAX_ROWS', '2000'))          # จำกัดจำนวนแถวที่ย้ายต่อรอบ
+
+def archive_today():
+    return datetime.now(ZoneInfo(BUSINESS_TZ)).date()
+
+def archive_sheet_name(closed_on, period=ARCHIVE_PERIOD, prefix=ARCHIVE_SHEET_PREFIX):
+    return f"{prefix} {closed_on:%Y-%m}" if period == "month" else f"{prefix} {closed_on:%Y}"
+
+def _spreadsheet_call(sheet, name, *args, **kwargs):
+    METRICS.count("sheets_api_calls", label=name)
+    if isinstance(sheet, QuotaAwareSheet):
+        return sheet.call_spreadsheet(name, *args, **kwargs)
+    return getattr(sheet.spreadsheet, name)(*args, **kwargs)
+
+def _delete_row_requests(sheet_id, rows):
+    """deleteDimension ของแถวที่ติดกันรวมเป็นช่วงเดียว เรียงจากล่างขึ้นบน (ลบแล้วเลขแถวด้านบนไม่เลื่อน)"""
+    requests, rows = [], sorted(set(rows), reverse=True)
+    i = 0
+    while i < len(rows):
+        end = start = rows[i]
+        while i + 1 < len(rows) and rows[i + 1] == start - 1:
+            i += 1
+            start = rows[i]
+        requests.append({"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS",
+                                                       "startIndex": start - 1, "endIndex": end}}})
+        i += 1
+    return requests
+
+class SheetArchive:
+    """
+    ชีต archive ที่มีอยู่ + Job No ที่ย้ายไปแล้ว (อ่านตอนเริ่ม sync: worksheets + values_batch_get = 2 calls)
+    - protect(index) : ใส่งานที่ archive แล้วลงดัชนีเป็น 'งานที่ปิดแล้ว' (ไม่ append ซ้ำ ไม่ update)
+    - run(...)       : ย้ายแถวที่ครบกำหนดแบบ bulk (อ่าน batch_get / append_rows ต่อชีต archive / ลบด้วย batch_update เดียว)
+    """
 
+    def __init__(self, worksheets=None, job_nos=None):
+        self.worksheets = worksheets or {}   # ชื่อ -> Worksheet
+        self.job_nos = job_nos or set()
+
+    @classmethod
+    def load(cls, sheet, prefix=ARCHIVE_SHEET_PREFIX):
+        worksheets = {ws.title: ws for ws in _spreadsheet_call(sheet, "worksheets")
+                      if ws.title.startswith(f"{prefix} ")}
+        job_nos = set()
+        if worksheets:
+            res = _spreadsheet_call(sheet, "values_batch_get", [f"'{name}'!A2:A" for name in worksheets])
+            for value_range in res.get("valueRanges", []):
+                job_nos.update(normalize_job_no(str(v[0])) for v in value_range.get("values", []) if v)
+            job_nos.discard("")
+        print(f"🗄️ {len(job_nos)} archived jobs in {len(worksheets)} archive sheets")
+        return cls(worksheets, job_nos)
+
+    def protect(self, index):
+        for job_no in self.job_nos:
+            # row_no=None: reconciler ถือว่ามีอยู่แล้ว จึงไม่ append และไม่ update สถานะ
+            index.rows.setdefault(job_no, SheetRow(None, "งานที่ปิดแล้ว"))
+
+    def due(self, state, days, today):
+        """(row_no, job_no, วันที่เริ่มปิด) ของแถวที่เป็น 'งานที่ปิดแล้ว' นานกว่า days วัน"""
+        jobs = (state.data or {}).get("jobs") or {}
+        due = []
+        for job_no, since in state.closed_since().items():
+            entry = jobs.get(job_no)
+            closed_on = datetime.strptime(since, "%Y-%m-%d").date()
+            if entry and entry[1] == "งานที่ปิดแล้ว" and (today - closed_on).days > days:
+                due.append((entry[0], job_no, closed_on))
+        return sorted(due)
+
+    def _worksheet(self, sheet, name, header):
+        ws = self.worksheets.get(name)
+        if ws is None:
+            print(f"🗄️ Creating archive sheet '{name}'")
+            ws = _spreadsheet_call(sheet, "add_worksheet", name, rows=1, cols=max(len(header), 8))
+            ws = self.worksheets[name] = QuotaAwareSheet(ws) if isinstance(sheet, QuotaAwareSheet) else ws
+            METRICS.count("sheets_api_calls", label="append_rows")
+            ws.append_rows([header], value_input_option="USER_ENTERED")
+        elif isinstance(sheet, QuotaAwareSheet) and not isinstance(ws, QuotaAwareSheet):
+            ws = self.worksheets[name] = QuotaAwareSheet(ws)
+        return ws
 
-        # ====== tab=16 (งานที่ปิดแล้ว) ======
-        # ดักกรณี Job No กับ เรื่องที่แจ้งสลับกัน -> สลับกลับ
-        
-        for job in closed_already_jobs:
-            if not job or len(job) < 7:
+    def run_after_sync(self, sheet, state, writer):
+        """ขั้น archive หลัง sync สำเร็จ (ต้องมี state เพราะวันที่เริ่มปิดเก็บอยู่ใน state) คืนจำนวนแถวที่ย้าย"""
+        if state is None or not state.data or writer.failed:
+            if state is None:
+                print("⚠️ ARCHIVE_AFTER_DAYS needs a state file (--state-file) to track closing dates; skipping archive")
+            return 0
+        try:
+            with METRICS.phase("archive"):
+                return self.run(sheet, state)
+        except Exception as e:
+            # ชีตอาจถูกแก้ไปบางส่วน -> ให้รอบหน้าอ่านชีตเต็ม
+            print(f"❌ Archive failed: {e}")
+            state.invalidate()
+            return 0
+
+    def run(self, sheet, state, days=ARCHIVE_AFTER_DAYS, period=ARCHIVE_PERIOD, max_rows=ARCHIVE_MAX_ROWS,
+            today=None):
+        """ย้ายแถวที่ครบกำหนดไปชีต archive แล้วลบออกจากชีตหลัก คืนจำนวนแถวที่ย้าย"""
+        due = self.due(state, days, today or archive_today())[:max(0, max_rows)]
+        if not due:
+            return 0
+        # อ่านทั้งแถวของแถวที่จะย้าย (+ header) แล้วตรวจว่ายังเป็นงานเดิม/สถานะเดิมอยู่
+        ranges = ["A1:H1"] + [f"A{row_no}:H{row_no}" for row_no, _, _ in due]
+        values = []
+        for start in range(0, len(ranges), 200):
+            METRICS.count("sheets_api_calls", label="batch_get")
+            values.extend(sheet.batch_get(ranges[start:start + 200]))
+        header = [str(v) for v in (values[0][0] if values[0] else [])]
+        by_sheet, rows_to_delete, skipped = {}, [], 0
+        for (row_no, job_no, closed_on), value_range in zip(due, values[1:]):
+            row = [str(v) for v in (value_range[0] if value_range else [])]
+            row += [""] * (8 - len(row))
+            if normalize_job_no(row[0]) != job_no or row[7] != "งานที่ปิดแล้ว":
+                skipped += 1
                 continue
+            rows_to_delete.append(row_no)
+            if job_no not in self.job_nos:  # รอบก่อนย้ายไปแล้วแต่ลบไม่สำเร็จ -> ลบอย่างเดียว
+                by_sheet.setdefault(archive_sheet_name(closed_on, period), []).append(row)
+        if skipped:
+            print(f"⚠️ {skipped} archive candidates changed in the sheet; leaving them for the next run")
+        if not rows_to_delete:
+            return 0
+
+        # 1) เขียนลงชีต archive ก่อน แล้ว 2) ค่อยลบจากชีตหลัก (ถ้าพังกลางทาง งานยังอยู่อย่างน้อยหนึ่งที่)
+        for name, rows in sorted(by_sheet.items()):
+            METRICS.count("sheets_api_calls", label="append_rows")
+            self._worksheet(sheet, name, header).append_rows(rows, value_input_option="USER_ENTERED")
+            self.job_nos.update(normalize_job_no(r[0]) for r in rows)
+        _spreadsheet_call(sheet, "batch_update", {"requests": _delete_row_requests(sheet.id, rows_to_delete)})
+        METRICS.count("rows_archived", len(rows_to_delete))
+        print(f"🗄️ Archived {len(rows_to_delete)} closed jobs: "
+              + ", ".join(f"{name} ({len(rows)})" for name, rows in sorted(by_sheet.items())))
+        state.drop_rows(rows_to_delete, load_job_column(sheet))
+        return len(rows_to_delete)
+
+
+def load_archive(sheet, index):
+    """SheetArchive ของรอบนี้ (None ถ้าปิด archive) และใส่งานที่ archive แล้วลงดัชนี"""
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return None
+    with METRICS.phase("archive"):
+        archive = SheetArchive.load(sheet)
+    archive.protect(index)
+    return archive
+
+
+# ====== Write-ahead journal ======
+# รอบที่โดนตัดกลางทาง (เช่นชน timeout 15 นาทีของ workflow) รอบถัดไปจะ:
+# 1) ส่งเฉพาะ operation ที่วางแผนไว้แต่ยังไม่ done (upsert ตาม Job No ไม่สร้างแถวซ้ำ)
+# 2) ใช้ snapshot ของ tab ที่ดึงไว้แล้วแทนการดึงใหม่
+# ต้นทุน: snapshot เขียนเป็นบรรทัดเดียวต่อ tab + fsync ครั้งเดียวต่อ tab (ไม่ใช่ต่อแถว)
+#   tab=16 ที่มี ~100k แถว ≈ 23MB และเขียน/อ่านอย่างละ ~0.3 วินาที (เทียบกับดึงใหม่หลายนาที)
+#   tab=16 แบบแบ่งหน้า (--tab16-page-size) หรือ --stream-tab16 ไม่ผ่าน TabCache จึงไม่ถูกบันทึก
+#   (รอบที่ทำต่อจะดึง tab=16 ใหม่) — ตั้ง --journal-file '' ถ้าไม่ต้องการใช้ดิสก์ส่วนนี้
+JOURNAL_FILE = os.getenv('JOURNAL_FILE', 'jobm_journal.jsonl')
+JOURNAL_MAX_AGE_MIN = float(os.getenv('JOURNAL_MAX_AGE_MIN', '60'))  # journal เก่ากว่านี้ถือว่าข้อมูลล้าสมัย
+
+def append_op_id(job_no, row):
+    return f"append:{job_no or normalize_job_no(str(row[0]))}"
+
+def status_op_id(row_no):
+    return f"status:{row_no}"
+
+class RunJournal:
+    """
+    journal แบบ JSON lines (append + fsync ทีละบรรทัด) ของรอบที่กำลังรัน
+      {"type": "begin", "at": epoch}
+      {"type": "tab", "tab": 13, "rows": [[cell, ...], ...]}
+      {"type": "plan", "ops": [{"id", "op": "append"|"status", "job_no", "row"|"row_no"+"status"}]}
+      {"type": "done", "ids": [...]}
+    รอบที่จบสมบูรณ์จะลบไฟล์ทิ้ง (commit) ถ้ายังเหลือไฟล์อยู่แปลว่ารอบก่อนค้าง
+    """
 
-            # ✅ เปลี่ยนจาก jobno_re.search() เป็น looks_like_jobno()
-            has0 = looks_like_jobno(job[0] or "")
-            has1 = looks_like_jobno(job[1] or "")
-            
-            if (not has0) and has1:
-                job[0], job[1] = job[1], job[0]
-        
-            job_no = normalize_job_no(job[0])
-            job_for_sheet = adjust_cols_for_sheet(job)
-        
-            if job_no not in existing:
+    def __init__(self, path, max_age_min=JOURNAL_MAX_AGE_MIN):
+        self.path = path
+        self.max_age_min = max_age_min
+        self.started_at = None
+        self.tabs = {}
+        self.ops = {}
+        self.done = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, max_age_min=JOURNAL_MAX_AGE_MIN):
+        journal = cls(path, max_age_min)
+        if not path or not os.path.exists(path):
+            return journal
+        with open(path, encoding="utf-8") as f:
+            for line in f:
                 try:
-                    print("DEBUG (tab16) ->", job_for_sheet + ["งานที่ปิดแล้ว"])
-                    sheet.append_row(job_for_sheet + ["งานที่ปิดแล้ว"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab16): {job_no} -> งานที่ปิดแล้ว")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding job {job_no} from tab16: {e}")
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # บรรทัดสุดท้ายเขียนไม่จบ (process ถูก kill)
+                kind = rec.get("type")
+                if kind == "begin":
+                    journal.started_at = rec.get("at")
+                elif kind == "tab":
+                    journal.tabs[int(rec["tab"])] = rec["rows"]
+                elif kind == "plan":
+                    journal.ops.update((op["id"], op) for op in rec["ops"])
+                elif kind == "done":
+                    journal.done.update(rec["ids"])
+        return journal
+
+    @property
+    def resumable(self):
+        if self.started_at is None:
+            return False
+        return (time.time() - float(self.started_at)) / 60 <= self.max_age_min
+
+    def pending_ops(self):
+        return [op for op_id, op in self.ops.items() if op_id not in self.done]
+
+    def _write(self, record):
+        if not self.path:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def begin(self, keep_tabs=False):
+        """
+        เริ่ม journal ใหม่ (ทับไฟล์เดิม)
+        keep_tabs=True: ต่อจากรอบที่ค้าง -> เก็บ snapshot ของ tab และเวลาเริ่มเดิมไว้ ทิ้งแผนที่ replay แล้ว
+        """
+        tabs = self.tabs if keep_tabs else {}
+        started_at = self.started_at if keep_tabs and self.started_at else time.time()
+        self.started_at, self.tabs, self.ops, self.done = started_at, {}, {}, set()
+        if self.path:
+            with open(self.path, "w", encoding="utf-8"):
+                pass
+        self._write({"type": "begin", "at": self.started_at})
+        for tab, rows in tabs.items():
+            self.record_tab(tab, rows)
+
+    def record_tab(self, tab, rows):
+        if int(tab) in self.tabs:
+            return
+        self.tabs[int(tab)] = rows
+        self._write({"type": "tab", "tab": int(tab), "rows": rows})
+
+    def record_plan(self, ops):
+        new = [op for op in ops if op["id"] not in self.ops]
+        if not new:
+            return
+        self.ops.update((op["id"], op) for op in new)
+        self._write({"type": "plan", "ops": new})
+
+    def mark_done(self, ids):
+        ids = [i for i in ids if i not in self.done]
+        if ids:
+            self.done.update(ids)
+            self._write({"type": "done", "ids": ids})
+
+    def commit(self):
+        """รอบนี้เขียนครบแล้ว -> ลบ journal"""
+        self.started_at, self.tabs, self.ops, self.done = None, {}, {}, set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def replay_journal(sheet, journal):
+    """
+    ส่ง operation ที่ค้างใน journal แบบ upsert ตาม Job No:
+    - append ที่ Job No มีในชีตแล้ว -> ถือว่าเสร็จ (ไม่เพิ่มซ้ำ)
+    - status -> หาแถวจาก Job No ในคอลัมน์ A ปัจจุบัน (ถ้าไม่รู้ Job No ใช้เลขแถวเดิม)
+    คืน (จำนวนแถวที่เพิ่ม, จำนวน update, มี operation ที่ยังส่งไม่สำเร็จหรือไม่)
+    """
+    pending = journal.pending_ops()
+    if not pending:
+        return 0, 0, False
+    rows_by_job = {}
+    for row_no, value in enumerate(load_job_column(sheet), start=1):
+        rows_by_job.setdefault(normalize_job_no(value), row_no)
+
+    writer = SheetWriteBuffer(sheet, journal=journal)
+    skipped = []
+    for op in pending:
+        job_no = op.get("job_no")
+        if op["op"] == "append":
+            if normalize_job_no(str(op["row"][0])) in rows_by_job:
+                skipped.append(op["id"])
             else:
-                # เพิ่มส่วนนี้เพื่อ update สถานะ "ปิดงาน" -> "งานที่ปิดแล้ว"
-                try:
-                    for i, row in enumerate(sheet_data[1:], start=2):
-                        if row and len(row) > 0 and normalize_job_no(row[0]) == job_no:
-                            if len(row) >= 8 and row[7] == "ปิดงาน":
-                                sheet.update_cell(i, 8, "งานที่ปิดแล้ว")
-                                print(f"🔄 Updated status (tab16): {job_no} ปิดงาน -> งานที่ปิดแล้ว")
-                                updated += 1
-                                time.sleep(0.5)
-                            break
-                except Exception as e:
-                    print(f"❌ Error updating job {job_no} from tab16: {e}")
-
-            # ====== (ใหม่) tab=18,7 งานใหม่ภายในศูนย์ -> รอแจ้ง ======
-        for job in internal_new_jobs:
-            if not job or len(job) < 7:
+                writer.append(op["row"], job_no=job_no)
+        elif op["op"] == "status":
+            row_no = rows_by_job.get(job_no) if job_no else op.get("row_no")
+            if row_no:
+                writer.update_status(row_no, op["status"], job_no=job_no)
+            else:
+                skipped.append(op["id"])
+    journal.mark_done(skipped)
+    print(f"📓 Replaying {len(pending) - len(skipped)} pending operations from journal "
+          f"({len(skipped)} already applied)")
+    appended, updated = writer.flush()
+    return appended, updated, writer.failed
+
+
+# ====== Notifications (LINE ผ่าน WORKER_PUSH_URL) ======
+# สรุปการเปลี่ยนสถานะที่เขียนลงชีตแล้วจริงเป็น push เดียวต่อรอบ (หรือต่อ NOTIFY_BATCH_SIZE งาน)
+# batch ถูกบันทึกลงไฟล์ (outbox) พร้อม retry key ก่อนส่ง -> ส่งซ้ำข้ามรอบก็แจ้งครั้งเดียว
+WORKER_PUSH_URL = os.getenv('WORKER_PUSH_URL', '').strip()
+LINE_TO = os.getenv('LINE_TO', '').strip()
+NOTIFY_FILE = os.getenv('NOTIFY_FILE', 'jobm_notified.json')
+NOTIFY_STATUSES = tuple(s.strip() for s in os.getenv('NOTIFY_STATUSES', 'รอแจ้ง,ปิดงาน_รอแจ้ง').split(',') if s.strip())
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', '50'))        # งานต่อ 1 push
+NOTIFY_TIMEOUT_SEC = float(os.getenv('NOTIFY_TIMEOUT_SEC', '5'))
+NOTIFY_RETRIES = int(os.getenv('NOTIFY_RETRIES', '2'))
+NOTIFY_KEEP_DAYS = int(os.getenv('NOTIFY_KEEP_DAYS', '30'))          # จำงานที่แจ้งแล้วนานเท่านี้
+NOTIFY_OUTBOX_MAX_AGE_HOURS = 24  # retry key ของ LINE ใช้ได้ 24 ชม. เก่ากว่านี้ส่งซ้ำอาจแจ้งซ้ำ -> ทิ้ง
+
+def _display_job_no(job_no):
+    """job_no ที่ normalize แล้ว (ตัวเล็ก) -> รูปแบบในเว็บ เช่น no123 -> No123"""
+    return job_no[:1].upper() + job_no[1:]
+
+class PushNotifier:
+    """
+    แจ้งการเปลี่ยนสถานะเข้า LINE ผ่าน worker (POST แบบ LINE push API + header X-Line-Retry-Key)
+    ไฟล์: {"version", "sent": {"job_no|สถานะ": วันที่แจ้ง}, "outbox": [{"key", "items", "created_at"}]}
+    - enqueue : เลือกการเปลี่ยนแปลงที่ต้องแจ้ง (NOTIFY_STATUSES และยังไม่เคยแจ้ง) แบ่ง batch แล้วบันทึกก่อนส่ง
+    - flush   : ส่ง outbox ทีละ batch (timeout + retry จำกัด) batch ที่ส่งไม่ได้ค้างไว้ส่งรอบหน้าด้วย key เดิม
+    ไม่ raise: ส่งไม่ได้แค่พิมพ์เตือน การ sync ไม่ต้องรอ
+    """
+    VERSION = 1
+
+    def __init__(self, path, url=WORKER_PUSH_URL, to=LINE_TO, statuses=NOTIFY_STATUSES,
+                 batch_size=NOTIFY_BATCH_SIZE, timeout=NOTIFY_TIMEOUT_SEC, retries=NOTIFY_RETRIES, data=None):
+        self.path = path
+        self.url = url
+        self.to = to
+        self.statuses = set(statuses)
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        data = data or {}
+        self.sent = dict(data.get("sent") or {})
+        self.outbox = list(data.get("outbox") or [])
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        data = None
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") != cls.VERSION:
+                    raise ValueError(f"version {data.get('version')}")
+            except FileNotFoundError:
+                data = None
+            except Exception as e:
+                print(f"⚠️ Ignoring notification file {path}: {e}")
+                data = None
+        return cls(path, data=data, **kwargs)
+
+    def save(self):
+        if not self.path:
+            return
+        keep_after = (archive_today() - timedelta(days=NOTIFY_KEEP_DAYS)).isoformat()
+        self.sent = {k: day for k, day in self.sent.items() if day >= keep_after}
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "sent": self.sent, "outbox": self.outbox},
+                          f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ Cannot write notification file {self.path}: {e}")
+
+    @staticmethod
+    def _key(job_no, status):
+        return f"{job_no}|{status}"
+
+    def enqueue(self, changes, landed=None):
+        """
+        changes = ผลของ Reconciler.plan [(job_no, สถานะเดิม, สถานะใหม่, แหล่ง)]
+        landed  = job_no ที่เขียนถึงชีตแล้ว (SheetWriteBuffer.applied_job_nos) None = ทั้งหมด
+        คืนจำนวนงานที่เข้าคิวใหม่
+        """
+        queued = {self._key(job_no, new) for batch in self.outbox for job_no, _, new in batch["items"]}
+        items, seen = [], set()
+        for job_no, old, new, _source in changes:
+            key = self._key(job_no, new)
+            if new not in self.statuses or (landed is not None and job_no not in landed) \
+                    or key in self.sent or key in queued or key in seen:
                 continue
-            job_no = normalize_job_no(job[0])
-            row_for_sheet = adjust_internal_centers(job)  # บังคับ C,D = INTERNAL_CENTER
-            if job_no not in existing:
-                try:
-                    sheet.append_row(row_for_sheet + ["รอแจ้ง"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab18/7 internal): {job_no} -> รอแจ้ง")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding internal-new {job_no}: {e}")
+            seen.add(key)
+            items.append([job_no, old, new])
+        if not items:
+            return 0
+        import uuid
+        now = datetime.now().isoformat(timespec="seconds")
+        for i in range(0, len(items), self.batch_size):
+            self.outbox.append({"key": str(uuid.uuid4()), "items": items[i:i + self.batch_size], "created_at": now})
+        self.save()  # บันทึก key ก่อนส่ง: ถ้าส่งแล้วหลุดกลางทาง รอบหน้าส่งซ้ำด้วย key เดิม
+        return len(items)
+
+    def message(self, items):
+        lines = [f"🔔 JobM: {len(items)} งานเปลี่ยนสถานะ"]
+        for job_no, old, new in items:
+            lines.append(f"• {_display_job_no(job_no)}: " + (f"{old} → {new}" if old else f"{new} (ใหม่)"))
+        return "\n".join(lines)
+
+    def _post(self, batch):
+        """คืน True ถ้าส่งถึงแล้ว (รวม 409 = worker/LINE รับ key นี้ไปแล้ว)"""
+        import requests
+        payload = {"messages": [{"type": "text", "text": self.message(batch["items"])}]}
+        if self.to:
+            payload["to"] = self.to
+        for attempt in range(self.retries + 1):
+            if attempt:
+                METRICS.sleep(backoff_delay(attempt, cap=self.timeout), "notify_backoff")
+            try:
+                METRICS.count("notify_requests")
+                res = requests.post(self.url, json=payload, timeout=self.timeout,
+                                    headers={"X-Line-Retry-Key": batch["key"]})
+                if res.status_code < 300 or res.status_code == 409:
+                    return True
+                res.raise_for_status()
+            except Exception as e:
+                if _retryable_status(e) is None:
+                    print(f"⚠️ Push notification rejected: {e}")
+                    return False
+                print(f"⚠️ Push notification failed ({e}); attempt {attempt + 1}/{self.retries + 1}")
+        return False
 
-        # ====== (ใหม่) tab=11 ปิดงานภายในศูนย์ -> ปิดงาน ======
-        for job in internal_closed_full:
-            if not job or len(job) < 7:
-                continue
-            job_no = normalize_job_no(job[0])
-            row_for_sheet = adjust_internal_centers(job)
-            if job_no not in existing:
-                try:
-                    sheet.append_row(row_for_sheet + ["ปิดงาน"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab11 internal): {job_no} -> ปิดงาน")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding internal-closed {job_no}: {e}")
-            else:
-                try:
-                    for i, row in enumerate(sheet_data[1:], start=2):
-                        if row and len(row) > 0 and normalize_job_no(row[0]) == job_no:
-                            if len(row) < 8 or row[7] != "ปิดงาน":
-                                sheet.update_cell(i, 8, "ปิดงาน")
-                                print(f"🔒 Updated status (tab11 internal): {job_no}")
-                                updated += 1
-                                time.sleep(0.5)
-                            break
-                except Exception as e:
-                    print(f"❌ Error updating internal-closed {job_no}: {e}")
+    def flush(self):
+        """ส่ง outbox ตามลำดับ หยุดที่ batch แรกที่ส่งไม่ได้ คืนจำนวนงานที่แจ้งสำเร็จ"""
+        if not self.outbox:
+            return 0
+        oldest = (datetime.now() - timedelta(hours=NOTIFY_OUTBOX_MAX_AGE_HOURS)).isoformat(timespec="seconds")
+        stale = [b for b in self.outbox if b["created_at"] < oldest]
+        if stale:
+            print(f"⚠️ Dropping {sum(len(b['items']) for b in stale)} unsent notifications older than "
+                  f"{NOTIFY_OUTBOX_MAX_AGE_HOURS}h")
+            self.outbox = [b for b in self.outbox if b not in stale]
+        notified = 0
+        while self.outbox:
+            batch = self.outbox[0]
+            if not self._post(batch):
+                print(f"⚠️ {sum(len(b['items']) for b in self.outbox)} notifications kept for the next run")
+                break
+            self.outbox.pop(0)
+            today = archive_today().isoformat()
+            for job_no, _, new in batch["items"]:
+                self.sent[self._key(job_no, new)] = today
+            notified += len(batch["items"])
+            self.save()
+        if stale and not notified:
+            self.save()
+        if notified:
+            METRICS.count("notified", notified)
+            print(f"🔔 Sent {notified} status changes to LINE")
+        return notified
+
+    def notify(self, changes, landed=None):
+        """enqueue + flush ไม่ raise (แจ้งเตือนไม่ได้ต้องไม่ทำให้ sync พัง)"""
+        try:
+            self.enqueue(changes, landed)
+            return self.flush()
+        except Exception as e:
+            print(f"⚠️ Notification step failed: {e}")
+            return 0
 
-        # ====== (ใหม่) tab=20 งานที่ปิดแล้ว (ภายในศูนย์) -> งานที่ปิดแล้ว ======
-        for job in internal_closed_already:
+def load_notifier(path):
+    """PushNotifier ถ้าตั้ง WORKER_PUSH_URL ไว้ ไม่งั้น None"""
+    if not WORKER_PUSH_URL:
+        return None
+    return PushNotifier.load(path, url=WORKER_PUSH_URL, to=LINE_TO)
+
+# ====== Reconciler ======
+# ลำดับความสำคัญของสถานะ: ถ้างานเดียวกันโผล่หลาย tab ให้ใช้สถานะที่ "ไปไกลสุด"
+STATUS_PRECEDENCE = ("รอแจ้ง", "ปิดงาน", "ปิดงาน_รอแจ้ง", "งานที่ปิดแล้ว")
+STATUS_RANK = {status: rank for rank, status in enumerate(STATUS_PRECEDENCE)}
+
+# การเปลี่ยนสถานะของแถวที่มีอยู่แล้วในชีต: สถานะที่ tab เสนอ -> {สถานะปัจจุบัน: สถานะใหม่}
+# "*" = สถานะอื่นทั้งหมด, None = ไม่ต้องเขียน (ไม่ถอยหลังตาม STATUS_PRECEDENCE)
+STATUS_TRANSITIONS = {
+    # ยังไม่ปิด: เพิ่มแถวใหม่อย่างเดียว ไม่แตะแถวเดิม
+    "รอแจ้ง": {"*": None},
+    # เคย "แจ้งแล้ว" -> "ปิดงาน_รอแจ้ง" ก่อน เพื่อให้ GAS ไป stamp แจ้งปิดงาน
+    "ปิดงาน": {"ปิดงาน": None, "ปิดงาน_รอแจ้ง": None, "งานที่ปิดแล้ว": None,
+               "แจ้งแล้ว ✅": "ปิดงาน_รอแจ้ง", "*": "ปิดงาน"},
+    "งานที่ปิดแล้ว": {"ปิดงาน": "งานที่ปิดแล้ว", "*": None},
+}
+
+# งานภายในศูนย์ (tab=11) ปิดตรง ๆ ไม่ผ่าน "ปิดงาน_รอแจ้ง"
+INTERNAL_CLOSE_TRANSITIONS = {"ปิดงาน": None, "ปิดงาน_รอแจ้ง": None, "งานที่ปิดแล้ว": None, "*": "ปิดงาน"}
+
+# เพิ่มแถวใหม่อย่างเดียว ไม่แตะแถวเดิม (tab=20 เดิมไม่เคยเปลี่ยนสถานะแถวที่มีอยู่แล้ว)
+ADD_ONLY_TRANSITIONS = {"*": None}
+
+def next_status(current, target, transitions=None):
+    """สถานะใหม่ของแถวเดิม หรือ None ถ้าไม่ต้องเขียน"""
+    table = transitions or STATUS_TRANSITIONS[target]
+    new = table.get(current, table.get("*"))
+    return new if new != current else None
+
+def fold_status(current, targets):
+    """
+    สถานะใหม่ของแถวเดิมเมื่อหลายแหล่งเสนอพร้อมกัน: ทุกแหล่งตัดสินจากสถานะในชีตด้วยตารางของตัวเอง
+    แล้วไล่ตาม STATUS_PRECEDENCE (เท่ากัน = ตามลำดับ JOB_SOURCES) การเขียนของแหล่งที่มาทีหลังชนะ
+    เช่น tab15 + tab16 บนแถว 'แจ้งแล้ว ✅' -> 'ปิดงาน_รอแจ้ง' (tab16 เปลี่ยนเฉพาะแถวที่เป็น 'ปิดงาน')
+    targets = [(สถานะที่เสนอ, JobSource)] คืน None ถ้าไม่ต้องเขียน
+    """
+    status = None
+    for target, source in sorted(targets, key=lambda t: (STATUS_RANK.get(t[0], -1), SOURCE_ORDER.get(t[1].name, 0))):
+        new = next_status(current, target, source.transitions)
+        if new is not None:
+            status = new
+    return status
+
+def _tab13_status(job_no, closed_job_nos):
+    return "ปิดงาน" if job_no in closed_job_nos else "รอแจ้ง"
+
+def _tab16_row(job):
+    return adjust_cols_for_sheet(fix_swapped_jobno(job))
+
+class JobSource:
+    """
+    แหล่งข้อมูลหนึ่งแหล่ง (tab หรือกลุ่ม tab) สำหรับ reconcile
+    - status      : สถานะที่เสนอ (str) หรือ func(job_no, closed_job_nos) -> str
+    - to_row      : แปลงแถวจากเว็บเป็น 7 คอลัมน์ของชีต
+    - transitions : ตาราง transition เฉพาะแหล่งนี้ (None = ใช้ STATUS_TRANSITIONS)
+    - tabs        : tab ที่ผลของแหล่งนี้ขึ้นอยู่ด้วย (ใช้ทำ fingerprint; tab13 ขึ้นกับ tab15 ด้วย)
+    - max_status  : สถานะสูงสุดที่แหล่งนี้เสนอได้ (ต้องระบุถ้า status เป็นฟังก์ชัน)
+    - prefix      : แหล่งนี้มีเฉพาะ Job No ที่ขึ้นต้นแบบนี้ ('' = ทุกงาน; เก็บแบบ normalize_job_no)
+    """
+    __slots__ = ("name", "status", "to_row", "transitions", "tabs", "max_status", "prefix")
+
+    def __init__(self, name, status, to_row=None, transitions=None, tabs=(), max_status=None, prefix=""):
+        self.name = name
+        self.tabs = tuple(tabs)
+        self.status = status
+        self.to_row = to_row or (lambda job: list(job[:7]))
+        self.transitions = transitions
+        self.max_status = max_status or status
+        self.prefix = normalize_job_no(prefix)  # เทียบกับ job_no ที่ normalize แล้ว (ตัวเล็ก)
+
+    def status_for(self, job_no, closed_job_nos):
+        return self.status(job_no, closed_job_nos) if callable(self.status) else self.status
+
+    def may_contain(self, job_no):
+        return not self.prefix or job_no.startswith(self.prefix)
+
+    @property
+    def can_update(self):
+        """แหล่งนี้เปลี่ยนสถานะแถวที่มีอยู่แล้วได้หรือไม่ (False = เพิ่มแถวอย่างเดียว)"""
+        table = self.transitions or STATUS_TRANSITIONS[self.max_status]
+        return any(v is not None for v in table.values())
+
+# เพิ่ม tab ใหม่ = เพิ่มแถวที่นี่ (ลำดับใช้ตัดสินกรณีสถานะเท่ากัน: แหล่งที่มาก่อนชนะ)
+JOB_SOURCES = (
+    JobSource("tab13", _tab13_status, tabs=(13, 15), max_status="ปิดงาน"),                           # งานใหม่
+    JobSource("tab14", "รอแจ้ง", tabs=(14,)),                                                       # รอแจ้ง
+    JobSource("tab15", "ปิดงาน", adjust_cols_for_sheet, tabs=(15,)),                                 # ปิดงาน (C ว่าง + shift)
+    JobSource("tab16", "งานที่ปิดแล้ว", _tab16_row, tabs=(16,)),                                       # งานที่ปิดแล้ว
+    JobSource("tab18/7", "รอแจ้ง", adjust_internal_centers, tabs=(18, 7),
+              prefix=INTERNAL_JOB_PREFIX),                                                          # ภายในศูนย์: ใหม่
+    JobSource("tab11", "ปิดงาน", adjust_internal_centers, INTERNAL_CLOSE_TRANSITIONS, tabs=(11,),
+              prefix=INTERNAL_JOB_PREFIX),                                                          # ภายในศูนย์: ปิดงาน
+    JobSource("tab20", "งานที่ปิดแล้ว", adjust_internal_centers, ADD_ONLY_TRANSITIONS, tabs=(20,),
+              prefix=INTERNAL_JOB_PREFIX),                                                          # ภายในศูนย์: ปิดแล้ว
+)
+JOB_SOURCES_BY_NAME = {src.name: src for src in JOB_SOURCES}
+SOURCE_ORDER = {src.name: i for i, src in enumerate(JOB_SOURCES)}
+
+def active_sources(tabs=None):
+    """แหล่งใน JOB_SOURCES ที่ tab ครบอยู่ใน FETCH_TABS (tenant ที่ตั้ง tabs ไว้น้อยกว่าจะไม่ reconcile แหล่งที่เหลือ)"""
+    tabs = set(FETCH_TABS if tabs is None else tabs)
+    return [src for src in JOB_SOURCES if set(src.tabs) <= tabs]
+
+class JobRecord:
+    """
+    ผลรวมของงานหนึ่งงานจากทุก tab: สถานะสุดท้าย + แหล่งที่ชนะ + แถวสำหรับ append (ถ้ายังไม่มีในชีต)
+    targets: [(สถานะ, แหล่ง)] ของทุกแหล่ง (เฉพาะงานที่มีในชีตแล้ว ใช้กับ fold_status)
+    """
+    __slots__ = ("job_no", "status", "source", "row", "targets")
+
+    def __init__(self, job_no, status, source, row):
+        self.job_no = job_no
+        self.status = status
+        self.source = source
+        self.row = row
+        self.targets = [(status, source)] if row is None else None
+
+class Reconciler:
+    """
+    รวมทุกแหล่งในรอบเดียวเป็น JobRecord ต่องาน แล้วสร้างการเขียน "งานละไม่เกิน 1 ครั้ง"
+    - add(source, jobs) : merge แถวของแหล่งหนึ่ง (รับ generator ได้ อ่านรอบเดียว)
+    - plan(writer)      : ตัดสินสถานะสุดท้ายด้วย STATUS_TRANSITIONS แล้วส่งเข้า writer
+    ถ้ามี state ที่เชื่อถือได้ แถวที่เหมือนรอบก่อน (observation เดิม) จะถูกข้าม
+    แหล่งต่าง ๆ add เข้ามาลำดับไหนก็ได้ (โหมด pipeline) ผลเท่ากับ add ตามลำดับ JOB_SOURCES
+    memory โตตามงานที่ต้องเขียนเท่านั้น: แถวเดิมที่แหล่งนี้ไม่เปลี่ยนไม่ถูกเก็บ และ observed เก็บเมื่อมี state store
+    """
+
+    def __init__(self, index, closed_job_nos=None, state=None, observe=False):
+        self.index = index
+        self.closed_job_nos = closed_job_nos or set()
+        self.state = state
+        self.records = {}
+        # job_no -> {source: observation_hash} สำหรับ StateStore.save (None = ไม่มี state store ไม่ต้องเก็บ)
+        self.observed = {} if observe or state is not None else None
+        self.skipped = 0
+        self.skipped_sources = []  # แหล่งที่ fingerprint ไม่เปลี่ยน (ไม่ได้ parse/reconcile เลย)
+        self.planned = set()       # งานที่ส่งเข้า writer ไปแล้ว (แหล่งที่มาทีหลังเปลี่ยนผลไม่ได้)
+
+    def skip(self, source):
+        self.skipped_sources.append(source.name if isinstance(source, JobSource) else source)
+
+    def add(self, source, jobs):
+        if isinstance(source, str):
+            source = JOB_SOURCES_BY_NAME[source]
+        for job in jobs or []:
             if not job or len(job) < 7:
                 continue
-            job_no = normalize_job_no(job[0])
-            row_for_sheet = adjust_internal_centers(job)
-            if job_no not in existing:
-                try:
-                    sheet.append_row(row_for_sheet + ["งานที่ปิดแล้ว"], value_input_option="USER_ENTERED")
-                    print(f"✅ Added (tab20 internal): {job_no} -> งานที่ปิดแล้ว")
-                    new_added += 1
-                    existing.add(job_no)
-                    time.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Error adding internal-closed-already {job_no}: {e}")
+            row = source.to_row(job)
+            job_no = normalize_job_no(row[0])
+            status = source.status_for(job_no, self.closed_job_nos)
+            entry = self.index.get(job_no)
+            known = entry is not None
+            if self.observed is not None:
+                obs = observation_hash(source.name, job, status)
+                self.observed.setdefault(job_no, {})[source.name] = obs
+                if known and self.state is not None and \
+                        self.state.observations(job_no).get(source.name) == obs:
+                    self.skipped += 1
+                    continue
+
+            if job_no in self.planned:
+                continue
+            if known and self.state is None and next_status(entry.status, status, source.transitions) is None:
+                # สถานะในชีตอ่านมาสด ๆ แล้ว และแหล่งนี้ไม่เปลี่ยนแถวนี้: fold_status ข้ามผลนี้อยู่แล้ว ไม่ต้องเก็บ
+                # (state ที่เชื่อถือได้ = สถานะอาจเก่า ต้องรอ refresh_statuses ก่อนตัดสิน)
+                continue
+            rec = self.records.get(job_no)
+            if rec is None:
+                # งานที่มีในชีตแล้วไม่ต้องเก็บทั้งแถว (ประหยัด memory กับ tab ใหญ่ ๆ)
+                self.records[job_no] = JobRecord(job_no, status, source, None if known else row)
+                continue
+            if rec.targets is not None:
+                rec.targets.append((status, source))
+            if self._outranks(status, source, rec.status, rec.source):
+                rec.status, rec.source = status, source
+                if not known:
+                    rec.row = row
+
+    @staticmethod
+    def _outranks(status, source, other_status, other_source):
+        """สถานะสูงกว่าชนะ ถ้าเท่ากันแหล่งที่อยู่ก่อนใน JOB_SOURCES ชนะ"""
+        rank, other = STATUS_RANK.get(status, -1), STATUS_RANK.get(other_status, -1)
+        return rank > other or (rank == other and SOURCE_ORDER.get(source.name, 0) < SOURCE_ORDER.get(other_source.name, 0))
+
+    def is_final(self, rec, pending=()):
+        """
+        แหล่งที่ยังไม่ได้ add (pending) ไม่มีทางเปลี่ยนผลของงานนี้ได้แล้ว
+        งานใหม่: ไม่มีแหล่งที่สถานะสูงกว่า; งานที่มีในชีต: ไม่มีแหล่งที่เปลี่ยนสถานะแถวเดิมได้ (fold_status)
+        """
+        if rec.targets is not None:
+            return not any(p.may_contain(rec.job_no) and p.can_update for p in pending)
+        return not any(p.may_contain(rec.job_no) and self._outranks(p.max_status, p, rec.status, rec.source)
+                       for p in pending)
+
+    def known_job_nos(self, pending=()):
+        return [j for j, rec in self.records.items() if j in self.index and self.is_final(rec, pending)]
+
+    def plan(self, writer, pending=()):
+        """
+        ส่งการเขียนเข้า writer คืน list ของการเปลี่ยนแปลง (job_no, สถานะเดิม, สถานะใหม่, ชื่อแหล่ง)
+        pending = แหล่งที่ยังไม่ได้ add: งานที่แหล่งเหล่านั้นอาจเปลี่ยนผลได้จะยังไม่ถูกส่ง (รอ plan รอบถัดไป)
+        """
+        changes = []
+        waiting = {}
+        for job_no, rec in self.records.items():
+            if pending and not self.is_final(rec, pending):
+                waiting[job_no] = rec
+                continue
+            self.planned.add(job_no)
+            entry = self.index.get(job_no)
+            if entry is None:
+                writer.append(rec.row + [rec.status], job_no=job_no)
+                self.index.add_pending(job_no, rec.status)
+                print(f"✅ Added ({rec.source.name}): {job_no} -> {rec.status}")
+                changes.append((job_no, "", rec.status, rec.source.name))
+                continue
+            new_status = fold_status(entry.status, rec.targets or [(rec.status, rec.source)])
+            if new_status is None:
+                continue
+            if entry.row_no is None:
+                continue  # เพิ่งสั่ง append ในรอบนี้ (สถานะถูกตัดสินไปแล้ว)
+            writer.update_status(entry.row_no, new_status, job_no=job_no)
+            print(f"🔒 Updated status ({rec.source.name}): {job_no} {entry.status or '-'} -> {new_status}")
+            changes.append((job_no, entry.status, new_status, rec.source.name))
+        self.records = waiting
+        return changes
 
 
-        print(f"📊 Summary: {new_added} new rows added, {updated} rows updated")
-        return {"new_added": new_added, "updated": updated}
+def update_google_sheets(sheet, new_jobs, closed_job_nos,
+                         waiting_jobs=None, closed_jobs_full=None,
+                         closed_already_jobs=None,              # tab=16
+                         internal_new_jobs=None,                # tab=18,7  -> รอแจ้ง
+                         internal_closed_full=None,             # tab=11    -> ปิดงาน
+                         internal_closed_already=None,          # tab=20    -> งานที่ปิดแล้ว
+                         state=None,                            # StateStore (ถ้ามี) -> ส่งเฉพาะส่วนต่าง
+                         sources=None,                          # {ชื่อใน JOB_SOURCES: jobs} สำหรับแหล่งเพิ่มเติม
+                         fingerprints=None,                     # {ชื่อใน JOB_SOURCES: hash ของ tab} (TabCache.fingerprint)
+                         journal=None,                          # RunJournal (บันทึกแผน/ความคืบหน้าการเขียน)
+                         notifier=None):                        # PushNotifier (แจ้งการเปลี่ยนสถานะที่เขียนสำเร็จ)
+    """
+    รวมทุก tab ในรอบเดียวแล้วเขียนงานละไม่เกิน 1 ครั้ง (ดู JOB_SOURCES / STATUS_TRANSITIONS)
+    - tab=13   : 'รอแจ้ง' หรือ 'ปิดงาน' (ถ้าอยู่ใน closed_job_nos)
+    - tab=14   : 'รอแจ้ง' (เพิ่มอย่างเดียว)
+    - tab=15   : 'ปิดงาน' (C ว่าง + shift ขวา); แถวเดิมที่ 'แจ้งแล้ว ✅' -> 'ปิดงาน_รอแจ้ง'
+    - tab=16   : 'งานที่ปิดแล้ว' (C ว่าง + shift ขวา, ดักสลับ Job No/เรื่องที่แจ้ง); แถวเดิมเปลี่ยนจาก 'ปิดงาน' เท่านั้น
+    - tab=18,7 : 'รอแจ้ง' และบังคับ C,D = INTERNAL_CENTER
+    - tab=11   : 'ปิดงาน' (C,D = INTERNAL_CENTER)
+    - tab=20   : 'งานที่ปิดแล้ว' (C,D = INTERNAL_CENTER) เพิ่มอย่างเดียว
+    งานที่อยู่หลาย tab: แถวใหม่ใช้สถานะตาม STATUS_PRECEDENCE, แถวเดิมรวมผลของทุก tab ด้วย fold_status
+    jobs ของแต่ละแหล่งส่งเป็นฟังก์ชันไม่มีอาร์กิวเมนต์ได้ (parse เมื่อจำเป็นเท่านั้น):
+    ถ้า state เชื่อถือได้และ fingerprint ตรงกับรอบก่อน แหล่งนั้นจะถูกข้ามทั้งแหล่งโดยไม่เรียก
+    """
+    inputs = {
+        "tab13": new_jobs, "tab14": waiting_jobs, "tab15": closed_jobs_full,
+        "tab16": closed_already_jobs, "tab18/7": internal_new_jobs,
+        "tab11": internal_closed_full, "tab20": internal_closed_already,
+    }
+    inputs.update(sources or {})
+
+    try:
+        print("✏️ Updating Google Sheets...")
+        # ทำดัชนีข้อมูลเดิมในชีตรอบเดียว: job_no (normalize) -> (แถว, สถานะ)
+        # ถ้ามี state ในเครื่องที่ยังตรงกับชีต (ตรวจจากคอลัมน์ A) จะไม่อ่านคอลัมน์ H ทั้งคอลัมน์
+        with METRICS.phase("sheet_index"):
+            existing, job_col, trusted = load_sheet_index(sheet, state)
+        archive = load_archive(sheet, existing)
+
+        reconciler = Reconciler(existing, closed_job_nos, state if trusted else None, observe=state is not None)
+        fingerprints = fingerprints or {}
+        previous = state.fingerprints() if trusted else {}
+        with METRICS.phase("reconcile"):
+            for source in JOB_SOURCES:
+                jobs = inputs.get(source.name)
+                fp = fingerprints.get(source.name)
+                if fp and previous.get(source.name) == fp:
+                    reconciler.skip(source)
+                    continue
+                reconciler.add(source, jobs() if callable(jobs) else jobs)
+
+        if trusted:
+            # สถานะในชีตอาจถูก GAS แก้ไปแล้ว -> อ่านคอลัมน์ H ใหม่เฉพาะแถวที่กำลังจะตัดสินใจ
+            refresh_statuses(sheet, existing, reconciler.known_job_nos())
+
+        # เขียนแบบ batch: เก็บ append/update ไว้ก่อนแล้ว flush ทีเดียว
+        writer = SheetWriteBuffer(sheet, journal=journal)
+        changes = reconciler.plan(writer)
+        with METRICS.phase("flush"):
+            new_added, updated = writer.flush()
+
+        return _finish_sync(sheet, state, writer, reconciler, archive, notifier, changes,
+                            job_col, existing, trusted, fingerprints, new_added, updated)
     except Exception as e:
         print(f"❌ Error updating Google Sheets: {e}")
         return {"new_added": 0, "updated": 0, "error": str(e)}
 
+def _finish_sync(sheet, state, writer, reconciler, archive, notifier, changes,
+                 job_col, existing, trusted, fingerprints, new_added, updated):
+    """
+    ส่วนท้ายที่เหมือนกันของ update_google_sheets และ run_pipelined (หลัง flush ครบแล้ว):
+    บันทึก/ล้าง state, ย้ายแถวเก่าไป archive, แจ้งเตือน, สรุปผล แล้วคืน result dict
+    """
+    if state is not None:
+        if writer.failed:
+            state.invalidate()
+        else:
+            state.save(job_col, existing, writer, reconciler.observed, keep_previous=trusted,
+                       fingerprints=fingerprints, carried=reconciler.skipped_sources)
+    archived = archive.run_after_sync(sheet, state, writer) if archive is not None else 0
+    notified = notifier.notify(changes, writer.applied_job_nos) if notifier is not None else 0
+    if reconciler.skipped_sources:
+        print(f"⏭️ Unchanged tabs (fingerprint): {', '.join(reconciler.skipped_sources)}")
+    if reconciler.skipped:
+        print(f"⏭️ Skipped {reconciler.skipped} unchanged tab rows (state file)")
+    print(f"📊 Summary: {new_added} new rows added, {updated} rows updated"
+          + (f", {archived} rows archived" if archived else ""))
+    return {"new_added": new_added, "updated": updated, "skipped": reconciler.skipped,
+            "skipped_tabs": reconciler.skipped_sources, "write_failed": writer.failed, "archived": archived,
+            "notified": notified}
+
 # เพิ่มฟังก์ชันตรวจ env
 def require_env(name: str) -> str:
     val = os.getenv(name)
@@ -697,92 +2805,613 @@ def require_env(name: str) -> str:
         raise RuntimeError(f"Missing required environment variable: {name}")
     return val
     
-def main():
-    print(f"🚀 Starting job fetch process at {datetime.now()}")
-    driver = None
-    try:
-        driver = setup_driver()
-        if not login_to_system(driver):
-            raise Exception("Login failed")
-            
-        # ฟังก์ชันช่วยตรวจสอบว่ามีข้อมูลจริงหรือไม่ (สำหรับ regular jobs)
-        def has_valid_data(job_list):
-            if not job_list:
-                return False
-            for job in job_list:
-                if job and any(str(cell).strip() for cell in job[:7]):
-                    return True
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Fetch jobs from edoclite and sync them to Google Sheets")
+    parser.add_argument("command", nargs="?", choices=("run", "fetch", "sync"), default="run",
+                        help="run = ดึงแล้ว sync ใน process เดียว (default), fetch = ดึงทุก tab ลง snapshot อย่างเดียว, "
+                             "sync = sync snapshot เข้าชีตอย่างเดียว (ไม่ต้องมี Chrome)")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE,
+                        help="ไฟล์ snapshot (JSON lines) ระหว่าง fetch กับ sync [env SNAPSHOT_FILE, default: %(default)s]")
+    parser.add_argument("--backend", choices=("selenium", "http"), default=FETCH_BACKEND,
+                        help="วิธีดึงตาราง: selenium (render ใน Chrome) หรือ http (ใช้ cookie หลัง login) "
+                             "[env FETCH_BACKEND, default: %(default)s]")
+    parser.add_argument("--state-file", default=STATE_FILE,
+                        help="ไฟล์ state ในเครื่องสำหรับ sync เฉพาะส่วนต่าง ('' = ปิด) [env STATE_FILE, default: %(default)s]")
+    parser.add_argument("--journal-file", default=JOURNAL_FILE,
+                        help="write-ahead journal ของรอบที่กำลังรัน (รอบที่ค้างจะถูกทำต่อ, '' = ปิด) "
+                             "[env JOURNAL_FILE, default: %(default)s]")
+    parser.add_argument("--scrape-profile", action="store_true", default=SCRAPE_PROFILE,
+                        help="Chrome แบบเบา: eager page load + บล็อกรูป/ฟอนต์/CSS/สื่อ + ปิด background networking "
+                             "(ถอยกลับโปรไฟล์ปกติเองถ้าหน้าไม่ขึ้น) [env SCRAPE_PROFILE]")
+    parser.add_argument("--session-file", default=SESSION_FILE,
+                        help="ไฟล์ cache cookie หลัง login ('' = login ใหม่ทุกรอบ) [env SESSION_FILE, default: %(default)s]")
+    parser.add_argument("--notify-file", default=NOTIFY_FILE,
+                        help="ไฟล์จำการแจ้ง LINE ที่ส่งแล้ว/ยังค้างส่ง (กันแจ้งซ้ำ, ใช้เมื่อตั้ง WORKER_PUSH_URL) "
+                             "[env NOTIFY_FILE, default: %(default)s]")
+    parser.add_argument("--stream-tab16", action="store_true", default=STREAM_TAB16,
+                        help="อ่าน tab=16 แบบ stream ทีละแถว (memory คงที่ ไม่ขึ้นกับจำนวนงานที่ปิดแล้ว) [env STREAM_TAB16]")
+    parser.add_argument("--tab16-page-size", type=int, default=TAB16_PAGE_SIZE,
+                        help="ดึง tab=16 ทีละหน้าขนาดนี้และหยุดเมื่อเจอแต่งานที่รู้จักแล้ว (0 = โหลดทั้งหมด) "
+                             "[env TAB16_PAGE_SIZE, default: %(default)s]")
+    parser.add_argument("--pipeline", action="store_true", default=PIPELINE,
+                        help="เปิดชีตพร้อมกับการดึง และ reconcile/เขียนทีละแหล่งทันทีที่ tab ครบ (เฉพาะคำสั่ง run) [env PIPELINE]")
+    parser.add_argument("--daemon", action="store_true",
+                        help="รันค้างไว้และ poll ซ้ำเฉพาะเวลาทำการ (ใช้ browser/session และชีตเดิมทุกรอบ)")
+    parser.add_argument("--poll-interval", type=int, default=POLL_INTERVAL_SEC,
+                        help="ระยะห่างระหว่างรอบในโหมด daemon (วินาที) [env POLL_INTERVAL_SEC, default: %(default)s]")
+    parser.add_argument("--max-poll-interval", type=int, default=POLL_MAX_INTERVAL_SEC,
+                        help="ระยะห่างสูงสุดเมื่อไม่มีอะไรเปลี่ยน (วินาที) [env POLL_MAX_INTERVAL_SEC, default: %(default)s]")
+    parser.add_argument("--metrics-file", default=METRICS_FILE,
+                        help="เขียน metrics ของแต่ละรอบเป็น JSON ('' = ปิด) [env METRICS_FILE, default: %(default)s]")
+    parser.add_argument("--metrics-prom", default=METRICS_PROM_FILE,
+                        help="เขียน metrics เป็น Prometheus textfile ด้วย [env METRICS_PROM_FILE]")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS,
+                        help="จำนวน tab ที่ดึงพร้อมกัน (เฉพาะ backend=http) [env FETCH_WORKERS, default: %(default)s]")
+    parser.add_argument("--tenants", default=TENANTS_FILE,
+                        help="ไฟล์ JSON รายชื่อ tenant (บัญชี/ศูนย์/ชีต) รันคำสั่งนี้ให้ทุก tenant แบบขนาน "
+                             "[env TENANTS_FILE]")
+    parser.add_argument("--tenant-workers", type=int, default=TENANT_WORKERS,
+                        help="จำนวน tenant ที่รันพร้อมกัน [env TENANT_WORKERS, default: %(default)s]")
+    parser.add_argument("--tenant-timeout", type=float, default=TENANT_TIMEOUT_SEC,
+                        help="เวลาสูงสุดต่อ tenant (วินาที) [env TENANT_TIMEOUT_SEC, default: %(default)s]")
+    args = parser.parse_args(argv)
+    if args.command != "run" and (args.daemon or args.pipeline):
+        parser.error("--daemon/--pipeline ใช้ได้เฉพาะคำสั่ง run")
+    if args.tenants and args.daemon:
+        parser.error("--tenants ใช้กับ --daemon ไม่ได้ (ตั้ง schedule ให้รันทีละรอบแทน)")
+    if args.command == "fetch" and args.tab16_page_size > 0:
+        parser.error("--tab16-page-size ต้องอ่านชีตก่อนดึง จึงใช้ได้เฉพาะคำสั่ง run (fetch ใช้ --stream-tab16 แทน)")
+    return args
+
+# tab ที่ต้องดึงทุกรอบ (tab=16 ก่อนเพราะช้าที่สุด)
+FETCH_TABS = (16, 18, 7, 11, 20, 13, 14, 15)
+
+def run_once(args, client, sheet=None, journal=None):
+    """
+    ดึงทุก tab ด้วย client ที่ login แล้ว และ sync เข้าชีตหนึ่งรอบ (= fetch + sync ใน process เดียว)
+    คืน (result, sheet) เพื่อให้โหมด daemon ใช้ sheet เดิมต่อได้
+    raise SessionExpiredError ถ้า session หมดอายุระหว่างดึง
+    journal: ถ้ารอบก่อนค้าง จะส่ง operation ที่เหลือก่อน และใช้ tab ที่ดึงไว้แล้วโดยไม่ดึงซ้ำ
+    """
+    cache = TabCache(client)
+    state = StateStore.load(args.state_file) if args.state_file else None
+    failed, sheet = resume_journal(journal, sheet, cache)
+    if failed:
+        return failed, sheet
+    tab16, sheet = fetch_tabs(args, cache, state, sheet)
+    if journal is not None:
+        # tab=16 แบบแบ่งหน้า/stream ไม่อยู่ใน cache -> ไม่ถูกบันทึก
+        for tab, rows in cache.loaded().items():
+            journal.record_tab(tab, rows)
+    return sync_tabs(args, cache, tab16, state, sheet, journal)
+
+def resume_journal(journal, sheet=None, cache=None):
+    """
+    เริ่ม journal ของรอบนี้ ถ้ารอบก่อนค้าง: ใส่ tab ที่ดึงไว้แล้วลง cache (ถ้าให้มา) และ replay operation ที่เหลือ
+    คืน (result ที่ต้องหยุดรอบนี้ หรือ None, sheet)
+    """
+    if journal is None:
+        return None, sheet
+    if not journal.resumable:
+        journal.begin()
+        return None, sheet
+    print(f"📓 Resuming interrupted run from {journal.path} "
+          f"({len(journal.tabs)} tabs cached, {len(journal.pending_ops())} pending operations)")
+    if cache is not None:
+        for tab, rows in journal.tabs.items():
+            cache.seed(tab, rows)
+        METRICS.count("journal_tabs_reused", len(journal.tabs))
+    if journal.pending_ops():
+        if sheet is None:
+            with METRICS.phase("sheets_connect"):
+                sheet = setup_google_sheets()
+        with METRICS.phase("journal_replay"):
+            appended, updated, failed = replay_journal(sheet, journal)
+        print(f"📓 Journal replay: {appended} rows added, {updated} statuses updated")
+        if failed:
+            # เก็บ journal ไว้ให้รอบหน้าลองใหม่ ยังไม่ sync ข้อมูลใหม่ทับ
+            return {"error": "journal replay incomplete", "write_failed": True}, sheet
+    journal.begin(keep_tabs=cache is not None)
+    return None, sheet
+
+def fetch_tabs(args, cache, state=None, sheet=None):
+    """
+    ขั้น fetch: โหลดทุก tab เข้า cache (พร้อมกันได้ถ้า backend=http) — เริ่ม tab=16 ก่อนเพราะช้าที่สุด
+    คืน (tab16, sheet): tab16 เป็น None ถ้าอยู่ใน cache ตามปกติ, เป็น list ถ้าแบ่งหน้า, เป็น generator ถ้า stream
+    """
+    workers = args.workers if args.backend == "http" else 1
+    if 16 not in FETCH_TABS:
+        tab16 = None
+    elif args.tab16_page_size > 0:
+        # แบบแบ่งหน้า: ต้องรู้ก่อนว่างานไหนอยู่ในชีตเป็น 'งานที่ปิดแล้ว' แล้ว
+        if sheet is None:
+            with METRICS.phase("sheets_connect"):
+                sheet = setup_google_sheets()
+        known_closed = known_closed_job_nos(sheet, state)
+        print(f"🔎 {len(known_closed)} jobs already closed in sheet/state")
+        with METRICS.phase("fetch_tabs"):
+            tab16 = fetch_jobs_paginated(cache, 16, args.tab16_page_size, known_closed)
+    elif args.stream_tab16:
+        # โหมด stream: tab=16 ไม่ผ่าน cache แต่จะถูกอ่านทีละแถวตอน reconcile
+        tab16 = iter_jobs_by_tab(cache, 16)
+    else:
+        tab16 = None
+    with METRICS.phase("fetch_tabs"):
+        cache.prefetch([t for t in FETCH_TABS if not (t == 16 and tab16 is not None)], workers=workers)
+    return tab16, sheet
+
+def source_builders(cache, tab16=None, stream16=False):
+    """
+    ฟังก์ชันไม่มีอาร์กิวเมนต์ต่อแหล่งใน JOB_SOURCES ที่ parse tab จาก cache เป็น jobs (เรียกเมื่อจำเป็นเท่านั้น)
+    tab16: ผลของ tab=16 ที่ได้มาแบบแบ่งหน้า (list) หรือ stream (generator, stream16=True) แทนการอ่านจาก cache
+    """
+    # ฟังก์ชันช่วยตรวจสอบว่ามีข้อมูลจริงหรือไม่ (สำหรับ regular jobs)
+    def has_valid_data(job_list):
+        if not job_list:
             return False
-        
-        # ฟังก์ชันกรองข้อมูล internal ที่ขึ้นต้นด้วย "บบลนป" เท่านั้น
-        def filter_internal_jobs(job_list):
-            if not job_list:
-                return None
-            filtered = []
-            for job in job_list:
-                if job and len(job) > 0:
-                    job_no = str(job[0]).strip() if job[0] else ""
-                    if job_no.startswith("บบลนป"):
-                        filtered.append(job)
-            return filtered if filtered else None
-        
+        for job in job_list:
+            if job and any(str(cell).strip() for cell in job[:7]):
+                return True
+        return False
+    
+    # ฟังก์ชันกรองข้อมูล internal ที่ขึ้นต้นด้วย "บบลนป" เท่านั้น
+    def filter_internal_jobs(job_list):
+        if not job_list:
+            return None
+        filtered = []
+        for job in job_list:
+            if job and len(job) > 0:
+                job_no = str(job[0]).strip() if job[0] else ""
+                if job_no.lower().startswith(INTERNAL_JOB_PREFIX.lower()):
+                    filtered.append(job)
+        return filtered if filtered else None
+    
+    def valid_or_none(job_list):
+        return job_list if has_valid_data(job_list) else None
+
+    def tab16_jobs():
+        # งานที่ปิดแล้ว (tab 16)
+        if stream16 and tab16 is not None:
+            return tab16
+        return valid_or_none(tab16 if tab16 is not None else fetch_jobs_by_tab(cache, 16))
+
+    return {
+        "tab13": lambda: fetch_new_jobs(cache) or [],                       # tab=13 (เดิม)
+        # ใหม่: ดึงข้อมูลเต็มจาก tab=14 และ tab=15 (เพื่อ 'เติมแถว' ถ้ายังไม่เคยมี)
+        "tab14": lambda: valid_or_none(fetch_jobs_by_tab(cache, 14)),       # เพิ่มใหม่ถ้าไม่พบ → สถานะ 'รอแจ้ง'
+        "tab15": lambda: valid_or_none(fetch_jobs_by_tab(cache, 15)),       # เพิ่มใหม่ถ้าไม่พบ → สถานะ 'ปิดงาน'
+        "tab16": tab16_jobs,
         # งานใหม่ภายในศูนย์
-        internal_new_18 = fetch_jobs_by_tab(driver, 18)
-        internal_new_7 = fetch_jobs_by_tab(driver, 7)
-        internal_new_combined = (internal_new_18 or []) + (internal_new_7 or [])
-        internal_new_jobs = filter_internal_jobs(internal_new_combined)
-        
+        "tab18/7": lambda: filter_internal_jobs((fetch_jobs_by_tab(cache, 18) or []) + (fetch_jobs_by_tab(cache, 7) or [])),
         # ปิดงานภายในศูนย์
-        internal_closed_full_raw = fetch_jobs_by_tab(driver, 11)
-        internal_closed_full = filter_internal_jobs(internal_closed_full_raw)
-        
+        "tab11": lambda: filter_internal_jobs(fetch_jobs_by_tab(cache, 11)),
         # งานที่ปิดแล้ว (ภายในศูนย์)
-        internal_closed_already_raw = fetch_jobs_by_tab(driver, 20)
-        internal_closed_already = filter_internal_jobs(internal_closed_already_raw)
-        
-        # งานที่ปิดแล้ว (tab 16)
-        closed_already_jobs_raw = fetch_jobs_by_tab(driver, 16)
-        closed_already_jobs = closed_already_jobs_raw if has_valid_data(closed_already_jobs_raw) else None
-        
-        # ของเดิม
-        new_jobs = fetch_new_jobs(driver)            # tab=13 (เดิม)
-        closed_job_nos = fetch_closed_jobs(driver)   # tab=15 (set of job_no for update status)
-        
-        # ใหม่: ดึงข้อมูลเต็มจาก tab=14 และ tab=15 (เพื่อ 'เติมแถว' ถ้ายังไม่เคยมี)
-        waiting_jobs_raw = fetch_jobs_by_tab(driver, 14)  # เพิ่มใหม่ถ้าไม่พบ → สถานะ 'รอแจ้ง'
-        waiting_jobs = waiting_jobs_raw if has_valid_data(waiting_jobs_raw) else None
-        
-        closed_jobs_full_raw = fetch_jobs_by_tab(driver, 15)  # เพิ่มใหม่ถ้าไม่พบ → สถานะ 'ปิดงาน'
-        closed_jobs_full = closed_jobs_full_raw if has_valid_data(closed_jobs_full_raw) else None
-        
-        # แสดงสถิติข้อมูล
-        print(f"📊 Data summary:")
-        print(f"   - New jobs (tab13): {len(new_jobs) if new_jobs else 0}")
-        print(f"   - Waiting jobs (tab14): {len(waiting_jobs) if waiting_jobs else 0}")
-        print(f"   - Closed jobs full (tab15): {len(closed_jobs_full) if closed_jobs_full else 0}")
-        print(f"   - Closed already jobs (tab16): {len(closed_already_jobs) if closed_already_jobs else 0}")
-        print(f"   - Internal new jobs (tab18,7): {len(internal_new_jobs) if internal_new_jobs else 0}")
-        print(f"   - Internal closed full (tab11): {len(internal_closed_full) if internal_closed_full else 0}")
-        print(f"   - Internal closed already (tab20): {len(internal_closed_already) if internal_closed_already else 0}")
-        
-        sheet = setup_google_sheets()
+        "tab20": lambda: filter_internal_jobs(fetch_jobs_by_tab(cache, 20)),
+    }
+
+def sync_tabs(args, cache, tab16=None, state=None, sheet=None, journal=None):
+    """
+    ขั้น sync: parse tab จาก cache แล้ว reconcile เข้าชีต
+    ทุก tab โหลดครั้งเดียวผ่าน TabCache แล้วค่อยแจกมุมมองต่าง ๆ (เช่น tab=15 ทั้งแถวเต็มและ set ของ Job No)
+    คืน (result, sheet)
+    """
+    # fingerprint ต่อแหล่งจาก cell ดิบ: แหล่งที่ไม่เปลี่ยนจากรอบก่อนจะส่งไปแบบ lazy (ไม่ parse ถ้าไม่จำเป็น)
+    active = active_sources()
+    fingerprints = {src.name: cache.fingerprint(*src.tabs) for src in active}
+    previous = state.fingerprints() if state is not None else {}
+    unchanged = {name for name, fp in fingerprints.items() if fp and previous.get(name) == fp}
+
+    builders = source_builders(cache, tab16, args.stream_tab16 and not args.tab16_page_size)
+    with METRICS.phase("parse_tabs"):
+        # แหล่งที่ tab ไม่อยู่ใน FETCH_TABS ของ tenant นี้ = ไม่มีข้อมูล (ไม่ดึงเพิ่ม)
+        inputs = {name: (None if name not in fingerprints else build if name in unchanged else build())
+                  for name, build in builders.items()}
+        closed_job_nos = set()
+        if 15 in FETCH_TABS:
+            closed_job_nos = fetch_closed_jobs(cache) or set()   # tab=15 (set of job_no for update status)
+
+    # แสดงสถิติข้อมูล
+    def count(name):
+        jobs = inputs[name]
+        return "unchanged since last run" if callable(jobs) else (len(jobs) if jobs else 0)
+
+    print(f"📊 Data summary:")
+    print(f"   - New jobs (tab13): {count('tab13')}")
+    print(f"   - Waiting jobs (tab14): {count('tab14')}")
+    print(f"   - Closed jobs full (tab15): {count('tab15')}")
+    if args.stream_tab16 and not args.tab16_page_size:
+        print("   - Closed already jobs (tab16): streamed during sync")
+    else:
+        print(f"   - Closed already jobs (tab16): {count('tab16')}")
+    print(f"   - Internal new jobs (tab18,7): {count('tab18/7')}")
+    print(f"   - Internal closed full (tab11): {count('tab11')}")
+    print(f"   - Internal closed already (tab20): {count('tab20')}")
+    
+    if cache.session_expired:
+        # อย่าเอาข้อมูลที่ขาดไปบาง tab ไป sync ให้ผู้เรียก login ใหม่แล้วรันรอบนี้ซ้ำ
+        raise SessionExpiredError("Session expired while fetching tabs")
+
+    if sheet is None:
+        with METRICS.phase("sheets_connect"):
+            sheet = setup_google_sheets()
+    with METRICS.phase("sync"):
         result = update_google_sheets(
             sheet,
-            new_jobs=new_jobs,
+            new_jobs=inputs["tab13"],
             closed_job_nos=closed_job_nos,
-            waiting_jobs=waiting_jobs,
-            closed_jobs_full=closed_jobs_full,
-            closed_already_jobs=closed_already_jobs,  # เพิ่ม tab16
-            internal_new_jobs=internal_new_jobs,
-            internal_closed_full=internal_closed_full,
-            internal_closed_already=internal_closed_already,
+            waiting_jobs=inputs["tab14"],
+            closed_jobs_full=inputs["tab15"],
+            closed_already_jobs=inputs["tab16"],  # เพิ่ม tab16
+            internal_new_jobs=inputs["tab18/7"],
+            internal_closed_full=inputs["tab11"],
+            internal_closed_already=inputs["tab20"],
+            state=state,
+            fingerprints=fingerprints,
+            journal=journal,
+            notifier=load_notifier(args.notify_file),
         )
-        print("✅ Process completed successfully!")
-        print(f"📊 Results: {result}")
+    if cache.session_expired:
+        raise SessionExpiredError("Session expired while streaming tab=16")
+    if journal is not None and not result.get("error") and not result.get("write_failed"):
+        journal.commit()
+    return result, sheet
+
+def run_pipelined(args, client, sheet=None, journal=None):
+    """
+    โหมด pipeline (--pipeline): ผลเท่ากับ run_once แต่ไม่รอให้ดึงครบทุก tab ก่อนแตะชีต
+    - เปิดชีต + อ่านดัชนีใน thread แยก พร้อมกับการดึง tab แรก ๆ
+    - tab ที่ดึงเสร็จเข้าคิว -> แหล่งที่ tab ครบแล้ว (tab13 ต้องรอ tab15 ด้วย) parse + reconcile ทันที
+    - งานที่แหล่งซึ่งยังไม่มาเปลี่ยนผลไม่ได้แล้ว (Reconciler.is_final) ถูก flush ระหว่างที่ tab อื่นยังโหลดอยู่
+    คืน (result, sheet)
+    """
+    cache = TabCache(client)
+    state = StateStore.load(args.state_file) if args.state_file else None
+    failed, sheet = resume_journal(journal, sheet, cache)
+    if failed:
+        return failed, sheet
+    paginated = args.tab16_page_size > 0
+    stream16 = args.stream_tab16 and not paginated
+    tabs = [t for t in FETCH_TABS if not (t == 16 and stream16)]
+    workers = args.workers if args.backend == "http" else 1
+    arrivals = queue.Queue()
+    tab16 = {}  # ผลของ tab=16 แบบแบ่งหน้า (ไม่อยู่ใน cache)
+
+    def open_sheet():
+        with METRICS.phase("sheets_connect"):
+            ws = sheet or setup_google_sheets()
+        with METRICS.phase("sheet_index"):
+            existing, job_col, trusted = load_sheet_index(ws, state)
+        return ws, existing, job_col, trusted, load_archive(ws, existing)
+
+    def load(tab):
+        try:
+            if tab == 16 and paginated:
+                ws = connected.result()[0]
+                known_closed = known_closed_job_nos(ws, state)
+                print(f"🔎 {len(known_closed)} jobs already closed in sheet/state")
+                tab16["jobs"] = fetch_jobs_paginated(cache, 16, args.tab16_page_size, known_closed)
+            else:
+                rows = cache.rows(tab)
+                if journal is not None:
+                    journal.record_tab(tab, rows)
+        except Exception as e:
+            print(f"❌ Fetch task {tab} failed: {e}")
+        finally:
+            arrivals.put(tab)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets") as sheets_pool, \
+            ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="fetch") as fetch_pool:
+        connected = sheets_pool.submit(open_sheet)
+        for tab in tabs:
+            fetch_pool.submit(load, tab)
+        with METRICS.phase("pipeline"):
+            result = _consume_pipeline(cache, connected, arrivals, len(tabs), tab16, stream16, state, journal,
+                                       load_notifier(args.notify_file))
+        if result.get("error"):
+            fetch_pool.shutdown(wait=True, cancel_futures=True)  # ไม่ต้องดึง tab ที่ยังไม่เริ่ม
+    if cache.session_expired:
+        # ที่เขียนไปแล้วมาจาก tab ที่ดึงสำเร็จ (ถูกต้อง) ส่วนที่เหลือรันซ้ำหลัง login ใหม่
+        raise SessionExpiredError("Session expired while fetching tabs")
+    if journal is not None and not result.get("error") and not result.get("write_failed"):
+        journal.commit()
+    try:
+        sheet = connected.result()[0]
+    except Exception:
+        sheet = None
+    return result, sheet
+
+def _consume_pipeline(cache, connected, arrivals, expected, tab16, stream16, state, journal, notifier=None):
+    """ฝั่ง consumer ของ run_pipelined: reconcile แหล่งที่พร้อม แล้ว flush งานที่ตัดสินได้แล้วทีละช่วง"""
+    try:
+        sheet, existing, job_col, trusted, archive = connected.result()
     except Exception as e:
-        print(f"❌ Process failed: {e}")
-        exit(1)
+        print(f"❌ Error updating Google Sheets: {e}")
+        return {"new_added": 0, "updated": 0, "error": str(e)}
+    try:
+        print("✏️ Updating Google Sheets (pipelined)...")
+        reconciler = Reconciler(existing, set(), state if trusted else None, observe=state is not None)
+        writer = SheetWriteBuffer(sheet, journal=journal)
+        previous = state.fingerprints() if trusted else {}
+        fingerprints = {}
+        pending = active_sources()
+        arrived = set()
+        changes = []
+        new_added = updated = 0
+
+        def ready(src):
+            if src.name == "tab16" and stream16:
+                return len(arrived) == expected  # stream ตอนท้าย เมื่อไม่มีการดึงอื่นใช้ client อยู่
+            if not all(t in arrived for t in src.tabs):
+                return False
+            # tab ที่พังจะถูกลองโหลดใหม่ตอน parse -> รอจนการดึงอื่นจบก่อน (driver ใช้ได้ทีละ thread)
+            return len(arrived) == expected or not any(t in cache.errors for t in src.tabs)
+
+        while pending:
+            if len(arrived) < expected:
+                arrived.add(arrivals.get())
+            if cache.session_expired:
+                break
+            batch = [src for src in pending if ready(src)]
+            if not batch:
+                continue
+            for src in batch:
+                pending.remove(src)
+                fp = fingerprints[src.name] = cache.fingerprint(*src.tabs)
+                if fp and previous.get(src.name) == fp:
+                    reconciler.skip(src)
+                    continue
+                if src.name == "tab13":
+                    reconciler.closed_job_nos = fetch_closed_jobs(cache) or set()
+                value = (iter_jobs_by_tab(cache, 16) if stream16 else tab16.get("jobs")) if src.name == "tab16" else None
+                with METRICS.phase("parse_tabs"):
+                    jobs = source_builders(cache, value, stream16)[src.name]()
+                with METRICS.phase("reconcile"):
+                    reconciler.add(src, jobs)
+            if trusted:
+                refresh_statuses(sheet, existing, reconciler.known_job_nos(pending))
+            changes += reconciler.plan(writer, pending)
+            with METRICS.phase("flush"):
+                n_added, n_updated = writer.flush()
+            new_added += n_added
+            updated += n_updated
+            if pending and reconciler.records:
+                print(f"⏳ Waiting for {', '.join(src.name for src in pending)} "
+                      f"({len(reconciler.records)} jobs held back)")
+
+        if cache.session_expired:
+            return {"new_added": new_added, "updated": updated, "error": "session expired"}
+        reconciler.skipped_sources.sort(key=SOURCE_ORDER.get)
+        return _finish_sync(sheet, state, writer, reconciler, archive, notifier, changes,
+                            job_col, existing, trusted, fingerprints, new_added, updated)
+    except Exception as e:
+        print(f"❌ Error updating Google Sheets: {e}")
+        return {"new_added": 0, "updated": 0, "error": str(e)}
+
+# ====== Snapshot (แยกขั้น fetch / sync) ======
+# `job_fetcher.py fetch` เขียน cell ดิบของทุก tab ลงไฟล์ JSON lines แล้ว `job_fetcher.py sync` อ่านไป sync เข้าชีต
+# (fetch รันบนเครื่องที่มี Chrome ได้ ส่วน sync รันบนเครื่องเปล่า ๆ ที่มีแค่ gspread)
+#   {"type": "snapshot", "version": 1, "created_at": ..., "backend": ..., "base_url": ...}   บรรทัดแรกเสมอ
+#   {"type": "row", "tab": 13, "cells": [...]}                                                หนึ่งบรรทัดต่อแถว
+#   {"type": "tab", "tab": 13, "rows": 120, "seconds": 1.2, "fingerprint": "...", "error": null}
+# record "tab" เขียนหลังแถวสุดท้ายของ tab นั้น: tab ที่ไม่มี record นี้ (ไฟล์ขาด) ถือว่าดึงไม่สำเร็จ
+SNAPSHOT_FILE = os.getenv('SNAPSHOT_FILE', 'jobm_snapshot.jsonl')
+SNAPSHOT_VERSION = 1
+
+class SnapshotWriter:
+    """เขียน snapshot ลงไฟล์ชั่วคราวแล้วค่อย os.replace ตอน close (ผู้อ่านไม่เจอไฟล์ครึ่ง ๆ)"""
+
+    def __init__(self, path, **meta):
+        self.path = path
+        self.tmp = f"{path}.tmp"
+        self.tabs = {}     # tab -> จำนวนแถวที่เขียน
+        self.errors = {}   # tab -> exception ของ tab ที่ดึงไม่สำเร็จ
+        self._f = open(self.tmp, "w", encoding="utf-8")
+        self._write({"type": "snapshot", "version": SNAPSHOT_VERSION,
+                     "created_at": datetime.now().isoformat(timespec="seconds"), **meta})
+
+    def _write(self, record):
+        self._f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def write_tab(self, tab, rows, seconds=None, error=None):
+        """rows เป็น iterable ได้ (เช่นแถวแบบ stream ของ tab=16) คืนจำนวนแถวที่เขียน"""
+        tab, count, digest = int(tab), 0, hashlib.sha1(f"tab={int(tab)}\n".encode("utf-8"))
+        start = time.perf_counter()
+        try:
+            for cells in rows:
+                self._write({"type": "row", "tab": tab, "cells": cells})
+                digest.update("\x1f".join(cells).encode("utf-8"))
+                digest.update(b"\x1e")
+                count += 1
+        except Exception as e:
+            error = error or e
+        if seconds is None:
+            seconds = time.perf_counter() - start
+        self.tabs[tab] = count
+        if error:
+            self.errors[tab] = error
+        self._write({"type": "tab", "tab": tab, "rows": count, "seconds": round(seconds, 3),
+                     "fingerprint": None if error else digest.hexdigest()[:16],
+                     "error": str(error) if error else None})
+        return count
+
+    def close(self):
+        self._f.close()
+        os.replace(self.tmp, self.path)
+
+def _snapshot_records(path):
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "null")
+        if not isinstance(header, dict) or header.get("type") != "snapshot":
+            raise ValueError(f"{path} is not a job snapshot")
+        if int(header.get("version", 0)) > SNAPSHOT_VERSION:
+            raise ValueError(f"{path} has snapshot version {header.get('version')}; "
+                             f"this script reads up to version {SNAPSHOT_VERSION}")
+        yield header
+        for line in f:
+            yield json.loads(line)
+
+def read_snapshot(path, skip_tabs=()):
+    """
+    อ่าน snapshot คืน (header, {tab: rows}, {tab: error}) — tab ใน skip_tabs ไม่ถูกเก็บเข้า memory
+    (ใช้ iter_snapshot_rows อ่านทีละแถวแทน)
+    """
+    records = _snapshot_records(path)
+    header = next(records)
+    rows, done, errors = {}, set(), {}
+    for rec in records:
+        tab = int(rec["tab"])
+        if rec["type"] == "row":
+            if tab not in skip_tabs:
+                rows.setdefault(tab, []).append(rec["cells"])
+        elif rec["type"] == "tab":
+            done.add(tab)
+            if tab not in skip_tabs:
+                rows.setdefault(tab, [])  # tab ว่างก็ถือว่าดึงสำเร็จ
+            if rec.get("error"):
+                errors[tab] = rec["error"]
+    for tab in set(rows) - done:
+        errors.setdefault(tab, "truncated in snapshot")
+    return header, {t: r for t, r in rows.items() if t in done and t not in errors}, errors
+
+def iter_snapshot_rows(path, tab):
+    """yield cell ของ tab จาก snapshot ทีละแถว (memory ไม่โตตามจำนวนแถว)"""
+    tab = int(tab)
+    for rec in _snapshot_records(path):
+        if rec.get("type") == "row" and int(rec["tab"]) == tab:
+            yield rec["cells"]
+
+def run_fetch(args, client):
+    """ขั้น fetch อย่างเดียว: ดึงทุก tab แล้วเขียน snapshot (ไม่แตะ Google Sheets) คืน (result, None)"""
+    cache = TabCache(client)
+    with METRICS.phase("fetch_tabs"):
+        cache.prefetch([t for t in FETCH_TABS if not (t == 16 and args.stream_tab16)],
+                       workers=args.workers if args.backend == "http" else 1)
+    if cache.session_expired:
+        raise SessionExpiredError("Session expired while fetching tabs")
+    writer = SnapshotWriter(args.snapshot, backend=args.backend, base_url=BASE_URL)
+    try:
+        with METRICS.phase("write_snapshot"):
+            for tab in FETCH_TABS:
+                if tab == 16 and args.stream_tab16:
+                    # cell ของ tab=16 เขียนลงไฟล์ตรง ๆ ทีละแถว ไม่ผ่าน memory
+                    print(f"📥 Streaming tab={tab} into snapshot ...")
+                    start = time.perf_counter()
+                    count = writer.write_tab(tab, iter_table_rows(client, tab_url(tab), tab_wait_sec(tab)))
+                    METRICS.tab(tab, time.perf_counter() - start, count)
+                else:
+                    rows = cache.loaded().get(tab)
+                    writer.write_tab(tab, rows or [], seconds=METRICS.tabs.get(str(tab), {}).get("seconds", 0.0),
+                                     error=cache.errors.get(tab) or (None if rows is not None else "not fetched"))
     finally:
+        writer.close()
+    if any(isinstance(e, SessionExpiredError) for e in writer.errors.values()):
+        raise SessionExpiredError("Session expired while streaming tab=16")
+    print(f"💾 Wrote snapshot of {len(writer.tabs)} tabs ({sum(writer.tabs.values())} rows) to {args.snapshot}")
+    return {"snapshot": args.snapshot, "tabs": writer.tabs}, None
+
+def run_sync(args, sheet=None, journal=None):
+    """ขั้น sync อย่างเดียว: อ่าน snapshot ที่ได้จาก `fetch` แล้ว sync เข้าชีต (ไม่ต้องมี Chrome/selenium)"""
+    stream16 = args.stream_tab16
+    with METRICS.phase("read_snapshot"):
+        header, rows, errors = read_snapshot(args.snapshot, skip_tabs=(16,) if stream16 else ())
+    print(f"📂 Snapshot {args.snapshot} (v{header.get('version')}, fetched {header.get('created_at')} "
+          f"via {header.get('backend')}): {len(rows)} tabs")
+    cache = TabCache(None)
+    for tab, tab_rows in rows.items():
+        cache.seed(tab, tab_rows)
+    for tab, error in errors.items():
+        print(f"⚠️ tab={tab} missing from snapshot: {error}")
+        cache.record_error(tab, RuntimeError(error))
+    tab16 = None
+    if stream16:
+        tab16 = (parsed for parsed in (parse_row_by_tab(cells, 16) for cells in iter_snapshot_rows(args.snapshot, 16))
+                 if parsed)
+    state = StateStore.load(args.state_file) if args.state_file else None
+    failed, sheet = resume_journal(journal, sheet)
+    if failed:
+        return failed, sheet
+    return sync_tabs(args, cache, tab16, state, sheet, journal)
+
+class FetchSession:
+    """
+    driver/client + sheet ที่เปิดค้างไว้ใช้ซ้ำได้หลายรอบ (โหมด daemon)
+    ถ้า session หมดอายุ จะ login ใหม่แล้วรันรอบนั้นซ้ำหนึ่งครั้ง โดยไม่ต้อง restart process
+    args.command เลือกขั้นที่รัน: run (fetch + sync), fetch (ไม่เปิดชีต), sync (ไม่เปิด browser)
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.session_cache = SessionCache(args.session_file, SESSION_KEY) if args.session_file else None
+        self.journal_file = args.journal_file
+        self.driver = None
+        self.client = None
+        self.sheet = None
+
+    def connect(self):
+        if self.client is None:
+            self.driver, self.client = open_fetch_client(self.args.backend, self.args.workers, self.session_cache,
+                                                         scrape_profile=self.args.scrape_profile)
+
+    def relogin(self):
+        print("🔐 Session expired; logging in again")
+        if self.session_cache is not None:
+            self.session_cache.invalidate()
+        self.close_client()
+        self.connect()
+
+    def run_stage(self):
+        if self.args.command == "fetch":
+            return run_fetch(self.args, self.client)
+        if self.args.command == "sync":
+            return run_sync(self.args, self.sheet, self.load_journal())
+        if self.args.pipeline:
+            return run_pipelined(self.args, self.client, self.sheet, self.load_journal())
+        return run_once(self.args, self.client, self.sheet, self.load_journal())
+
+    def run(self):
+        METRICS.reset()
+        result, error = None, None
+        try:
+            if self.args.command == "sync":
+                result, self.sheet = self.run_stage()
+            else:
+                self.connect()
+                try:
+                    result, self.sheet = self.run_stage()
+                except SessionExpiredError as e:
+                    print(f"⚠️ {e}")
+                    METRICS.count("relogins")
+                    self.relogin()
+                    # tab ที่ดึงสำเร็จก่อน session หมดอายุอยู่ใน journal แล้ว -> ดึงใหม่เฉพาะที่เหลือ
+                    result, self.sheet = self.run_stage()
+            if result.get("error"):
+                self.sheet = None  # เปิดชีตใหม่รอบหน้า (เช่น token/การเชื่อมต่อเสีย)
+            return result
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.write_metrics(result, error)
+
+    def load_journal(self):
+        return RunJournal.load(self.journal_file) if self.journal_file else None
+
+    def write_metrics(self, result, error=None):
+        if not (self.args.metrics_file or self.args.metrics_prom):
+            return
+        data = METRICS.write(self.args.metrics_file, self.args.metrics_prom, backend=self.args.backend, command=self.args.command,
+                             result=result, error=error or (result or {}).get("error"))
+        slowest = sorted(data["phases"].items(), key=lambda kv: kv[1], reverse=True)[:3]
+        print(f"⏱️ {data['duration_seconds']}s total; slowest: "
+              + ", ".join(f"{k} {v}s" for k, v in slowest)
+              + f"; sheets API calls: {METRICS.total('sheets_api_calls')}")
+
+    def close_client(self):
+        client, driver = self.client, self.driver
+        self.client = self.driver = None
+        if isinstance(client, HttpTabClient):
+            client.close()
         if driver:
             try:
                 driver.quit()
@@ -790,6 +3419,326 @@ def main():
             except Exception as e:
                 print(f"⚠️ Error closing driver: {e}")
 
+    def close(self):
+        self.close_client()
+        self.sheet = None
+
+def _parse_range(text):
+    lo, _, hi = str(text).partition("-")
+    return int(lo), int(hi or lo)
+
+def in_business_hours(now=None):
+    """ตรงกับเงื่อนไขเดิมใน workflow: BUSINESS_DAYS และ BUSINESS_HOURS ตามเวลา BUSINESS_TZ"""
+    now = now or datetime.now(ZoneInfo(BUSINESS_TZ))
+    first_day, last_day = _parse_range(BUSINESS_DAYS)
+    start, end = _parse_range(BUSINESS_HOURS)
+    return first_day <= now.isoweekday() <= last_day and start <= now.hour < end
+
+def seconds_until_business_hours(now=None):
+    """จำนวนวินาทีจนถึงต้นชั่วโมงทำการถัดไป (0 ถ้าอยู่ในเวลาทำการแล้ว)"""
+    now = now or datetime.now(ZoneInfo(BUSINESS_TZ))
+    if in_business_hours(now):
+        return 0
+    start, _ = _parse_range(BUSINESS_HOURS)
+    candidate = now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    while not in_business_hours(candidate):
+        candidate += timedelta(days=1)
+    return (candidate - now).total_seconds()
+
+def next_poll_interval(interval, result, base=POLL_INTERVAL_SEC, maximum=POLL_MAX_INTERVAL_SEC):
+    """มีการเปลี่ยนแปลง -> กลับไปใช้ base; ไม่มีอะไรใหม่ (หรือพัง) -> ยืดเป็น 2 เท่าจนถึง maximum"""
+    if result and not result.get("error") and (result.get("new_added") or result.get("updated")):
+        return base
+    return min(max(interval, base) * 2, maximum)
+
+def run_daemon(args):
+    """poll ซ้ำไปเรื่อย ๆ ด้วย browser/session และ sheet ชุดเดิม (หยุดด้วย Ctrl+C / SIGTERM)"""
+    import signal
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    session = FetchSession(args)
+    interval = args.poll_interval
+    try:
+        while True:
+            wait = seconds_until_business_hours()
+            if wait:
+                # ปิด browser ระหว่างรอเวลาทำการ ไม่ต้องถือ memory ข้ามคืน
+                session.close_client()
+                print(f"😴 Outside business hours; sleeping {wait / 3600:.1f}h")
+                time.sleep(wait)
+                interval = args.poll_interval
+                continue
+
+            print(f"🔁 Poll at {datetime.now(ZoneInfo(BUSINESS_TZ))}")
+            try:
+                result = session.run()
+                print(f"📊 Results: {result}")
+            except Exception as e:
+                print(f"❌ Poll failed: {e}")
+                result = None
+                session.close_client()  # เริ่ม browser/session ใหม่รอบหน้า
+            interval = next_poll_interval(interval, result, args.poll_interval, args.max_poll_interval)
+            print(f"⏳ Next poll in {interval}s")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("👋 Daemon stopped")
+    finally:
+        session.close()
+
+# ====== Multi-tenant (หลายบัญชี/ศูนย์ -> หลายชีต) ======
+# ไฟล์ JSON รายชื่อ tenant: แต่ละ tenant รันใน process ของตัวเอง (driver/session/state แยกกัน)
+# ใช้ quota ของ Sheets ร่วมกัน (service account เดียว) และ tenant ที่ช้า/พังไม่ทำให้ tenant อื่นรอ
+TENANTS_FILE = os.getenv('TENANTS_FILE', '')
+TENANT_WORKERS = int(os.getenv('TENANT_WORKERS', '2'))                 # จำนวน tenant ที่รันพร้อมกัน
+TENANT_TIMEOUT_SEC = float(os.getenv('TENANT_TIMEOUT_SEC', '900'))     # เกินนี้หยุด tenant นั้น (tenant อื่นรันต่อ)
+TENANT_NAME_PAT = re.compile(r"^[A-Za-z0-9_-]+$")
+TENANT_KEYS = {"name", "username_env", "password_env", "sheet_key", "sheet_url", "sheet_name",
+               "internal_center", "internal_prefix", "tabs", "args", "timeout_sec", "line_to"}
+
+def load_tenants(path):
+    """
+    อ่านไฟล์ tenant: {"tenants": [...]} หรือ list ตรง ๆ แต่ละ tenant เป็น dict:
+    - name                        : ชื่อ (A-Z a-z 0-9 _ -) ต่อท้ายไฟล์ state/journal/session/snapshot/metrics
+    - username_env / password_env : ชื่อ env ที่เก็บ user/password (default USERNAME / PASSWORD) ไม่เก็บรหัสในไฟล์
+    - sheet_key หรือ sheet_url    : ชีตปลายทาง (ต้องมี), sheet_name: ชื่อแผ่นงาน (default ชีต1)
+    - internal_center / internal_prefix : ชื่อศูนย์ภายใน และ prefix Job No ของงานภายใน
+    - tabs                        : tab ที่ดึง (default = FETCH_TABS; แหล่งที่ขาด tab จะไม่ถูก reconcile)
+    - line_to                     : ปลายทาง LINE ของ tenant นี้ (default LINE_TO)
+    - args                        : option เพิ่มเฉพาะ tenant เช่น ["--backend", "http"]
+    - timeout_sec                 : เวลาสูงสุดของ tenant นี้ (default TENANT_TIMEOUT_SEC)
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    tenants = data.get("tenants") if isinstance(data, dict) else data
+    if not isinstance(tenants, list) or not tenants:
+        raise ValueError(f"{path}: expected a non-empty list of tenants")
+    names, targets = set(), set()
+    for tenant in tenants:
+        name = tenant.get("name", "") if isinstance(tenant, dict) else ""
+        if not TENANT_NAME_PAT.match(str(name)):
+            raise ValueError(f"{path}: tenant name {name!r} must match {TENANT_NAME_PAT.pattern}")
+        if name in names:
+            raise ValueError(f"{path}: duplicate tenant {name!r}")
+        names.add(name)
+        unknown = set(tenant) - TENANT_KEYS
+        if unknown:
+            raise ValueError(f"{path}: tenant {name!r} has unknown keys: {', '.join(sorted(unknown))}")
+        if not (tenant.get("sheet_key") or tenant.get("sheet_url")):
+            raise ValueError(f"{path}: tenant {name!r} needs sheet_key or sheet_url")
+        target = (tenant.get("sheet_key") or tenant.get("sheet_url"), tenant.get("sheet_name", "ชีต1"))
+        if target in targets:
+            raise ValueError(f"{path}: tenant {name!r} writes to the same worksheet as another tenant")
+        targets.add(target)
+        tabs = tenant.get("tabs")
+        if tabs is not None and (not tabs or not set(tabs) <= set(FETCH_TABS)):
+            raise ValueError(f"{path}: tenant {name!r} tabs must be a non-empty subset of {list(FETCH_TABS)}")
+    return tenants
+
+def tenant_path(path, name):
+    """jobm_state.json -> jobm_state.<name>.json ('' = ปิด คงเป็น '')"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+def apply_tenant(tenant):
+    """ตั้ง env/ค่าคงที่ของ process นี้ให้เป็นของ tenant (เรียกใน process ลูกเท่านั้น)"""
+    global GOOGLE_SHEET_URL, GOOGLE_SHEET_NAME, INTERNAL_CENTER, INTERNAL_JOB_PREFIX, FETCH_TABS, LINE_TO
+    for key, env in (("USERNAME", tenant.get("username_env", "USERNAME")),
+                     ("PASSWORD", tenant.get("password_env", "PASSWORD"))):
+        value = os.getenv(env)
+        if value is None:
+            os.environ.pop(key, None)  # ห้ามใช้รหัสของ tenant อื่นแทน
+        else:
+            os.environ[key] = value
+    GOOGLE_SHEET_URL = tenant.get("sheet_url", "")
+    GOOGLE_SHEET_NAME = tenant.get("sheet_name", "ชีต1")
+    for key, value in (("GOOGLE_SHEET_KEY", tenant.get("sheet_key", "")), ("GOOGLE_SHEET_URL", GOOGLE_SHEET_URL),
+                       ("GOOGLE_SHEET_NAME", GOOGLE_SHEET_NAME)):
+        os.environ[key] = value
+    INTERNAL_CENTER = tenant.get("internal_center", INTERNAL_CENTER)
+    prefix = tenant.get("internal_prefix", INTERNAL_JOB_PREFIX)
+    for src in JOB_SOURCES:
+        if src.prefix and src.prefix == normalize_job_no(INTERNAL_JOB_PREFIX):
+            src.prefix = normalize_job_no(prefix)
+    INTERNAL_JOB_PREFIX = prefix
+    if tenant.get("tabs"):
+        FETCH_TABS = tuple(int(t) for t in tenant["tabs"])
+    LINE_TO = tenant.get("line_to", LINE_TO)
+
+class _PrefixedStream:
+    """
+    stdout ของ process ลูก: เติม [ชื่อ tenant] หน้าทุกบรรทัด ให้ log ที่ปนกันยังอ่านออก
+    เก็บบรรทัดที่ยังไม่จบไว้แยกต่อ thread (print เขียนข้อความกับ newline แยกกัน)
+    """
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        *lines, rest = (getattr(self._local, "pending", "") + text).split("\n")
+        self._local.pending = rest
+        if lines:
+            with self._lock:
+                self.stream.write("".join(f"{self.prefix}{line}\n" for line in lines))
+                self.stream.flush()
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def run_tenant(tenant, argv, buckets, results):
+    """process ลูกของ run_tenants: รัน 1 รอบของ tenant แล้วส่งสรุปกลับทาง results (Queue)"""
+    global SHARED_SHEETS_BUCKETS
+    import signal
+    import sys
+
+    def stop(signum, frame):
+        raise SystemExit("stopped (timeout)")
+    signal.signal(signal.SIGTERM, stop)  # ให้ finally ได้ปิด browser ก่อนออก
+
+    name = tenant["name"]
+    sys.stdout = _PrefixedStream(sys.stdout, f"[{name}] ")
+    start = time.perf_counter()
+    summary = {"tenant": name, "status": "error"}
+    session = None
+    try:
+        apply_tenant(tenant)
+        SHARED_SHEETS_BUCKETS = buckets
+        args = parse_args(list(argv) + [str(a) for a in tenant.get("args", ())])
+        for attr in ("state_file", "journal_file", "session_file", "snapshot", "metrics_file", "metrics_prom",
+                     "notify_file"):
+            setattr(args, attr, tenant_path(getattr(args, attr), name))
+        session = FetchSession(args)
+        result = session.run()
+        summary.update(status="error" if result.get("error") else "ok", result=result)
+    except BaseException as e:  # รวม SystemExit จาก SIGTERM / argparse
+        print(f"❌ Tenant failed: {e}")
+        summary["error"] = str(e) or type(e).__name__
+    finally:
+        if session is not None:
+            session.close()
+        summary["seconds"] = round(time.perf_counter() - start, 1)
+        results.put(summary)
+
+TENANT_STOP_GRACE_SEC = 15  # หลัง SIGTERM ให้เวลาปิด browser เท่านี้ก่อน kill
+
+def _reap_stopping(stopping, now=None):
+    """kill process ที่ได้ SIGTERM ไปแล้วแต่ยังไม่ออกภายในเวลา (ไม่ block ลูปหลัก)"""
+    now = time.monotonic() if now is None else now
+    for process, kill_at in list(stopping):
+        if not process.is_alive():
+            process.join()
+        elif now >= kill_at:
+            process.kill()
+            process.join()
+        else:
+            continue
+        stopping.remove((process, kill_at))
+
+def run_tenants(path, argv=(), workers=TENANT_WORKERS, timeout=TENANT_TIMEOUT_SEC):
+    """
+    รันทุก tenant ในไฟล์ config ด้วย process pool ขนาด workers (spawn: ไม่แชร์ driver/thread กับ process แม่)
+    tenant ที่เกินเวลาถูกหยุดเฉพาะตัว ส่วนที่ยังรอคิวรันต่อได้ทันที
+    คืน list สรุปต่อ tenant ตามลำดับในไฟล์: {"tenant", "status": ok|error|timeout|crashed, "seconds", "result"/"error"}
+    """
+    import multiprocessing
+    tenants = load_tenants(path)
+    ctx = multiprocessing.get_context("spawn")
+    buckets = (SharedTokenBucket(SHEETS_READS_PER_MIN, ctx=ctx), SharedTokenBucket(SHEETS_WRITES_PER_MIN, ctx=ctx))
+    results = ctx.Queue()
+    waiting = list(tenants)
+    running = {}     # name -> (process, deadline, started)
+    stopping = []    # (process, เวลาที่จะ kill) ของ tenant ที่หมดเวลาแล้ว
+    summaries = {}
+    print(f"🏢 {len(tenants)} tenants from {path}, {max(1, workers)} at a time")
+    try:
+        while waiting or running:
+            while waiting and len(running) < max(1, workers):
+                tenant = waiting.pop(0)
+                process = ctx.Process(target=run_tenant, args=(tenant, list(argv), buckets, results),
+                                      name=f"tenant-{tenant['name']}")
+                process.start()
+                limit = float(tenant.get("timeout_sec") or timeout)
+                running[tenant["name"]] = (process, time.monotonic() + limit, time.perf_counter())
+                print(f"🏢 Started tenant {tenant['name']} (pid {process.pid}, timeout {limit:.0f}s)")
+            try:
+                summary = results.get(timeout=1)
+            except queue.Empty:
+                summary = None
+            if summary is not None and summary["tenant"] in running:
+                running.pop(summary["tenant"])[0].join()
+                summaries[summary["tenant"]] = summary
+            now = time.monotonic()
+            for name, (process, deadline, started) in list(running.items()):
+                if now >= deadline:
+                    print(f"⏰ Tenant {name} ran past its timeout; stopping it")
+                    process.terminate()
+                    stopping.append((process, now + TENANT_STOP_GRACE_SEC))
+                    status, error = "timeout", "stopped after timeout"
+                elif not process.is_alive() and process.exitcode != 0:
+                    # ตายโดยไม่ได้ส่งสรุป (เช่นโดน kill / หน่วยความจำหมด)
+                    status, error = "crashed", f"exited with code {process.exitcode}"
+                else:
+                    continue
+                running.pop(name)
+                summaries[name] = {"tenant": name, "status": status, "error": error,
+                                   "seconds": round(time.perf_counter() - started, 1)}
+            _reap_stopping(stopping, now)
+        while stopping:
+            time.sleep(0.5)
+            _reap_stopping(stopping)
+    finally:
+        for process, _, _ in running.values():
+            process.terminate()
+            stopping.append((process, time.monotonic() + TENANT_STOP_GRACE_SEC))
+        while stopping:
+            time.sleep(0.5)
+            _reap_stopping(stopping)
+
+    print("🏢 Tenant summary:")
+    icons = {"ok": "✅", "timeout": "⏰"}
+    for tenant in tenants:
+        summary = summaries[tenant["name"]]
+        detail = summary.get("result") or summary.get("error")
+        print(f"   {icons.get(summary['status'], '❌')} {tenant['name']}: {summary['status']} "
+              f"in {summary['seconds']}s - {detail}")
+    return [summaries[tenant["name"]] for tenant in tenants]
+
+def main(argv=None):
+    import sys
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
+    print(f"🚀 Starting job fetch process ({args.command}) at {datetime.now()}")
+    if args.command != "sync":
+        print(f"🔧 Fetch backend: {args.backend}")
+    if args.daemon:
+        run_daemon(args)
+        return
+    if args.tenants:
+        summaries = run_tenants(args.tenants, argv, args.tenant_workers, args.tenant_timeout)
+        if any(s["status"] != "ok" for s in summaries):
+            exit(1)
+        return
+    session = FetchSession(args)
+    try:
+        result = session.run()
+        print("✅ Process completed successfully!")
+        print(f"📊 Results: {result}")
+    except Exception as e:
+        print(f"❌ Process failed: {e}")
+        exit(1)
+    finally:
+        session.close()
+
 
 if __name__ == "__main__":
     main()
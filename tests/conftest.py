@@ -0,0 +1,5 @@
+import os
+import sys
+
+# โมดูลของ repo (job_fetcher.py ฯลฯ) อยู่ที่ root ไม่ได้เป็น package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,56 @@
+"""
+run_tenant สำหรับเทสต์: run_tenants ใช้ spawn -> process ลูก import job_fetcher ใหม่
+จึงต้องแทนเว็บ/ชีตด้วยของปลอมในโมดูลที่ process ลูก import ได้ (ไม่ใช่ใน test module)
+"""
+import json
+import os
+
+import job_fetcher as jf
+from benchmark import FakeWorksheet
+
+HEADER = ["Job No"] + ["c"] * 6 + ["Status"]
+
+
+def cells(job_no, i=1, tab=13):
+    if tab == 16:  # tab16 จริงมี Job No อยู่คอลัมน์ที่ 3
+        return [str(i), "เรื่อง", job_no, "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]
+    return [str(i), job_no, "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]
+
+
+# หน้าเว็บของแต่ละบัญชี: งานภายในของทั้งสองศูนย์ปนกันใน tab18 (เว็บจริงแสดงตามสิทธิ์ของบัญชี)
+PAGES = {
+    "user_a": {13: [cells("No1")], 16: [cells("AAA9", tab=16)], 18: [cells("AAA1"), cells("BBB1", 2)]},
+    "user_b": {13: [cells("No2")], 16: [cells("BBB9", tab=16)], 18: [cells("BBB1"), cells("AAA1", 2)]},
+}
+
+
+class FakeClient(jf.HttpTabClient):
+    def __init__(self, user):
+        super().__init__([])
+        self.pages = PAGES[user]
+
+    def load_table_rows(self, url, wait_sec=30):
+        tab = int(url.split("tab=")[1].split("&")[0])
+        return [list(c) for c in self.pages.get(tab, [])]
+
+
+def run_tenant(tenant, argv, buckets, results):
+    """แทน open_fetch_client/setup_google_sheets แล้วเรียก run_tenant ตัวจริง เขียนชีตผลลัพธ์ลง FAKE_TENANT_DIR"""
+    sheets = {}
+
+    def open_fetch_client(backend, workers=1, session_cache=None, scrape_profile=False):
+        return None, FakeClient(jf.require_env("USERNAME"))
+
+    def setup_google_sheets():
+        sheets["sheet"] = FakeWorksheet([list(HEADER)])
+        return jf.QuotaAwareSheet(sheets["sheet"])
+
+    jf.open_fetch_client = open_fetch_client
+    jf.setup_google_sheets = setup_google_sheets
+    try:
+        jf.run_tenant(tenant, argv, buckets, results)
+    finally:
+        out = os.path.join(os.environ["FAKE_TENANT_DIR"], f"{tenant['name']}.json")
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"rows": sheets["sheet"].rows if sheets else None,
+                       "shared_buckets": jf.SHARED_SHEETS_BUCKETS is not None}, f, ensure_ascii=False)
@@ -0,0 +1,148 @@
+"""SheetArchive: ย้ายแถว 'งานที่ปิดแล้ว' ที่เก่าไปชีต archive แล้วลบจากชีตหลักโดย state ยังตรงกับชีต"""
+import contextlib
+import io
+from datetime import date
+
+import pytest
+
+import job_fetcher as jf
+from benchmark import FakeSpreadsheet, FakeWorksheet
+
+HEADER = ["Job No"] + ["c"] * 6 + ["Status"]
+CLOSED = "งานที่ปิดแล้ว"
+
+
+def row(job_no, status):
+    return [job_no] + [f"{job_no}-{i}" for i in range(1, 7)] + [status]
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def col_a(ws):
+    return [r[0] for r in ws.rows[1:]]
+
+
+def on_day(monkeypatch, day):
+    monkeypatch.setattr(jf, "archive_today", lambda: day)
+
+
+def save_state(path, sheet, writer=None):
+    """บันทึก state จากชีตทั้งชีต (เหมือนรอบ sync ที่ไม่มีอะไรเปลี่ยน)"""
+    state = jf.StateStore.load(str(path))
+    index, job_col, _ = quiet(jf.load_sheet_index, sheet)
+    quiet(state.save, job_col, index, writer or jf.SheetWriteBuffer(sheet), {})
+    return state
+
+
+@pytest.fixture
+def synced(tmp_path, monkeypatch):
+    """
+    ชีตหลัก 7 งาน + state ที่เห็น No1 ปิดตั้งแต่ 2025-12-20 และที่เหลือตั้งแต่ 2026-01-10
+    แถว: 2 No1 ✔, 3 No2, 4 No3 ✔, 5 No4 ✔, 6 No5 ✔, 7 No6 ✔, 8 No7  (✔ = งานที่ปิดแล้ว)
+    """
+    sheet = FakeWorksheet([HEADER, row("No1", CLOSED), row("No2", "รอแจ้ง"), row("No3", "ปิดงาน"),
+                           row("No4", "ปิดงาน"), row("No5", "ปิดงาน"), row("No6", "ปิดงาน"), row("No7", "ปิดงาน")])
+    FakeSpreadsheet(sheet)
+    path = tmp_path / "state.json"
+    on_day(monkeypatch, date(2025, 12, 20))
+    save_state(path, sheet)
+    for r in sheet.rows[3:7]:
+        r[7] = CLOSED
+    on_day(monkeypatch, date(2026, 1, 10))
+    state = save_state(path, sheet)
+    assert state.closed_since() == {"no1": "2025-12-20", "no3": "2026-01-10", "no4": "2026-01-10",
+                                    "no5": "2026-01-10", "no6": "2026-01-10"}
+    return sheet, path
+
+
+def test_delete_row_requests_merge_ranges_bottom_up():
+    requests = jf._delete_row_requests(7, [2, 4, 5, 9, 10, 11, 4])
+    assert [(r["deleteDimension"]["range"]["startIndex"], r["deleteDimension"]["range"]["endIndex"])
+            for r in requests] == [(8, 11), (3, 5), (1, 2)]
+    assert {r["deleteDimension"]["range"]["sheetId"] for r in requests} == {7}
+
+
+def test_run_moves_due_rows_and_shifts_state(synced):
+    sheet, path = synced
+    sheet.rows[5][7] = "ปิดงาน"  # No5 ถูกแก้ในชีตหลังรอบก่อน -> ต้องไม่ย้าย
+    state = jf.StateStore.load(str(path))
+    archive = quiet(jf.SheetArchive.load, sheet)
+
+    moved = quiet(archive.run, sheet, state, days=30, period="year", today=date(2026, 2, 15))
+
+    assert moved == 4
+    assert col_a(sheet) == ["No2", "No5", "No7"]
+    book = sheet.spreadsheet
+    ranges = [(r["deleteDimension"]["range"]["startIndex"], r["deleteDimension"]["range"]["endIndex"])
+              for r in book.requests]
+    assert ranges == [(6, 7), (3, 5), (1, 2)]  # แถว 7, 4-5, 2 จากล่างขึ้นบน
+    assert book.worksheet("ปิดแล้ว 2025").rows == [HEADER, row("No1", CLOSED)]
+    assert book.worksheet("ปิดแล้ว 2026").rows == [HEADER, row("No3", CLOSED), row("No4", CLOSED), row("No6", CLOSED)]
+    assert archive.job_nos == {"no1", "no3", "no4", "no6"}
+
+    # state ถูกเลื่อนเลขแถวตามการลบ และยังตรงกับคอลัมน์ A ของชีต
+    reloaded = jf.StateStore.load(str(path))
+    assert reloaded.matches(jf.load_job_column(sheet))
+    assert {j: e[0] for j, e in reloaded.data["jobs"].items()} == {"no2": 2, "no5": 3, "no7": 4}
+    assert reloaded.closed_since() == {"no5": "2026-01-10"}
+
+
+def test_run_leaves_rows_that_are_not_due(synced):
+    sheet, path = synced
+    state = jf.StateStore.load(str(path))
+    archive = quiet(jf.SheetArchive.load, sheet)
+    assert quiet(archive.run, sheet, state, days=30, today=date(2026, 2, 1)) == 1  # No1 เท่านั้น
+    assert col_a(sheet) == ["No2", "No3", "No4", "No5", "No6", "No7"]
+    assert quiet(archive.run, sheet, state, days=30, today=date(2026, 2, 1)) == 0
+    assert sheet.spreadsheet.calls["batch_update"] == 1
+
+
+def test_archived_jobs_are_not_added_again(synced, monkeypatch):
+    sheet, path = synced
+    monkeypatch.setattr(jf, "ARCHIVE_AFTER_DAYS", 30)
+    state = jf.StateStore.load(str(path))
+    quiet(jf.SheetArchive.load(sheet).run, sheet, state, days=30, today=date(2026, 2, 15))
+
+    # tab16 ยังมีงานที่ย้ายไปแล้ว: ต้องไม่ถูกเพิ่มกลับเข้าชีตหลัก (ทั้งแบบมี state และอ่านชีตเต็ม)
+    tab16 = [[j, "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"] for j in ("No1", "No3", "No8")]
+    for state in (jf.StateStore.load(str(path)), None):
+        result = quiet(jf.update_google_sheets, sheet, [], set(), closed_already_jobs=tab16, state=state)
+        assert not result.get("error"), result
+    assert col_a(sheet) == ["No2", "No7", "No8"]
+    assert "no1" in quiet(jf.known_closed_job_nos, sheet)
+
+
+def test_closed_since_survives_invalidated_state(synced, monkeypatch):
+    sheet, path = synced
+    state = jf.StateStore.load(str(path))
+    quiet(state.invalidate)  # เช่น flush พัง / archive พัง / ชีตไม่ตรง
+    reloaded = jf.StateStore.load(str(path))
+    assert reloaded.data is None and reloaded.closed_since()["no1"] == "2025-12-20"
+
+    # รอบถัดไปอ่านชีตเต็ม: วันที่เดิมยังอยู่ งานใหม่ที่ปิดได้วันนี้
+    sheet.rows[2][7] = CLOSED
+    on_day(monkeypatch, date(2026, 2, 1))
+    state = save_state(path, sheet)
+    assert state.closed_since()["no1"] == "2025-12-20" and state.closed_since()["no2"] == "2026-02-01"
+
+    # append ที่ไม่รู้เลขแถวล้าง state แต่วันที่เริ่มปิดยังถูกบันทึก
+    writer = jf.SheetWriteBuffer(sheet)
+    writer.applied_appends.append(("no9", None, row("No9", CLOSED)))
+    state = save_state(path, sheet, writer)
+    reloaded = jf.StateStore.load(str(path))
+    assert reloaded.data is None
+    assert reloaded.closed_since()["no9"] == "2026-02-01" and reloaded.closed_since()["no1"] == "2025-12-20"
+
+
+def test_drop_rows_mismatch_invalidates_but_keeps_dates(synced):
+    sheet, path = synced
+    state = jf.StateStore.load(str(path))
+    del sheet.rows[1]
+    sheet.rows.insert(3, row("No0", "รอแจ้ง"))  # มีคนแทรกแถวระหว่าง archive
+    quiet(state.drop_rows, [2], jf.load_job_column(sheet))
+    reloaded = jf.StateStore.load(str(path))
+    assert reloaded.data is None
+    assert "no1" not in reloaded.closed_since() and reloaded.closed_since()["no3"] == "2026-01-10"
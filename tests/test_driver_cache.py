@@ -0,0 +1,38 @@
+"""DriverCache ต้อง hit ได้แม้ workflow ตั้ง CHROMEDRIVER/CHROME_BIN ไว้ทุกรอบ"""
+import contextlib
+import io
+
+import job_fetcher as jf
+
+
+def binaries(tmp_path):
+    chrome, driver = tmp_path / "chrome", tmp_path / "chromedriver"
+    chrome.write_text("chrome")
+    driver.write_text("driver")
+    return str(chrome), str(driver)
+
+
+def saved(tmp_path, chrome, driver):
+    cache = jf.DriverCache(str(tmp_path / "driver.json"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache.save(chrome, driver, "Google Chrome 129.0.1", "ChromeDriver 129.0.1")
+    return jf.DriverCache.load(cache.path)
+
+
+def test_hits_when_env_is_set_but_driver_resolved_elsewhere(tmp_path, monkeypatch):
+    chrome, driver = binaries(tmp_path)
+    # env ชี้ไปที่ setup-chrome แต่ driver ที่เปิดได้จริงมาจาก Selenium Manager คนละ path
+    monkeypatch.setenv("CHROME_BIN", "/opt/setup-chrome/chrome")
+    monkeypatch.setenv("CHROMEDRIVER", "/opt/setup-chrome/chromedriver")
+    assert saved(tmp_path, chrome, driver).usable() == (chrome, driver)
+
+
+def test_misses_when_env_points_somewhere_new(tmp_path, monkeypatch):
+    chrome, driver = binaries(tmp_path)
+    monkeypatch.setenv("CHROMEDRIVER", "/opt/chrome-129/chromedriver")
+    monkeypatch.delenv("CHROME_BIN", raising=False)
+    cache = saved(tmp_path, chrome, driver)
+    monkeypatch.setenv("CHROMEDRIVER", "/opt/chrome-130/chromedriver")
+    assert cache.usable() is None
+    monkeypatch.delenv("CHROMEDRIVER")
+    assert cache.usable() is None
@@ -0,0 +1,145 @@
+"""RunJournal: รอบที่ถูกตัดกลาง flush แล้วรอบถัดไป replay ต้องไม่สร้างแถวซ้ำ และหาแถวของ status จาก Job No"""
+import contextlib
+import io
+import time
+
+import pytest
+
+import job_fetcher as jf
+from benchmark import FakeWorksheet
+
+HEADER = ["Job No"] + ["c"] * 6 + ["Status"]
+
+
+class Killed(BaseException):
+    """process ถูก kill (เช่นชน timeout ของ workflow) — ไม่ใช่ Exception จึงไม่ถูก flush จับไว้"""
+
+
+class KilledWorksheet(FakeWorksheet):
+    """append_rows สำเร็จ appends_ok ครั้ง แล้ว process ตายในครั้งถัดไป (landed=True: แถวถึงชีตก่อนตาย)"""
+
+    def __init__(self, rows, appends_ok, landed):
+        super().__init__(rows)
+        self.appends_ok = appends_ok
+        self.landed = landed
+
+    def append_rows(self, rows, value_input_option=None, **kwargs):
+        if self.appends_ok == 0:
+            if self.landed:
+                super().append_rows(rows, value_input_option)
+            raise Killed()
+        self.appends_ok -= 1
+        return super().append_rows(rows, value_input_option)
+
+
+def row(job_no, status):
+    return [job_no] + [""] * 6 + [status]
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def interrupted_run(path, sheet):
+    """รอบแรก: เพิ่ม No2..No4 ทีละ chunk + ปิด No1/No5 แล้วตายระหว่าง append ที่สอง"""
+    journal = jf.RunJournal(str(path))
+    journal.begin()
+    writer = jf.SheetWriteBuffer(sheet, append_chunk=1, journal=journal)
+    for job_no in ("No2", "No3", "No4"):
+        writer.append(row(job_no, "รอแจ้ง"), job_no=jf.normalize_job_no(job_no))
+    writer.update_status(2, "ปิดงาน", job_no=jf.normalize_job_no("No1"))
+    writer.update_status(3, "ปิดงาน", job_no=jf.normalize_job_no("No5"))
+    with pytest.raises(Killed):
+        quiet(writer.flush)
+
+
+@pytest.mark.parametrize("landed", [False, True])
+def test_replay_after_partial_flush(tmp_path, landed):
+    path = tmp_path / "journal.jsonl"
+    sheet = KilledWorksheet([HEADER, row("No1", "รอแจ้ง"), row("No5", "แจ้งแล้ว ✅")], appends_ok=1, landed=landed)
+    interrupted_run(path, sheet)
+    # ระหว่างรอบมีคนแทรกแถวด้านบน -> เลขแถวเดิมใน journal ใช้ไม่ได้แล้ว
+    sheet.rows.insert(1, row("No0", "รอแจ้ง"))
+    sheet.appends_ok = -1
+
+    journal = jf.RunJournal.load(str(path))
+    assert journal.resumable and len(journal.pending_ops()) == 4
+    failed, _ = quiet(jf.resume_journal, journal, sheet)
+
+    assert failed is None
+    status = {r[0]: r[7] for r in sheet.rows[1:]}
+    assert [r[0] for r in sheet.rows[1:]] == ["No0", "No1", "No5", "No2", "No3", "No4"]  # ไม่มีแถวซ้ำ
+    assert status == {"No0": "รอแจ้ง", "No1": "ปิดงาน", "No5": "ปิดงาน",
+                      "No2": "รอแจ้ง", "No3": "รอแจ้ง", "No4": "รอแจ้ง"}
+    assert not jf.RunJournal.load(str(path)).pending_ops()  # เริ่ม journal ใหม่ของรอบนี้แล้ว
+
+
+def test_failed_replay_keeps_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    sheet = KilledWorksheet([HEADER, row("No1", "รอแจ้ง"), row("No5", "แจ้งแล้ว ✅")], appends_ok=0, landed=False)
+    interrupted_run(path, sheet)
+    # รอบถัดไปชีตยังเขียนไม่ได้: ต้องหยุดก่อน sync และเก็บ operation ที่ค้างไว้ให้รอบหน้า
+    sheet.append_rows = lambda *a, **k: (_ for _ in ()).throw(RuntimeError("503"))
+    journal = jf.RunJournal.load(str(path))
+    result, _ = quiet(jf.resume_journal, journal, sheet)
+    assert result["write_failed"]
+    pending = {op["id"] for op in jf.RunJournal.load(str(path)).pending_ops()}
+    assert {"append:no2", "append:no3", "append:no4"} <= pending
+    assert [r[0] for r in sheet.rows[1:]] == ["No1", "No5"]
+
+
+def test_resume_reuses_fetched_tabs(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    tab13 = [["1", "No1", "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568"]]
+    journal = jf.RunJournal(path)
+    journal.begin()
+    journal.record_tab(13, tab13)
+
+    cache = jf.TabCache(None)  # ไม่มี client: ถ้าต้องดึงใหม่จะ error
+    failed, _ = quiet(jf.resume_journal, jf.RunJournal.load(path), None, cache)
+    assert failed is None and cache.rows(13) == tab13
+    assert jf.RunJournal.load(path).tabs == {13: tab13}  # snapshot ยังอยู่ให้รอบที่อาจค้างซ้ำ
+
+
+def test_stale_journal_is_not_resumed(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = jf.RunJournal(path)
+    journal.begin()
+    journal.record_tab(13, [["1", "No1"]])
+    journal.record_plan([{"id": "append:no1", "op": "append", "job_no": "no1", "row": row("No1", "รอแจ้ง")}])
+
+    stale = jf.RunJournal.load(path, max_age_min=0)
+    stale.started_at = time.time() - 60
+    sheet = FakeWorksheet([HEADER])
+    failed, _ = quiet(jf.resume_journal, stale, sheet, jf.TabCache(None))
+    assert failed is None and sheet.rows == [HEADER]
+    assert jf.RunJournal.load(path).tabs == {}
+
+
+class FakeClient(jf.HttpTabClient):
+    def __init__(self, pages):
+        super().__init__([])
+        self.pages = pages
+
+    def load_table_rows(self, url, wait_sec=30):
+        tab = int(url.split("tab=")[1].split("&")[0])
+        return [list(c) for c in self.pages.get(tab, [])]
+
+    def iter_table_rows(self, url, wait_sec=30):
+        yield from self.load_table_rows(url)
+
+
+@pytest.mark.parametrize("extra, journaled16", [((), True), (("--stream-tab16",), False)])
+def test_streamed_tab16_is_not_journaled(tmp_path, monkeypatch, extra, journaled16):
+    path = str(tmp_path / "journal.jsonl")
+    tab15 = [["1", "No1", "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]]
+    tab16 = [["1", "เรื่อง", "No2", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]]
+    args = jf.parse_args(["--backend", "http", "--state-file", "", "--session-file", "",
+                          "--journal-file", path, *extra])
+    journal = jf.RunJournal.load(path)
+    monkeypatch.setattr(journal, "commit", lambda: None)  # เก็บไฟล์ไว้ตรวจ
+    result, _ = quiet(jf.run_once, args, FakeClient({15: tab15, 16: tab16}), FakeWorksheet([HEADER]), journal)
+    assert not result.get("error"), result
+    tabs = jf.RunJournal.load(path).tabs
+    assert 15 in tabs and (16 in tabs) == journaled16
@@ -0,0 +1,120 @@
+"""PushNotifier กับ worker จำลอง (http.server บน localhost)"""
+import contextlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import job_fetcher as jf
+
+
+class StubWorker:
+    """เก็บทุก request ที่เข้ามา (retry key, body) ตอบ fail ก่อน `fail` ครั้งด้วย `code` หรือช้า `delay` วินาที"""
+
+    def __init__(self):
+        self.requests = []
+        self.fail, self.code, self.delay = 0, 503, 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append((self.headers.get("X-Line-Retry-Key"), body))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.fail > 0:
+                    stub.fail -= 1
+                    self.send_response(stub.code)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/push"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def keys(self):
+        return [key for key, _ in self.requests]
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setattr(jf.METRICS, "sleep", lambda seconds, reason="": None)  # ไม่ต้องรอ backoff จริง
+    stub = StubWorker()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def notify(worker, path, changes, **kwargs):
+    kwargs.setdefault("timeout", 2)
+    notifier = jf.PushNotifier.load(str(path), url=worker.url, to="Cgroup", **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return notifier.notify(changes), notifier
+
+
+def changes(*job_nos, status="รอแจ้ง"):
+    return [(job_no, None, status, None) for job_no in job_nos]
+
+
+def test_batches_and_dedups_against_notified_file(worker, tmp_path):
+    path = tmp_path / "notified.json"
+    sent, _ = notify(worker, path, changes("no1", "no2", "no3", "no4", "no5"), batch_size=2)
+    assert sent == 5
+    assert [len(body["messages"]) for _, body in worker.requests] == [1, 1, 1]
+    assert all(body["to"] == "Cgroup" for _, body in worker.requests)
+    assert "No1" in worker.requests[0][1]["messages"][0]["text"]
+    assert len(set(worker.keys)) == 3
+
+    # รอบถัดไป (instance ใหม่จากไฟล์เดิม): งานที่แจ้งแล้วไม่ส่งซ้ำ ส่งเฉพาะที่ใหม่
+    sent, _ = notify(worker, path, changes("no1", "no2", "no6") + changes("no1", status="ปิดงาน_รอแจ้ง"), batch_size=2)
+    assert sent == 2
+    assert len(worker.requests) == 4
+    assert set(json.loads(path.read_text(encoding="utf-8"))["sent"]) >= {"no1|รอแจ้ง", "no6|รอแจ้ง", "no1|ปิดงาน_รอแจ้ง"}
+
+    # สถานะที่ไม่อยู่ใน NOTIFY_STATUSES ไม่แจ้ง
+    sent, _ = notify(worker, path, changes("no7", status="งานที่ปิดแล้ว"))
+    assert sent == 0 and len(worker.requests) == 4
+
+
+def test_retry_key_is_stable_across_retries_and_runs(worker, tmp_path):
+    path = tmp_path / "notified.json"
+    worker.fail = 100
+    sent, notifier = notify(worker, path, changes("no1"), retries=2)
+    assert sent == 0 and len(notifier.outbox) == 1
+    assert len(worker.requests) == 3 and len(set(worker.keys)) == 1
+
+    # รอบหน้า worker กลับมา: ส่งจาก outbox ด้วย key เดิม และไม่เข้าคิวซ้ำ
+    worker.fail = 0
+    sent, notifier = notify(worker, path, changes("no1"))
+    assert sent == 1 and not notifier.outbox
+    assert len(worker.requests) == 4 and len(set(worker.keys)) == 1
+
+
+def test_timeout_resends_with_same_key(worker, tmp_path):
+    path = tmp_path / "notified.json"
+    worker.delay = 0.5  # worker ทำงานแล้วแต่ตอบช้ากว่า timeout
+    started = time.perf_counter()
+    sent, notifier = notify(worker, path, changes("no1"), timeout=0.1, retries=1)
+    assert time.perf_counter() - started < 2
+    assert sent == 0 and len(notifier.outbox) == 1
+
+    worker.delay = 0
+    sent, _ = notify(worker, path, [])
+    assert sent == 1
+    assert len(worker.requests) == 3 and len(set(worker.keys)) == 1
+
+
+def test_rejected_batch_is_not_retried(worker, tmp_path):
+    worker.fail, worker.code = 1, 400
+    sent, notifier = notify(worker, tmp_path / "notified.json", changes("no1"), retries=2)
+    assert sent == 0 and len(worker.requests) == 1 and len(notifier.outbox) == 1
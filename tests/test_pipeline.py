@@ -0,0 +1,78 @@
+"""--pipeline ต้องให้ผลเท่ากับ run_once (เนื้อหาชีตและตัวเลขสรุป) ทุกสถานการณ์"""
+import contextlib
+import io
+import random
+import time
+
+import pytest
+
+import job_fetcher as jf
+from benchmark import FakeWorksheet
+
+STATUSES = ["รอแจ้ง", "ปิดงาน", "ปิดงาน_รอแจ้ง", "งานที่ปิดแล้ว", "แจ้งแล้ว ✅", ""]
+HEADER = ["Job No"] + ["c"] * 6 + ["Status"]
+
+
+def cells(job_no, i, tab):
+    if tab == 16:  # tab16 จริงมี Job No อยู่คอลัมน์ที่ 3
+        return [str(i), "x", job_no, f"s{tab}", "c", "d", "e", "f"]
+    return [str(i), job_no, f"a{tab}", f"b{tab}", "c", "d", "e", "f"]
+
+
+def scenario(seed):
+    """งานปกติ/ภายในศูนย์สุ่มกระจายในทุก tab + ชีตที่มีบางงานอยู่แล้วด้วยสถานะสุ่ม + เวลาโหลดแต่ละ tab สุ่ม"""
+    rnd = random.Random(seed)
+    regular = [f"No{i}" for i in range(12)]
+    internal = [f"{jf.INTERNAL_JOB_PREFIX}{i}" for i in range(6)]
+    pages = {}
+    for tab in (13, 14, 15, 16):
+        pages[tab] = [cells(j, i, tab) for i, j in enumerate(rnd.sample(regular + internal, rnd.randint(0, 8)))]
+    for tab in (18, 7, 11, 20):
+        pages[tab] = [cells(j, i, tab) for i, j in enumerate(rnd.sample(internal + regular[:3], rnd.randint(0, 5)))]
+    sheet = [HEADER] + [[j] + [""] * 6 + [rnd.choice(STATUSES)]
+                        for j in rnd.sample(regular + internal, rnd.randint(0, 8))]
+    delays = {tab: rnd.random() * 0.01 for tab in pages}
+    return pages, sheet, delays
+
+
+class FakeClient(jf.HttpTabClient):
+    def __init__(self, pages, delays):
+        super().__init__([])
+        self.pages = pages
+        self.delays = delays
+
+    def load_table_rows(self, url, wait_sec=30):
+        tab = int(url.split("tab=")[1].split("&")[0])
+        time.sleep(self.delays[tab])
+        return [list(c) for c in self.pages[tab]]
+
+    def iter_table_rows(self, url, wait_sec=30):
+        yield from self.load_table_rows(url)
+
+
+def sync_twice(run, seed, state_file, extra):
+    """สองรอบติดกัน (รอบสองมีงานปิดเพิ่ม) คืน (แถวในชีต, ผลของแต่ละรอบ)"""
+    pages, rows, delays = scenario(seed)
+    sheet = FakeWorksheet(rows)
+    args = jf.parse_args(["--backend", "http", "--state-file", str(state_file), "--session-file", "",
+                          "--journal-file", "", *extra])
+    results = []
+    for i in range(2):
+        if i:
+            pages[15].append(cells("No11", 9, 15))
+            pages[20].append(cells(f"{jf.INTERNAL_JOB_PREFIX}5", 9, 20))
+        with contextlib.redirect_stdout(io.StringIO()):
+            result, _ = run(args, FakeClient(pages, delays), sheet, None)
+        assert not result.get("error"), result
+        results.append(result)
+    return sheet.rows, results
+
+
+@pytest.mark.parametrize("extra", [(), ("--stream-tab16",)], ids=["cached", "stream"])
+@pytest.mark.parametrize("seed", range(50))
+def test_pipeline_matches_run_once(tmp_path, seed, extra):
+    rows, results = sync_twice(jf.run_once, seed, tmp_path / "batch.json", extra)
+    piped_rows, piped_results = sync_twice(jf.run_pipelined, seed, tmp_path / "piped.json", extra)
+    # append อาจลงชีตคนละลำดับ เนื้อหาต้องเหมือนกัน
+    assert sorted(piped_rows[1:]) == sorted(rows[1:])
+    assert piped_results == results
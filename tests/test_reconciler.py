@@ -0,0 +1,103 @@
+"""การตัดสินสถานะเมื่องานเดียวกันอยู่หลาย tab (ต้องได้ผลเท่ากับลูปทีละ tab แบบเดิม)"""
+import contextlib
+import io
+
+import pytest
+
+import job_fetcher as jf
+from benchmark import FakeWorksheet
+
+
+class RecordingWriter:
+    """แทน SheetWriteBuffer: เก็บ append/update ไว้ตรวจ"""
+
+    def __init__(self):
+        self.appended = []
+        self.statuses = {}
+
+    def append(self, row, job_no=None):
+        self.appended.append(row)
+
+    def update_status(self, row_no, status, **kwargs):
+        self.statuses[row_no] = status
+
+
+def job(job_no):
+    return [job_no, "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]
+
+
+def reconcile(current, job_no="No1", closed_job_nos=(), **inputs):
+    """สถานะของแถว (แถว 2 ในชีต) หลัง reconcile ทุก tab ใน inputs {ชื่อแหล่ง: jobs}"""
+    index = jf.SheetIndex()
+    index.rows[jf.normalize_job_no(job_no)] = jf.SheetRow(2, current)
+    reconciler = jf.Reconciler(index, set(closed_job_nos))
+    for source in jf.JOB_SOURCES:
+        reconciler.add(source, inputs.get(source.name.replace("/", "_")))
+    writer = RecordingWriter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        reconciler.plan(writer)
+    assert not writer.appended
+    return writer.statuses.get(2, current)
+
+
+@pytest.mark.parametrize("current, expected", [
+    ("แจ้งแล้ว ✅", "ปิดงาน_รอแจ้ง"),
+    ("รอแจ้ง", "ปิดงาน"),
+    ("", "ปิดงาน"),
+    ("ปิดงาน", "งานที่ปิดแล้ว"),
+    ("ปิดงาน_รอแจ้ง", "ปิดงาน_รอแจ้ง"),
+    ("งานที่ปิดแล้ว", "งานที่ปิดแล้ว"),
+])
+def test_job_in_tab15_and_tab16(current, expected):
+    assert reconcile(current, tab15=[job("No1")], tab16=[job("No1")]) == expected
+
+
+@pytest.mark.parametrize("current, expected", [
+    ("รอแจ้ง", "ปิดงาน"),
+    ("แจ้งแล้ว ✅", "ปิดงาน"),
+    ("ปิดงาน", "งานที่ปิดแล้ว"),
+])
+def test_internal_job_in_tab11_and_tab16(current, expected):
+    jobs = [job("บบลนป1")]
+    assert reconcile(current, job_no="บบลนป1", tab11=jobs, tab16=jobs) == expected
+
+
+@pytest.mark.parametrize("current, expected", [("รอแจ้ง", "ปิดงาน"), ("ปิดงาน", "ปิดงาน")])
+def test_internal_job_in_tab11_and_tab20(current, expected):
+    jobs = [job("บบลนป1")]
+    assert reconcile(current, job_no="บบลนป1", tab11=jobs, tab20=jobs) == expected
+
+
+def test_tab20_only_adds_rows():
+    assert reconcile("ปิดงาน", job_no="บบลนป1", tab20=[job("บบลนป1")]) == "ปิดงาน"
+
+
+def test_tab13_closed_job_and_tab15():
+    assert reconcile("แจ้งแล้ว ✅", closed_job_nos={"no1"}, tab13=[job("No1")], tab15=[job("No1")]) == "ปิดงาน_รอแจ้ง"
+
+
+class FakeClient(jf.HttpTabClient):
+    """HttpTabClient ที่คืนแถวของแต่ละ tab จาก dict แทนการเรียกเว็บ"""
+
+    def __init__(self, pages):
+        super().__init__([])
+        self.pages = pages
+
+    def load_table_rows(self, url, wait_sec=30):
+        tab = int(url.split("tab=")[1].split("&")[0])
+        return [list(c) for c in self.pages.get(tab, [])]
+
+
+@pytest.mark.parametrize("run", [jf.run_once, jf.run_pipelined])
+@pytest.mark.parametrize("current, expected", [("แจ้งแล้ว ✅", "ปิดงาน_รอแจ้ง"), ("รอแจ้ง", "ปิดงาน"),
+                                               ("ปิดงาน", "งานที่ปิดแล้ว")])
+def test_tab15_and_tab16_in_run_modes(run, current, expected):
+    # tab16 จริงมี Job No อยู่คอลัมน์ที่ 3 (parse_row_by_tab สลับกลับเอง)
+    tab15 = [["1", "No1", "เรื่อง", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]]
+    tab16 = [["1", "เรื่อง", "No1", "ศูนย์ A", "ศูนย์ B", "ผู้แจ้ง", "01/01/2568", "x"]]
+    sheet = FakeWorksheet([["Job No"] + ["c"] * 6 + ["Status"], ["No1"] + [""] * 6 + [current]])
+    args = jf.parse_args(["--backend", "http", "--state-file", "", "--session-file", "", "--journal-file", ""])
+    with contextlib.redirect_stdout(io.StringIO()):
+        result, _ = run(args, FakeClient({15: tab15, 16: tab16}), sheet, None)
+    assert not result.get("error"), result
+    assert sheet.rows[1][7] == expected
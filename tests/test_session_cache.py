@@ -0,0 +1,42 @@
+"""SessionCache ต้องไม่เขียน cookie แบบ plain text เมื่อไฟล์ถูกอัปโหลดขึ้น actions cache"""
+import contextlib
+import io
+import json
+
+import pytest
+
+import job_fetcher as jf
+
+COOKIES = [{"name": "JSESSIONID", "value": "secret"}]
+
+
+def save(cache):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        cache.save(COOKIES, "ua")
+    return out.getvalue()
+
+
+def test_refuses_plain_text_when_key_required(tmp_path):
+    path = tmp_path / "session.json"
+    path.write_text(json.dumps({"saved_at": 0, "cookies": COOKIES}))  # ไฟล์ plain text เก่าจาก cache
+    cache = jf.SessionCache(str(path), "", require_key=True)
+    assert "SESSION_KEY is not set" in save(cache)
+    assert not path.exists()
+    assert cache.load() is None
+
+
+def test_plain_text_allowed_locally(tmp_path):
+    path = tmp_path / "session.json"
+    cache = jf.SessionCache(str(path), "", require_key=False)
+    assert "plain text" in save(cache)
+    assert cache.load() == (COOKIES, "ua")
+
+
+def test_encrypted_when_key_set(tmp_path):
+    pytest.importorskip("cryptography")
+    path = tmp_path / "session.json"
+    cache = jf.SessionCache(str(path), "passphrase", require_key=True)
+    assert "(encrypted)" in save(cache)
+    assert b"secret" not in path.read_bytes()
+    assert cache.load() == (COOKIES, "ua")
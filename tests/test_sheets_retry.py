@@ -0,0 +1,141 @@
+"""QuotaAwareSheet / SheetWriteBuffer: ลองใหม่เมื่อ 429/5xx โดยไม่สร้างแถวซ้ำ"""
+import contextlib
+import io
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import job_fetcher as jf
+from benchmark import FakeWorksheet
+
+HEADER = ["Job No"] + ["c"] * 6 + ["Status"]
+
+
+class ApiError(Exception):
+    """รูปแบบเดียวกับ gspread.exceptions.APIError (มี response.status_code / headers)"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """
+    FakeWorksheet ที่ method ใน script พังตามลำดับที่กำหนด: script[name] = [(error, landed), ...]
+    landed=True = server เขียนไปแล้วแต่ client ได้ error (เช่น timeout หลังเขียน)
+    """
+
+    def __init__(self, rows, script):
+        super().__init__(rows)
+        self.script = {name: list(steps) for name, steps in script.items()}
+        self.attempts = {}
+
+    def _attempt(self, name, func, *args, **kwargs):
+        self.attempts[name] = self.attempts.get(name, 0) + 1
+        steps = self.script.get(name)
+        if not steps:
+            return func(*args, **kwargs)
+        error, landed = steps.pop(0)
+        if landed:
+            func(*args, **kwargs)
+        raise error
+
+    def append_rows(self, rows, value_input_option=None, **kwargs):
+        return self._attempt("append_rows", super().append_rows, rows, value_input_option)
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        return self._attempt("batch_update", super().batch_update, data, value_input_option)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """แทน METRICS.sleep: เก็บเวลาที่สั่งรอไว้ตรวจ ไม่รอจริง"""
+    waited = []
+    monkeypatch.setattr(jf.METRICS, "sleep", lambda seconds, reason="": waited.append((reason, seconds)))
+    return waited
+
+
+def quota_sheet(script, rows=None, max_retries=3):
+    worksheet = FlakyWorksheet(rows or [HEADER], script)
+    return worksheet, jf.QuotaAwareSheet(worksheet, reads_per_min=100000, writes_per_min=100000,
+                                         max_retries=max_retries)
+
+
+def call(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def backoffs(sleeps):
+    return [seconds for reason, seconds in sleeps if reason == "sheets_backoff"]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_idempotent_call_is_retried_with_backoff(sleeps, status):
+    worksheet, sheet = quota_sheet({"batch_update": [(ApiError(status), False)] * 2})
+    call(sheet.batch_update, [{"range": "H2", "values": [["ปิดงาน"]]}])
+    assert worksheet.attempts["batch_update"] == 3
+    assert worksheet.rows[1][7] == "ปิดงาน"
+    delays = backoffs(sleeps)
+    assert len(delays) == 2 and 0 <= delays[0] <= 1 and 0 <= delays[1] <= 2  # full jitter: [0, 2^attempt]
+
+
+def test_gives_up_after_max_retries(sleeps):
+    worksheet, sheet = quota_sheet({"batch_update": [(ApiError(503), False)] * 5}, max_retries=2)
+    with pytest.raises(ApiError):
+        call(sheet.batch_update, [{"range": "H2", "values": [["ปิดงาน"]]}])
+    assert worksheet.attempts["batch_update"] == 3
+
+
+def test_client_errors_are_not_retried(sleeps):
+    worksheet, sheet = quota_sheet({"batch_update": [(ApiError(400), False)]})
+    with pytest.raises(ApiError):
+        call(sheet.batch_update, [{"range": "H2", "values": [["ปิดงาน"]]}])
+    assert worksheet.attempts["batch_update"] == 1 and not backoffs(sleeps)
+
+
+def test_retry_after_header_is_honoured(sleeps):
+    worksheet, sheet = quota_sheet({"batch_update": [(ApiError(429, {"Retry-After": "7"}), False)]})
+    call(sheet.batch_update, [{"range": "H2", "values": [["ปิดงาน"]]}])
+    assert backoffs(sleeps) == [7.0]
+
+
+def test_append_is_retried_only_on_429(sleeps):
+    # 429 = server ปฏิเสธแน่นอน ส่งซ้ำได้
+    worksheet, sheet = quota_sheet({"append_rows": [(ApiError(429), False)]})
+    call(sheet.append_rows, [["No1"] + [""] * 7])
+    assert worksheet.attempts["append_rows"] == 2 and len(worksheet.rows) == 2
+
+    # 5xx / เครือข่ายหลุด = อาจเขียนไปแล้ว: ไม่ลองซ้ำเอง ให้ SheetWriteBuffer ตรวจชีตก่อน
+    for error in (ApiError(503), requests.ConnectionError("reset")):
+        worksheet, sheet = quota_sheet({"append_rows": [(error, True)]})
+        with pytest.raises(type(error)):
+            call(sheet.append_rows, [["No1"] + [""] * 7])
+        assert worksheet.attempts["append_rows"] == 1 and len(worksheet.rows) == 2
+
+
+def flush(sheet, rows):
+    writer = jf.SheetWriteBuffer(sheet, append_chunk=2)
+    for row in rows:
+        writer.append(row, job_no=jf.normalize_job_no(row[0]))
+    return writer, call(writer.flush)
+
+
+def test_flush_checks_column_a_before_resending_appends(sleeps):
+    rows = [[f"No{i}"] + [""] * 6 + ["รอแจ้ง"] for i in range(1, 5)]
+    # chunk แรกถึงชีตแล้วแต่ได้ 503, chunk ที่สองไม่ถึงชีต
+    worksheet, sheet = quota_sheet({"append_rows": [(ApiError(503), True), (ApiError(503), False)]})
+    writer, (appended, updated) = flush(sheet, rows)
+    assert (appended, updated) == (4, 0) and not writer.failed
+    assert [r[0] for r in worksheet.rows[1:]] == ["No1", "No2", "No3", "No4"]  # ไม่มีแถวซ้ำ
+    assert worksheet.calls["batch_get"] == 1  # อ่านคอลัมน์ A ครั้งเดียวก่อนส่งซ้ำ
+    assert worksheet.attempts["append_rows"] == 3
+    assert {job_no for job_no, _, _ in writer.applied_appends} == {"no1", "no2", "no3", "no4"}
+
+
+def test_flush_reports_rows_it_could_not_write(sleeps, monkeypatch):
+    monkeypatch.setattr(jf, "SHEETS_FLUSH_PASSES", 2)
+    worksheet, sheet = quota_sheet({"append_rows": [(ApiError(503), False)] * 2})
+    writer, (appended, _) = flush(sheet, [["No1"] + [""] * 6 + ["รอแจ้ง"]])
+    assert appended == 0 and writer.failed and len(worksheet.rows) == 1
@@ -0,0 +1,63 @@
+"""iter_rows_from_chunks ต้องใช้ memory คงที่ ไม่โตตามจำนวนแถวของหน้า tab16"""
+import os
+
+import pytest
+
+import job_fetcher as jf
+
+ROW = ("<tr><td>{i}</td><td>แจ้งซ่อม &amp; ตรวจสอบ {i}</td><td>No{i}</td><td>ศูนย์ A</td>"
+       "<td>ศูนย์ B</td><td>ผู้แจ้ง</td><td>01/01/2568</td><td>x</td></tr>")
+
+
+def page_chunks(rows, rows_per_chunk=500):
+    """หน้า index?tab=16 ทีละ chunk (~64KB) สร้างระหว่างอ่าน เพื่อให้ memory ที่วัดเป็นของตัว parse เท่านั้น"""
+    yield "<html><body><table><thead><tr><th>ลำดับ</th><th>Job No</th></tr></thead><tbody>"
+    for start in range(1, rows + 1, rows_per_chunk):
+        yield "".join(ROW.format(i=i) for i in range(start, min(start + rows_per_chunk, rows + 1)))
+    yield "</tbody></table></body></html>"
+
+
+def rss_mb():
+    # tracemalloc ทำให้ 100k แถวช้าเกินไป: ใช้ RSS ปัจจุบันของ process แทน (Linux)
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def rss_growth_mb(rows_iter, warmup=10000, every=5000):
+    """RSS สูงสุดระหว่างอ่านแถวทั้งหมด ลบด้วย RSS หลังอ่าน warmup แถวแรก"""
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("needs /proc/self/statm")
+    base = peak = None
+    count = 0
+    for count, _ in enumerate(rows_iter, 1):
+        if count == warmup:
+            base = peak = rss_mb()
+        elif base is not None and count % every == 0:
+            peak = max(peak, rss_mb())
+    return count, peak - base
+
+
+def test_stream_parser_memory_is_flat_for_100k_row_page():
+    count, growth = rss_growth_mb(jf.iter_rows_from_chunks(page_chunks(100000)))
+    assert count == 100000
+    # หน้า 100k แถวมีขนาด ~20MB แถวที่ parse แล้วรวมกันเกิน 100MB: ถ้าเก็บไว้ RSS จะโตเป็นสิบ MB
+    assert growth < 4, f"RSS grew {growth:.1f}MB between row 10k and row 100k"
+
+
+def test_reconciler_memory_is_flat_for_streamed_tab16():
+    # ชีตมีทุกงานอยู่แล้ว: ส่วนใหญ่ 'งานที่ปิดแล้ว' (tab16 ไม่เปลี่ยน) ทุก 1000 งานเป็น 'ปิดงาน' (ต้องเขียน)
+    index = jf.SheetIndex()
+    for i in range(1, 100001):
+        index.rows[f"no{i}"] = jf.SheetRow(i + 1, "ปิดงาน" if i % 1000 == 0 else "งานที่ปิดแล้ว")
+    reconciler = jf.Reconciler(index)
+    jobs = (jf.parse_row_by_tab(c, 16) for c in jf.iter_rows_from_chunks(page_chunks(100000)))
+
+    def added(jobs):
+        for job in jobs:
+            reconciler.add("tab16", [job])
+            yield job
+
+    count, growth = rss_growth_mb(added(jobs))
+    assert count == 100000
+    assert len(reconciler.records) == 100
+    assert growth < 4, f"RSS grew {growth:.1f}MB between row 10k and row 100k"
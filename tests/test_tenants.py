@@ -0,0 +1,71 @@
+"""ค่าต่อ tenant (apply_tenant) ต้องถูกใช้ทุกที่ที่เคย hard-code ค่าของศูนย์เดิม"""
+import contextlib
+import io
+import json
+
+import fake_tenant
+import job_fetcher as jf
+
+
+def tenant_globals(monkeypatch):
+    # apply_tenant แก้ค่าระดับ module/env ของ process -> คืนค่าเดิมหลังเทสต์
+    for name in ("GOOGLE_SHEET_URL", "GOOGLE_SHEET_NAME", "INTERNAL_CENTER", "INTERNAL_JOB_PREFIX",
+                 "FETCH_TABS", "LINE_TO"):
+        monkeypatch.setattr(jf, name, getattr(jf, name))
+    for src in jf.JOB_SOURCES:
+        monkeypatch.setattr(src, "prefix", src.prefix)
+    for key in ("USERNAME", "PASSWORD", "GOOGLE_SHEET_KEY", "GOOGLE_SHEET_URL", "GOOGLE_SHEET_NAME"):
+        monkeypatch.setenv(key, "")
+
+
+def test_tenant_prefix_is_used_for_tab16_swap_and_sources(monkeypatch):
+    tenant_globals(monkeypatch)
+    jf.apply_tenant({"name": "north", "sheet_key": "k", "internal_prefix": "NTH"})
+
+    # tab16: คอลัมน์ Job No / เรื่องที่แจ้ง สลับกัน -> สลับกลับด้วย prefix ของ tenant
+    row = jf.parse_row_by_tab(["1", "เรื่อง", "NTH123/1", "a", "b", "c", "d", "e"], 16)
+    assert row[:2] == ["NTH123", "เรื่อง"]
+    assert jf.looks_like_jobno("NTH9") and not jf.looks_like_jobno("บบลนป9")
+
+    internal = jf.JOB_SOURCES_BY_NAME["tab18/7"]
+    assert internal.may_contain(jf.normalize_job_no("NTH123"))
+    assert not internal.may_contain(jf.normalize_job_no("บบลนป1"))
+    assert jf.JOB_SOURCES_BY_NAME["tab13"].may_contain("no1")
+
+
+def test_source_prefix_is_normalized():
+    src = jf.JobSource("x", "รอแจ้ง", prefix="AbC")
+    assert src.may_contain(jf.normalize_job_no("ABC-1"))
+    assert not src.may_contain("no1")
+
+
+def test_two_tenants_with_different_prefixes(tmp_path, monkeypatch):
+    monkeypatch.setattr(jf, "run_tenant", fake_tenant.run_tenant)  # process ลูก (spawn) import ตัวนี้แทน
+    monkeypatch.setenv("FAKE_TENANT_DIR", str(tmp_path))
+    monkeypatch.setenv("U_A", "user_a")
+    monkeypatch.setenv("U_B", "user_b")
+    monkeypatch.setenv("P", "pw")
+    config = tmp_path / "tenants.json"
+    config.write_text(json.dumps({"tenants": [
+        {"name": "a", "username_env": "U_A", "password_env": "P", "sheet_key": "ka",
+         "internal_prefix": "AAA", "internal_center": "ศูนย์ A ภายใน"},
+        {"name": "b", "username_env": "U_B", "password_env": "P", "sheet_key": "kb",
+         "internal_prefix": "BBB", "internal_center": "ศูนย์ B ภายใน"},
+    ]}), encoding="utf-8")
+    state = tmp_path / "state.json"
+    argv = ["--backend", "http", "--state-file", str(state), "--session-file", "", "--journal-file", "",
+            "--metrics-file", ""]
+    with contextlib.redirect_stdout(io.StringIO()):
+        summaries = jf.run_tenants(str(config), argv, workers=2, timeout=60)
+    assert [(s["tenant"], s["status"]) for s in summaries] == [("a", "ok"), ("b", "ok")], summaries
+
+    for name, own, other, center in (("a", "aaa", "bbb", "ศูนย์ A ภายใน"), ("b", "bbb", "aaa", "ศูนย์ B ภายใน")):
+        out = json.loads((tmp_path / f"{name}.json").read_text(encoding="utf-8"))
+        assert out["shared_buckets"]
+        rows = {jf.normalize_job_no(r[0]): r for r in out["rows"][1:]}
+        # งานภายในเฉพาะ prefix ของ tenant นี้ ได้ศูนย์ของ tenant นี้
+        assert f"{own}1" in rows and f"{other}1" not in rows
+        assert rows[f"{own}1"][2:4] == [center, center] and rows[f"{own}1"][7] == "รอแจ้ง"
+        # tab16 สลับคอลัมน์กลับได้ด้วย prefix ของ tenant
+        assert rows[f"{own}9"][7] == "งานที่ปิดแล้ว"
+        assert (tmp_path / f"state.{name}.json").exists()